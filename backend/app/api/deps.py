@@ -1,10 +1,10 @@
-from bson import ObjectId
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
+from jose import JWTError
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pydantic import ValidationError
 
+from app.core import auth_cache
 from app.core.config import settings
 from app.db.mongodb import get_db
 from app.models.user import UserResponse
@@ -21,17 +21,16 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
+        # Signature check and user lookup are cached (see app/core/auth_cache.py)
+        payload = auth_cache.decode_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise credentials_exception
+        user = await auth_cache.get_principal(payload, db)
     except (JWTError, ValidationError):
         raise credentials_exception
 
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
-    if user is None:
+    if user is None or not user.is_active:
         raise credentials_exception
 
-    return UserResponse(**user)
+    return user
@@ -1,19 +1,29 @@
 from datetime import timedelta
 from typing import Any
 
+from bson import ObjectId
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.security import OAuth2PasswordRequestForm
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 
 from app.api import deps
-from app.core import security
+from app.core import auth_cache, security
 from app.core.config import settings
 from app.db.mongodb import get_db
-from app.models.user import Token, UserCreate, UserInDB, UserResponse, RefreshToken
+from app.models.user import RefreshToken, Token, UserCreate, UserInDB, UserResponse
 
 router = APIRouter()
 
 
+def _busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many sign-ins in progress, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
 @router.post("/signup", response_model=UserResponse)
 async def create_user(
     user_in: UserCreate, db: AsyncIOMotorDatabase = Depends(get_db)
@@ -30,13 +40,22 @@ async def create_user(
 
     user_data = user_in.model_dump()
     password = user_data.pop("password")
-    hashed_password = security.get_password_hash(password)
+    try:
+        hashed_password = await security.password_hasher.hash(password)
+    except security.PasswordHasherBusy:
+        raise _busy_exception()
 
     db_user = UserInDB(**user_data, hashed_password=hashed_password)
 
-    result = await db.users.insert_one(
-        db_user.model_dump(by_alias=True, exclude={"id"})
-    )
+    try:
+        result = await db.users.insert_one(
+            db_user.model_dump(by_alias=True, exclude={"id"})
+        )
+    except DuplicateKeyError:  # Concurrent signup with the same email
+        raise HTTPException(
+            status_code=400,
+            detail="The user with this username already exists in the system.",
+        )
 
     # Fetch the created user
     created_user = await db.users.find_one({"_id": result.inserted_id})
@@ -55,12 +74,25 @@ async def login_access_token(
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
 
-    if not security.verify_password(form_data.password, user["hashed_password"]):
+    try:
+        valid, new_hash = await security.password_hasher.verify_and_update(
+            form_data.password, user["hashed_password"]
+        )
+    except security.PasswordHasherBusy:
+        raise _busy_exception()
+    if not valid:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this hash was made
+        await db.users.update_one(
+            {"_id": user["_id"]}, {"$set": {"hashed_password": new_hash}}
+        )
 
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = security.create_access_token(
-        subject=str(user["_id"]), expires_delta=access_token_expires
+        subject=str(user["_id"]),
+        expires_delta=access_token_expires,
+        claims=auth_cache.user_claims(user) if settings.AUTH_EMBED_CLAIMS else None,
     )
     refresh_token = security.create_refresh_token(subject=str(user["_id"]))
     
@@ -74,11 +106,12 @@ async def login_access_token(
 @router.post("/refresh", response_model=Token)
 async def refresh_token(
     body: RefreshToken,
+    db: AsyncIOMotorDatabase = Depends(get_db),
 ) -> Any:
     """
     Renew access token using a refresh token
     """
-    from jose import jwt, JWTError
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(
             body.refresh_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
@@ -90,9 +123,16 @@ async def refresh_token(
         if not user_id:
             raise HTTPException(status_code=400, detail="Invalid token payload")
             
+        claims = None
+        if settings.AUTH_EMBED_CLAIMS:
+            user = await db.users.find_one({"_id": ObjectId(user_id)})
+            if not user:
+                raise HTTPException(status_code=401, detail="Invalid refresh token")
+            claims = auth_cache.user_claims(user)
+
         access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
         new_access_token = security.create_access_token(
-            subject=user_id, expires_delta=access_token_expires
+            subject=user_id, expires_delta=access_token_expires, claims=claims
         )
         # We also issue a new refresh token (token rotation)
         new_refresh_token = security.create_refresh_token(subject=user_id)
@@ -1,26 +1,44 @@
-from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Any, List, Optional
+
 from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.api import deps
+from app.api.pagination import export_ndjson, paginate
 from app.db.mongodb import get_db
+from app.models.chat import ChatMessage, ChatSessionResponse
 from app.models.user import UserResponse
-from app.models.chat import ChatSessionResponse, ChatMessage
+from app.services.history_store import history_store
 
 router = APIRouter()
 
+# Fields the UI needs (the rolling summary and other internals stay server-side)
+SESSION_FIELDS = {"user_id": 1, "title": 1, "created_at": 1, "updated_at": 1}
+SESSION_ORDER = [("updated_at", -1), ("_id", -1)]
+MESSAGE_FIELDS = {"session_id": 1, "role": 1, "content": 1, "timestamp": 1}
+MESSAGE_ORDER = [("timestamp", 1), ("_id", 1)]
+RECENT_MESSAGE_ORDER = [("timestamp", -1), ("_id", -1)]
+
+
 @router.get("", response_model=List[ChatSessionResponse])
 async def list_sessions(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
     current_user: UserResponse = Depends(deps.get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ) -> Any:
-    """List all chat sessions for the current user"""
-    cursor = db.chat_sessions.find({"user_id": str(current_user.id)}).sort("updated_at", -1)
-    sessions = await cursor.to_list(length=100)
-    for s in sessions:
-        s["id"] = str(s["_id"])
-    return sessions
+    """List chat sessions for the current user, most recent first (paginated)"""
+    query = {"user_id": str(current_user.id)}
+    if format == "ndjson":
+        return export_ndjson(
+            db.chat_sessions, query, SESSION_FIELDS, SESSION_ORDER, "sessions.ndjson"
+        )
+    return await paginate(
+        response, db.chat_sessions, query, SESSION_FIELDS, SESSION_ORDER, limit, cursor
+    )
 
 @router.post("", response_model=ChatSessionResponse)
 async def create_session(
@@ -42,20 +60,36 @@ async def create_session(
 @router.get("/{session_id}/history", response_model=List[ChatMessage])
 async def get_session_history(
     session_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
     current_user: UserResponse = Depends(deps.get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ) -> Any:
-    """Get message history for a specific session"""
+    """
+    Get message history for a specific session, oldest first (paginated).
+    `order=desc` pages back from the newest message instead, as a chat view
+    does; the NDJSON export is always oldest first.
+    """
     # Verify ownership
-    session = await db.chat_sessions.find_one({"_id": ObjectId(session_id), "user_id": str(current_user.id)})
+    session = await db.chat_sessions.find_one(
+        {"_id": ObjectId(session_id), "user_id": str(current_user.id)}, {"_id": 1}
+    )
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
-        
-    cursor = db.chat_messages.find({"session_id": session_id}).sort("timestamp", 1)
-    messages = await cursor.to_list(length=100)
-    for m in messages:
-        m["id"] = str(m["_id"])
-    return messages
+
+    query = {"session_id": session_id}
+    if format == "ndjson":
+        return export_ndjson(
+            db.chat_messages, query, MESSAGE_FIELDS, MESSAGE_ORDER,
+            f"session-{session_id}.ndjson",
+        )
+    sort = RECENT_MESSAGE_ORDER if order == "desc" else MESSAGE_ORDER
+    return await paginate(
+        response, db.chat_messages, query, MESSAGE_FIELDS, sort, limit, cursor
+    )
 
 @router.delete("/{session_id}")
 async def delete_session(
@@ -65,10 +99,13 @@ async def delete_session(
 ) -> Any:
     """Delete a chat session and its messages"""
     # Verify ownership
-    session = await db.chat_sessions.find_one({"_id": ObjectId(session_id), "user_id": str(current_user.id)})
+    session = await db.chat_sessions.find_one(
+        {"_id": ObjectId(session_id), "user_id": str(current_user.id)}
+    )
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
         
     await db.chat_sessions.delete_one({"_id": ObjectId(session_id)})
     await db.chat_messages.delete_many({"session_id": session_id})
+    history_store.forget(session_id)
     return {"status": "deleted"}
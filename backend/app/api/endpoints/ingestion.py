@@ -1,56 +1,374 @@
-from typing import Any
+import asyncio
+import mimetypes
+import os
+import tarfile
+import zipfile
+from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, UploadFile
+from bson import ObjectId
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Response, UploadFile
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.api import deps
+from app.api.pagination import export_ndjson, paginate
+from app.core.config import settings
 from app.db.mongodb import get_db
 from app.models.user import UserResponse
-from app.services import ingestion_service
+from app.services import cache_invalidation, ingestion_service
+from app.services.job_queue import job_queue
 
 router = APIRouter()
 
 
+# A re-upload of a document in one of these states would race its ingestion
+IN_PROGRESS = ["pending", "processing", "retrying"]
+# Documents a new upload with the same content is deduplicated against
+LIVE = ["completed", *IN_PROGRESS]
+
+
+async def _find_duplicates(
+    db: AsyncIOMotorDatabase, user_id: str, content_hashes: List[str]
+) -> Dict[str, dict]:
+    """The user's latest live document for each of `content_hashes`, by hash."""
+    duplicates: Dict[str, dict] = {}
+    async for doc in db.documents.find(
+        {
+            "user_id": user_id,
+            "content_hash": {"$in": content_hashes},
+            "status": {"$in": LIVE},
+        },
+        {"filename": 1, "status": 1, "content_hash": 1},
+        sort=[("_id", -1)],
+    ):
+        duplicates.setdefault(doc["content_hash"], doc)
+    return duplicates
+
+
+def _unchanged(doc: dict) -> dict:
+    return {"id": str(doc["_id"]), "filename": doc["filename"], "status": "unchanged"}
+
+
+async def _reuse_document(
+    db: AsyncIOMotorDatabase, user_id: str, filename: str, fields: dict
+) -> Optional[dict]:
+    """
+    Point the user's latest document named `filename` (if any) at new content.
+    Returns the previous record; its vectors are then synced incrementally.
+    """
+    existing = await db.documents.find_one(
+        {"user_id": user_id, "filename": filename},
+        {"status": 1},
+        sort=[("_id", -1)],
+    )
+    if existing is None:
+        return None
+    if existing["status"] in IN_PROGRESS:
+        raise HTTPException(status_code=409, detail="Document is still being ingested")
+    result = await db.documents.update_one(
+        {"_id": existing["_id"], "status": {"$nin": IN_PROGRESS}},
+        {"$set": {**fields, "status": "pending"}, "$unset": {"error": ""}},
+    )
+    if result.modified_count == 0:
+        raise HTTPException(status_code=409, detail="Document is still being ingested")
+    existing["status"] = "pending"
+    return existing
+
+
 @router.post("/upload", response_model=Any)
 async def upload_document(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
+    replace: bool = Query(
+        False, description="Update the latest document with this filename"
+    ),
     current_user: UserResponse = Depends(deps.get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ) -> Any:
     """
-    Upload a document for ingestion.
+    Upload a document for ingestion. Content the user already has (under any
+    name) is not ingested again: the existing document is returned as
+    `unchanged`. With `replace=true`, the latest document with the same
+    filename is updated instead of a new one being created, and only the
+    chunks that changed are re-embedded.
     """
     if not file.filename:
         raise HTTPException(status_code=400, detail="Invalid filename")
+    user_id = str(current_user.id)
+
+    # Save file temporarily (container ephemeral storage or volume)
+    file_path, content_hash = await ingestion_service.save_upload_file(
+        file, str(ObjectId())
+    )
+    duplicate = (await _find_duplicates(db, user_id, [content_hash])).get(
+        content_hash
+    )
+    if duplicate is not None:
+        os.remove(file_path)
+        return _unchanged(duplicate)
 
-    # Create initial document record
-    doc_data = {
-        "user_id": str(current_user.id),
-        "filename": file.filename,
+    fields = {
         "content_type": file.content_type,
-        "status": "pending",
+        "content_hash": content_hash,
         "upload_timestamp": ingestion_service.get_timestamp(),
-        "chunks": 0,
     }
+    existing = None
+    if replace:
+        try:
+            existing = await _reuse_document(db, user_id, file.filename, fields)
+        except HTTPException:
+            os.remove(file_path)
+            raise
 
-    result = await db.documents.insert_one(doc_data)
-    doc_id = str(result.inserted_id)
+    if existing is not None:
+        doc_id = str(existing["_id"])
+    else:
+        # Create initial document record
+        result = await db.documents.insert_one(
+            {
+                "user_id": user_id,
+                "filename": file.filename,
+                "status": "pending",
+                "chunks": 0,
+                **fields,
+            }
+        )
+        doc_id = str(result.inserted_id)
 
-    # Save file temporarily (container ephemeral storage or volume)
-    file_path = await ingestion_service.save_upload_file(file, doc_id)
+    # Queue ingestion (picked up by an ingestion worker)
+    await job_queue.enqueue("document", user_id, doc_id, {"file_path": file_path})
+
+    return {"id": doc_id, "filename": file.filename, "status": "pending"}
+
+
+async def _discard_batch(db: AsyncIOMotorDatabase, batch_id: ObjectId):
+    try:
+        await asyncio.to_thread(ingestion_service.remove_batch_files, str(batch_id))
+        await db.documents.delete_many({"batch_id": str(batch_id)})
+        await db.ingestion_batches.delete_one({"_id": batch_id})
+    except Exception as e:
+        print(f"Cleanup of batch {batch_id} failed: {e}")
+
+
+async def _spool_batch(batch_id: ObjectId, files: List[UploadFile]) -> List[tuple]:
+    """Copy the uploads (and archive members) to disk; [(filename, path, sha256)]."""
+    max_files = settings.INGESTION_BATCH_MAX_FILES
+    saved: List[tuple] = []
+    spooled = 0  # Disk names are numbered; archives take a number too
+
+    try:
+        for upload in files:
+            if not upload.filename:
+                raise ValueError("Invalid filename")
+            # Disk-backed copies in blocks, off the event loop
+            path, content_hash = await asyncio.to_thread(
+                ingestion_service.save_batch_file,
+                upload.file,
+                str(batch_id),
+                spooled,
+                upload.filename,
+            )
+            spooled += 1
+            if not ingestion_service.is_archive(upload.filename):
+                saved.append((upload.filename, path, content_hash))
+            else:
+                try:
+                    extracted = await asyncio.to_thread(
+                        ingestion_service.extract_archive,
+                        path,
+                        str(batch_id),
+                        spooled,
+                        max_files - len(saved),
+                    )
+                except (zipfile.BadZipFile, tarfile.TarError):
+                    raise ValueError(f"Unreadable archive: {upload.filename}")
+                finally:
+                    os.remove(path)
+                saved.extend(extracted)
+                spooled += len(extracted)
+            if len(saved) > max_files:
+                raise ValueError(f"Too many files in batch (max {max_files})")
+        if not saved:
+            raise ValueError("No files to ingest")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return saved
+
+
+async def _create_batch(
+    db: AsyncIOMotorDatabase,
+    user_id: str,
+    batch_id: ObjectId,
+    files: List[UploadFile],
+    replace: bool,
+) -> dict:
+    """Spool the uploads, then record the batch and queue its jobs."""
+    saved = await _spool_batch(batch_id, files)
+    now = ingestion_service.get_timestamp()
+    known = await _find_duplicates(db, user_id, list({h for _, _, h in saved}))
+    existing_names = set()
+    if replace:
+        existing_names = set(
+            await db.documents.distinct(
+                "filename",
+                {"user_id": user_id, "filename": {"$in": [f for f, _, _ in saved]}},
+            )
+        )
+
+    listed: List[dict] = []  # Response entries, in upload order
+    entries: Dict[str, dict] = {}  # content hash -> entry of the copy ingested
+    new: List[tuple] = []  # (entry, path, fields) of documents the batch creates
+    replaced: List[tuple] = []  # (entry, path, fields) of documents it updates
+    for filename, path, content_hash in saved:
+        if content_hash in known or content_hash in entries:
+            # Content the user already has, or a copy earlier in this batch
+            os.remove(path)
+            if content_hash in known:
+                listed.append(_unchanged(known[content_hash]))
+            else:
+                listed.append(entries[content_hash])
+            continue
+        entry = {"id": None, "filename": filename, "status": "pending"}
+        fields = {
+            "content_type": mimetypes.guess_type(filename)[0],
+            "content_hash": content_hash,
+            "upload_timestamp": now,
+        }
+        (replaced if filename in existing_names else new).append((entry, path, fields))
+        entries[content_hash] = entry
+        listed.append(entry)
 
-    # Trigger background ingestion
-    background_tasks.add_task(
-        ingestion_service.process_document, doc_id, file_path, str(current_user.id)
+    status = "pending" if new else "completed"
+    await db.ingestion_batches.insert_one(
+        {
+            "_id": batch_id,
+            "user_id": user_id,
+            "status": status,
+            "documents": len(new),
+            "completed": 0,
+            "failed": 0,
+            "chunks": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
     )
+    documents = []
+    if new:
+        result = await db.documents.insert_many(
+            [
+                {
+                    "user_id": user_id,
+                    "batch_id": str(batch_id),
+                    "filename": entry["filename"],
+                    "status": "pending",
+                    "chunks": 0,
+                    **fields,
+                }
+                for entry, _, fields in new
+            ]
+        )
+        for doc_id, (entry, path, _) in zip(result.inserted_ids, new):
+            entry["id"] = str(doc_id)
+            documents.append({"doc_id": str(doc_id), "file_path": path})
+
+    # Groups of documents become separate jobs, so several workers share a batch
+    group = settings.INGESTION_BATCH_JOB_FILES
+    for i in range(0, len(documents), group):
+        await job_queue.enqueue(
+            "batch",
+            user_id,
+            str(batch_id),
+            {"batch_id": str(batch_id), "documents": documents[i : i + group]},
+        )
+
+    # Updated documents are re-synced incrementally by their own jobs, as with
+    # /upload?replace=true, and are not counted in the batch progress
+    for entry, path, fields in replaced:
+        try:
+            existing = await _reuse_document(db, user_id, entry["filename"], fields)
+        except HTTPException as e:
+            os.remove(path)
+            entry.update(status="rejected", error=e.detail)
+            continue
+        if existing is None:  # Deleted since the batch was classified
+            result = await db.documents.insert_one(
+                {
+                    "user_id": user_id,
+                    "filename": entry["filename"],
+                    "status": "pending",
+                    "chunks": 0,
+                    **fields,
+                }
+            )
+            entry["id"] = str(result.inserted_id)
+        else:
+            entry["id"] = str(existing["_id"])
+        await job_queue.enqueue("document", user_id, entry["id"], {"file_path": path})
+
+    return {"batch_id": str(batch_id), "status": status, "documents": listed}
+
+
+@router.post("/batch", response_model=Any)
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    replace: bool = Query(
+        False, description="Update the latest documents with these filenames"
+    ),
+    current_user: UserResponse = Depends(deps.get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+) -> Any:
+    """
+    Upload many documents at once, as several files and/or zip/tar archives.
+    They are ingested as one batch: parsed concurrently, with their chunks
+    sharing embedding batches. Progress arrives as `batch_progress` messages
+    and from GET /batches/{batch_id}. Duplicates and `replace` work as in
+    /upload; a file whose document is still being ingested is `rejected`.
+    """
+    user_id = str(current_user.id)
+    batch_id = ObjectId()
+    accepted = False
+    try:
+        response = await _create_batch(db, user_id, batch_id, files, replace)
+        accepted = True
+        return response
+    finally:
+        if not accepted:
+            # Any failure (bad input, disk, database, client gone): drop what
+            # was spooled or recorded so far
+            await _discard_batch(db, batch_id)
 
-    return {"id": doc_id, "filename": file.filename, "status": "pending"}
+
+BATCH_FIELDS = {
+    "status": 1,
+    "documents": 1,
+    "completed": 1,
+    "failed": 1,
+    "chunks": 1,
+    "created_at": 1,
+    "updated_at": 1,
+}
+
+
+@router.get("/batches/{batch_id}", response_model=Any)
+async def get_batch(
+    batch_id: str,
+    current_user: UserResponse = Depends(deps.get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+) -> Any:
+    """
+    Aggregated progress of a batch upload.
+    """
+    if not ObjectId.is_valid(batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    batch = await db.ingestion_batches.find_one(
+        {"_id": ObjectId(batch_id), "user_id": str(current_user.id)}, BATCH_FIELDS
+    )
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    batch["id"] = str(batch.pop("_id"))
+    return batch
 
 
 @router.post("/scrape", response_model=Any)
 async def scrape_website(
-    background_tasks: BackgroundTasks,
     payload: dict,
     current_user: UserResponse = Depends(deps.get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_db),
@@ -62,42 +380,65 @@ async def scrape_website(
     if not url:
         raise HTTPException(status_code=400, detail="URL is required")
 
-    # Create initial document record
-    doc_data = {
-        "user_id": str(current_user.id),
-        "filename": url,
+    # Re-scraping a URL re-syncs the existing document
+    fields = {
         "content_type": "text/html",
-        "status": "pending",
         "upload_timestamp": ingestion_service.get_timestamp(),
-        "chunks": 0,
     }
+    existing = await _reuse_document(db, str(current_user.id), url, fields)
+    if existing is not None:
+        doc_id = str(existing["_id"])
+    else:
+        # Create initial document record
+        doc_data = {
+            "user_id": str(current_user.id),
+            "filename": url,
+            "status": "pending",
+            "chunks": 0,
+            **fields,
+        }
+        result = await db.documents.insert_one(doc_data)
+        doc_id = str(result.inserted_id)
 
-    result = await db.documents.insert_one(doc_data)
-    doc_id = str(result.inserted_id)
-
-    # Trigger background ingestion
-    background_tasks.add_task(
-        ingestion_service.process_url, doc_id, url, str(current_user.id)
-    )
+    # Queue ingestion (picked up by an ingestion worker)
+    await job_queue.enqueue("url", str(current_user.id), doc_id, {"url": url})
 
     return {"id": doc_id, "filename": url, "status": "pending"}
 
 
+# Fields the UI needs from a document record
+DOCUMENT_FIELDS = {
+    "filename": 1,
+    "content_type": 1,
+    "status": 1,
+    "upload_timestamp": 1,
+    "chunks": 1,
+    "error": 1,
+    "batch_id": 1,
+}
+DOCUMENT_ORDER = [("_id", -1)]  # Newest first
+
+
 @router.get("/documents", response_model=Any)
 async def list_documents(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
     current_user: UserResponse = Depends(deps.get_current_user),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ) -> Any:
     """
-    List user documents.
+    List user documents (paginated; `format=ndjson` streams all of them).
     """
-    cursor = db.documents.find({"user_id": str(current_user.id)})
-    docs = await cursor.to_list(length=100)
-    # Convert ObjectId to str
-    for doc in docs:
-        doc["id"] = str(doc["_id"])
-        del doc["_id"]
-    return docs
+    query = {"user_id": str(current_user.id)}
+    if format == "ndjson":
+        return export_ndjson(
+            db.documents, query, DOCUMENT_FIELDS, DOCUMENT_ORDER, "documents.ndjson"
+        )
+    return await paginate(
+        response, db.documents, query, DOCUMENT_FIELDS, DOCUMENT_ORDER, limit, cursor
+    )
 
 
 @router.delete("/documents/{doc_id}", response_model=Any)
@@ -110,32 +451,21 @@ async def delete_document(
     Delete a document and its vectors.
     """
     from bson import ObjectId
-    from app.db.qdrant import qdrant_db
-    from qdrant_client.http import models
 
     # 1. Check ownership
-    doc = await db.documents.find_one({"_id": ObjectId(doc_id), "user_id": str(current_user.id)})
+    doc = await db.documents.find_one(
+        {"_id": ObjectId(doc_id), "user_id": str(current_user.id)}
+    )
     if not doc:
         raise HTTPException(status_code=404, detail="Document not found")
 
     # 2. Delete from MongoDB
     await db.documents.delete_one({"_id": ObjectId(doc_id)})
+    await cache_invalidation.invalidate_responses(str(current_user.id))
 
     # 3. Delete from Qdrant (vectors)
     try:
-        qdrant_db.client.delete(
-            collection_name="documents",
-            points_selector=models.FilterSelector(
-                filter=models.Filter(
-                    must=[
-                        models.FieldCondition(
-                            key="doc_id",
-                            match=models.MatchValue(value=doc_id),
-                        ),
-                    ],
-                )
-            ),
-        )
+        await ingestion_service.delete_document_vectors(doc_id, str(current_user.id))
     except Exception as e:
         print(f"Error checking qdrant delete: {e}")
         # non-blocking
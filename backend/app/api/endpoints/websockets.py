@@ -1,27 +1,33 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
-from jose import JWTError, jwt
+import asyncio
+import uuid
+from typing import Dict, Optional
 
-from app.core.config import settings
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+from jose import JWTError
+
+from app.core import auth_cache
 from app.services import chat_service
 from app.websockets.connection_manager import manager
+from app.websockets.streaming import SlowConsumerError, TokenBatcher, WebSocketSender
 
 router = APIRouter()
 
 
 async def get_user_from_token(token: str):
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
+        payload = auth_cache.decode_token(token)
         
         # Ensure it's an access token
         if payload.get("type") != "access":
-            print(f"WS Auth Error: Token is not an access token (type={payload.get('type')})")
+            print(
+                "WS Auth Error: Token is not an access token "
+                f"(type={payload.get('type')})"
+            )
             return None
             
         user_id: str = payload.get("sub")
         if user_id is None:
-            print(f"WS Auth Error: No sub in token payload")
+            print("WS Auth Error: No sub in token payload")
             return None
         return user_id
     except JWTError as e:
@@ -32,33 +38,96 @@ async def get_user_from_token(token: str):
         return None
 
 
+async def _run_turn(
+    websocket: WebSocket,
+    sender: WebSocketSender,
+    user_id: str,
+    request_id: str,
+    query: str,
+    session_id: Optional[str],
+):
+    tagged = {"request_id": request_id}
+    cancelled = False
+    try:
+        await sender.send({"type": "chat_start", **tagged})
+        # Tokens are coalesced into frames (see app/websockets/streaming.py)
+        batcher = TokenBatcher(sender, extra=tagged)
+        stream = chat_service.chat_stream(query, user_id, session_id)
+        try:
+            async for token in stream:
+                await batcher.add(token)
+            await batcher.flush()
+        except asyncio.CancelledError:
+            cancelled = True
+            batcher.discard()
+        finally:
+            await stream.aclose()  # Stops the LLM stream if we gave up early
+        await sender.send({"type": "chat_end", "cancelled": cancelled, **tagged})
+    except SlowConsumerError as e:
+        print(f"WS slow consumer for user {user_id}: {e}")
+        await websocket.close(code=1013)  # Try Again Later
+    except (ConnectionError, asyncio.CancelledError):
+        pass  # Client is gone
+    finally:
+        manager.release_turn(user_id)
+
+
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
     print(f"WS Connection Attempt. Token Present: {bool(token)}")
     user_id = await get_user_from_token(token)
     if not user_id:
-        print(f"WS Connection Rejected: Invalid Token")
+        print("WS Connection Rejected: Invalid Token")
         await websocket.close(code=1008)  # Policy Violation
         return
 
     print(f"WS Connection Accepted for User: {user_id}")
-    await manager.connect(websocket, user_id)
+    sender = await manager.connect(websocket, user_id)
+    # Turns streaming on this connection, by request_id
+    turns: Dict[str, asyncio.Task] = {}
     try:
         while True:
             data = await websocket.receive_json()
             # Handle incoming messages
-            # format: { "type": "chat_message", "content": "..." }
+            # format: { "type": "chat_message", "text": "...", "request_id": "..." }
+            #         { "type": "cancel", "request_id": "..." }
+            message_type = data.get("type")
 
-            if data.get("type") == "chat_message":
+            if message_type == "chat_message":
                 # Process message
                 query = data.get("text", "")
                 session_id = data.get("session_id")
-                
-                if query:
-                    await websocket.send_json({"type": "chat_start"})
-                    async for token in chat_service.chat_stream(query, user_id, session_id):
-                        await websocket.send_json({"type": "chat_token", "token": token})
-                    await websocket.send_json({"type": "chat_end"})
+                request_id = str(data.get("request_id") or uuid.uuid4().hex)
+
+                if not query:
+                    continue
+                if request_id in turns or not manager.acquire_turn(user_id):
+                    await sender.send(
+                        {
+                            "type": "chat_error",
+                            "request_id": request_id,
+                            "error": "Too many concurrent requests",
+                        }
+                    )
+                    continue
+                task = asyncio.create_task(
+                    _run_turn(websocket, sender, user_id, request_id, query, session_id)
+                )
+                turns[request_id] = task
+                task.add_done_callback(lambda _, rid=request_id: turns.pop(rid, None))
+
+            elif message_type == "cancel":
+                task = turns.get(str(data.get("request_id")))
+                if task is not None:
+                    task.cancel()
+
+            elif message_type == "ping":
+                await sender.send({"type": "pong"})
 
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, user_id)
+    except (WebSocketDisconnect, ConnectionError):
+        pass
+    finally:
+        # Abandoned generations stop consuming LLM tokens right away
+        for task in list(turns.values()):
+            task.cancel()
+        await manager.disconnect(websocket, user_id)
@@ -0,0 +1,123 @@
+"""
+Keyset (cursor) pagination and NDJSON export for list endpoints.
+
+A page is read with `find(filter, projection).sort(keys).limit(n + 1)`. The
+extra document tells us whether there is a next page, and the sort-key values
+of the last returned document become the opaque cursor. The next page starts
+strictly after it, using the same index, so page cost does not grow with
+depth. The cursor is returned in the `X-Next-Cursor` header, which keeps the
+response body a plain list.
+
+A document missing a sort field is ordered as MongoDB sorts it, as null,
+before every other value. Range operators never match null, so the "after"
+filter spells those cases out.
+"""
+import base64
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from app.core.serialization import dumps
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+EXPORT_BATCH_SIZE = 500
+
+Sort = List[Tuple[str, int]]
+
+
+def encode_cursor(doc: Dict[str, Any], sort: Sort) -> str:
+    values = [doc.get(field) for field, _ in sort]
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: Sort) -> List[Any]:
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(sort):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _beyond(field: str, direction: int, value: Any) -> Optional[Dict[str, Any]]:
+    """Filter for `field` strictly after `value`; None if nothing can be."""
+    if value is None:
+        return {field: {"$ne": None}} if direction > 0 else None
+    if direction > 0:
+        return {field: {"$gt": value}}
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+
+def after(sort: Sort, values: List[Any]) -> Dict[str, Any]:
+    """Filter for documents strictly after `values` in `sort` order."""
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        beyond = _beyond(field, direction, values[i])
+        if beyond is None:
+            continue
+        # {field: None} also matches documents without the field
+        equal = [{f: values[j]} for j, (f, _) in enumerate(sort[:i])]
+        branches.append({"$and": [*equal, beyond]} if equal else beyond)
+    if not branches:
+        return {"_id": {"$in": []}}
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+
+def json_safe(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """ObjectIds to str (datetimes are handled by the serializer)."""
+    return {k: str(v) if isinstance(v, ObjectId) else v for k, v in doc.items()}
+
+
+def _to_api(doc: Dict[str, Any]) -> Dict[str, Any]:
+    doc["id"] = str(doc.pop("_id"))
+    return doc
+
+
+async def paginate(
+    response: Response,
+    collection: AsyncIOMotorCollection,
+    query: Dict[str, Any],
+    projection: Dict[str, int],
+    sort: Sort,
+    limit: int,
+    cursor: Optional[str],
+) -> List[Dict[str, Any]]:
+    if cursor:
+        query = {"$and": [query, after(sort, decode_cursor(cursor, sort))]}
+    docs = (
+        await collection.find(query, projection)
+        .sort(sort)
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(docs[-1], sort)
+    return [_to_api(doc) for doc in docs]
+
+
+def export_ndjson(
+    collection: AsyncIOMotorCollection,
+    query: Dict[str, Any],
+    projection: Dict[str, int],
+    sort: Sort,
+    filename: str,
+    transform: Callable[[Dict[str, Any]], Dict[str, Any]] = _to_api,
+) -> StreamingResponse:
+    """Stream every matching document as newline-delimited JSON."""
+
+    async def lines() -> AsyncIterator[bytes]:
+        docs = collection.find(query, projection, batch_size=EXPORT_BATCH_SIZE)
+        docs = docs.sort(sort)
+        async for doc in docs:
+            yield (dumps(json_safe(transform(doc))) + "\n").encode("utf-8")
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
@@ -0,0 +1,140 @@
+"""
+Authentication fast path.
+
+- Verified JWT payloads are cached per token, so repeat requests skip the
+  signature check.
+- Authenticated principals (`UserResponse`) are cached per (user id, token
+  `iat`), so repeat requests skip the `users` lookup.
+- With AUTH_EMBED_CLAIMS, access tokens carry the user's profile claims and
+  a cache miss is served from the token instead of MongoDB.
+
+`invalidate_user` must be called when a user is deactivated or changed (via
+`cache_invalidation.invalidate_user`, which reaches every API process). It
+drops the user's cached principals, and tokens issued up to that moment go
+back to the database (which rejects inactive users). An invalidation is
+forgotten once every access token issued before it has expired.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from bson import ObjectId
+from jose import jwt
+
+from app.core.config import settings
+from app.models.user import UserResponse
+
+
+class TTLCache:
+    """Size-bounded LRU with a per-entry expiry."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float):
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard_where(self, predicate):
+        for key in [k for k in self._entries if predicate(k)]:
+            del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_decoded = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES)
+_principals = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES)
+# user_id -> epoch second of the last invalidation
+_invalidated_at: Dict[str, int] = {}
+
+
+def decode_token(token: str) -> Dict[str, Any]:
+    """Verify and decode a JWT (raises JWTError), caching the result until expiry."""
+    payload = _decoded.get(token)
+    if payload is None:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
+        )
+        ttl = settings.AUTH_CACHE_TTL_SECONDS
+        if "exp" in payload:
+            ttl = min(ttl, payload["exp"] - time.time())
+        _decoded.set(token, payload, ttl)
+    return payload
+
+
+def user_claims(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Profile claims embedded in access tokens (see AUTH_EMBED_CLAIMS)."""
+    return {
+        "email": user["email"],
+        "full_name": user.get("full_name"),
+        "is_active": user.get("is_active", True),
+    }
+
+
+async def get_principal(payload: Dict[str, Any], db) -> Optional[UserResponse]:
+    """The user a verified access token stands for; None if they do not exist."""
+    user_id = payload["sub"]
+    issued_at = payload.get("iat", 0)
+    stale = issued_at <= _invalidated_at.get(user_id, -1)
+
+    key = (user_id, issued_at)
+    if not stale:
+        principal = _principals.get(key)
+        if principal is not None:
+            return principal
+
+    claims = payload.get("usr")
+    if settings.AUTH_EMBED_CLAIMS and claims and not stale:
+        principal = UserResponse(_id=user_id, **claims)
+    else:
+        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        if user is None:
+            return None
+        principal = UserResponse(**user)
+    if not stale:
+        _principals.set(key, principal, settings.AUTH_PRINCIPAL_TTL_SECONDS)
+    return principal
+
+
+def invalidate_user(user_id: str, at: Optional[int] = None):
+    """`at`: epoch second of the change (now by default)."""
+    user_id = str(user_id)
+    now = int(time.time())
+    at = now if at is None else at
+    _invalidated_at[user_id] = max(at, _invalidated_at.get(user_id, at))
+    _principals.discard_where(lambda key: key[0] == user_id)
+    # Tokens issued before these have all expired
+    horizon = now - settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    for stale_user in [u for u, t in _invalidated_at.items() if t < horizon]:
+        del _invalidated_at[stale_user]
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "decoded_tokens": len(_decoded),
+        "decode_hits": _decoded.hits,
+        "decode_misses": _decoded.misses,
+        "principals": len(_principals),
+        "principal_hits": _principals.hits,
+        "principal_misses": _principals.misses,
+        "invalidated_users": len(_invalidated_at),
+    }
@@ -0,0 +1,51 @@
+"""
+Fire-and-forget tasks that must not hold up a response.
+
+The event loop only keeps weak references to tasks, so spawned tasks are kept
+here until they finish; `drain()` lets shutdown wait for them.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Coroutine, Set
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_tasks: Set[asyncio.Task] = set()
+
+
+def _done(task: asyncio.Task):
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(
+            f"Background task {task.get_name()} failed: {task.exception()!r}"
+        )
+
+
+def spawn(coro: Coroutine, name: str = None) -> asyncio.Task:
+    task = asyncio.create_task(coro, name=name)
+    _tasks.add(task)
+    task.add_done_callback(_done)
+    return task
+
+
+async def with_retries(factory: Callable[[], Awaitable[Any]], attempts: int = None):
+    """Await `factory()`, retrying with backoff on failure."""
+    attempts = attempts or settings.BACKGROUND_WRITE_ATTEMPTS
+    for attempt in range(1, attempts + 1):
+        try:
+            return await factory()
+        except Exception:
+            if attempt == attempts:
+                raise
+            await asyncio.sleep(min(0.1 * 2**attempt, 5.0))
+
+
+async def drain(timeout: float = 10.0):
+    """Wait (bounded) for outstanding background tasks, cancelling stragglers."""
+    if not _tasks:
+        return
+    _, pending = await asyncio.wait(set(_tasks), timeout=timeout)
+    for task in pending:
+        task.cancel()
@@ -18,7 +18,8 @@ class Settings(BaseSettings):
             if v.startswith("["):
                 import json
                 try:
-                    return json.loads(v.replace("'", '"'))  # Handle simple single-quote json
+                    # Handle simple single-quote json
+                    return json.loads(v.replace("'", '"'))
                 except json.JSONDecodeError:
                     pass
             return [i.strip() for i in v.split(",")]
@@ -29,22 +30,137 @@ class Settings(BaseSettings):
     # Database
     MONGODB_URL: str = "mongodb://localhost:27017"
     DATABASE_NAME: str = "doc_intelligence"
+    MONGO_QUERY_AUDIT: bool = False  # Dev/test: explain() hot queries at startup
     QDRANT_URL: str = "http://localhost:6333"
-
+    QDRANT_PREFER_GRPC: bool = False
+    QDRANT_GRPC_PORT: int = 6334
+    QDRANT_POOL_SIZE: int = 20
+    QDRANT_TIMEOUT: float = 30.0  # Default per-call timeout (seconds)
+    QDRANT_SEARCH_TIMEOUT: float = 5.0
+    QDRANT_UPSERT_TIMEOUT: float = 120.0
 
     # AI
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     UNSTRUCTURED_URL: str = "http://localhost:8000"
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
-    
+    EMBEDDING_MAX_BATCH_SIZE: int = 64  # Max texts per coalesced query batch
+    EMBEDDING_MAX_WAIT_MS: float = 5.0  # How long a query waits for batch-mates
+    EMBEDDING_BULK_BATCH_SIZE: int = 32  # Ingestion sub-batch size
+    UPLOAD_DIR: str = ""  # Defaults to <tmp>/ai_doc_uploads
+    INGESTION_EMBEDDED_WORKERS: int = 0  # Opt-in: jobs run inside the API process
+    INGESTION_WORKER_CONCURRENCY: int = 4  # Jobs per `python -m app.worker` process
+    INGESTION_MAX_JOBS_PER_USER: int = 2
+    INGESTION_MAX_ATTEMPTS: int = 3
+    INGESTION_RETRY_BASE_SECONDS: float = 10.0
+    INGESTION_LEASE_SECONDS: int = 60
+    INGESTION_HEARTBEAT_SECONDS: int = 15
+    INGESTION_POLL_SECONDS: float = 1.0
+    INGESTION_STOP_TIMEOUT_SECONDS: float = 20.0  # Then running jobs are cancelled
+    INGESTION_EXECUTION_MODE: str = "thread"  # "thread" or "process"
+    INGESTION_PROCESS_WORKERS: int = 0  # 0 = cpu_count - 1
+    INGESTION_BATCH_SIZE: int = 64  # Chunks embedded + upserted per batch
+    INGESTION_PREFETCH_BATCHES: int = 2  # Parsed batches buffered ahead of embedding
+    INGESTION_MAX_UPSERTS_IN_FLIGHT: int = 2
+    # Files (incl. archive entries) per batch upload
+    INGESTION_BATCH_MAX_FILES: int = 5000
+    INGESTION_ARCHIVE_MAX_BYTES: int = 2 * 1024**3  # Unpacked size limit per archive
+    INGESTION_BATCH_JOB_FILES: int = 100  # Documents per job, so workers share a batch
+    INGESTION_BATCH_PARSE_CONCURRENCY: int = 4  # Parser calls in flight per batch job
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_CANDIDATES: int = 20  # Hits fetched from each of dense and BM25 search
+    HYBRID_DENSE_WEIGHT: float = 1.0
+    HYBRID_LEXICAL_WEIGHT: float = 1.0
+    HYBRID_RRF_K: int = 60
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+    BM25_AVG_CHUNK_TOKENS: float = 80.0
+    RERANK_ENABLED: bool = False
+    RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_CANDIDATES: int = 20  # First-stage over-fetch (K)
+    RERANK_BATCH_SIZE: int = 16
+    RERANK_BUDGET_MS: float = 150.0  # Fall back to first-stage order beyond this
+    RERANK_MAX_PENDING: int = 2
+    RERANK_PROBE_SECONDS: float = 30.0  # Try again this often while over budget
+    RERANK_DEDUP_SIMILARITY: float = 0.95  # Cosine above which chunks are duplicates
+    QUERY_CACHE_MAX_ENTRIES: int = 10000
+    QUERY_CACHE_MAX_MB: int = 64
+    QUERY_CACHE_TTL_SECONDS: int = 3600
+    QUERY_CACHE_FLOAT16: bool = False
+    QUERY_CACHE_PATH: str = ""  # sqlite file shared by workers; empty = per-process
+    CHUNK_CACHE_ENABLED: bool = True  # Persistent embeddings of ingested chunks
+    CHUNK_CACHE_DIR: str = ""  # Defaults to <tmp>/ai_doc_embeddings
+    CHUNK_CACHE_MAX_MB: int = 1024  # Slot file size (fixed when it is created)
+    CHUNK_CACHE_FLOAT16: bool = False
+    CHUNK_CACHE_COMPACT_FRACTION: float = 0.1  # LRU share dropped when full
+    RESPONSE_CACHE_ENABLED: bool = False
+    RESPONSE_CACHE_SIMILARITY: float = 0.95  # Min cosine to reuse an answer
+    RESPONSE_CACHE_TTL_SECONDS: int = 24 * 3600
+    RESPONSE_CACHE_MAX_PER_USER: int = 200
+    RESPONSE_CACHE_MAX_USERS: int = 5000
+
     # Groq Cloud API
     GROQ_API_KEY: str = ""
     GROQ_MODEL: str = "llama-3.1-8b-instant"
 
+    # LLM gateway
+    # "groq" | "openai" (any OpenAI-compatible API) | "ollama"
+    LLM_PROVIDER: str = "groq"
+    LLM_FALLBACK_PROVIDER: str = ""  # Used while the primary's circuit is open
+    LLM_FALLBACK_MODEL: str = "llama3.1:8b"
+    OPENAI_COMPAT_BASE_URL: str = "http://localhost:8080/v1"
+    OPENAI_COMPAT_API_KEY: str = ""
+    LLM_MAX_CONNECTIONS: int = 20
+    LLM_MAX_KEEPALIVE: int = 10
+    LLM_KEEPALIVE_EXPIRY: float = 30.0
+    LLM_CONNECT_TIMEOUT: float = 5.0
+    LLM_READ_TIMEOUT: float = 60.0  # Max gap between streamed chunks
+    LLM_MAX_CONCURRENCY: int = 16  # Requests in flight per process
+    LLM_RPM_LIMIT: int = 0  # Match the provider plan; 0 = unlimited
+    LLM_TPM_LIMIT: int = 0
+    LLM_MAX_RETRIES: int = 3  # Only before the first token has been streamed
+    LLM_RETRY_BASE_SECONDS: float = 0.5
+    LLM_RETRY_MAX_SECONDS: float = 8.0
+    LLM_BREAKER_FAILURES: int = 5  # Consecutive failures that open the circuit
+    LLM_BREAKER_COOLDOWN_SECONDS: float = 30.0
+    LLM_COALESCE_ENABLED: bool = True  # Share one stream between identical prompts
+
+    # Prompt assembly
+    PROMPT_TOKENIZER: str = ""  # Hugging Face id matching GROQ_MODEL; empty = estimate
+    PROMPT_TOKEN_BUDGET: int = 3000  # Whole prompt, leaving room for the answer
+    PROMPT_HISTORY_SHARE: float = 0.3  # Of what is left after persona and query
+    PROMPT_MAX_HISTORY_TURNS: int = 14  # >= unsummarized tail (see SESSION_*)
+    PROMPT_MIN_CHUNK_TOKENS: int = 64  # Smaller remainders drop the chunk instead
+
+    # Rolling session summaries
+    SESSION_SUMMARY_TRIGGER_MESSAGES: int = 12  # Unsummarized messages before folding
+    SESSION_RECENT_MESSAGES: int = 6  # Kept verbatim after folding
+    SESSION_SUMMARY_MAX_TOKENS: int = 300
+    BACKGROUND_WRITE_ATTEMPTS: int = 5  # Fire-and-forget chat writes
+    HISTORY_BUFFER_MESSAGES: int = 20  # Recent messages kept per active session
+    HISTORY_CACHE_SESSIONS: int = 2000
+    HISTORY_CACHE_TTL_SECONDS: int = 600  # Bounds staleness across processes
+
+    # WebSocket streaming
+    WS_TOKEN_FLUSH_MS: float = 25.0  # Token coalescing window; 0 = frame per token
+    WS_TOKEN_FLUSH_BYTES: int = 512  # Flush early once this much text is buffered
+    WS_SEND_QUEUE_SIZE: int = 64  # Frames queued per connection
+    WS_SLOW_CONSUMER_SECONDS: float = 5.0  # Max wait for queue space before giving up
+    WS_MAX_TURNS_PER_USER: int = 3  # Chat turns streaming at once, across connections
+    BROADCAST_BACKEND: str = "memory"  # "redis" when running several processes/nodes
+    REDIS_URL: str = "redis://localhost:6379"
+    BROADCAST_BATCH_MS: float = 5.0  # Publishes collected into one Redis round trip
+
     # Security
     SECRET_KEY: str = "CHANGE_THIS_TO_A_SECURE_SECRET_KEY"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_CACHE_TTL_SECONDS: int = 300  # Verified tokens (never beyond their exp)
+    AUTH_PRINCIPAL_TTL_SECONDS: int = 60  # Cached user per (user id, token iat)
+    AUTH_EMBED_CLAIMS: bool = False  # Serve profiles from the token, not MongoDB
+    BCRYPT_ROUNDS: int = 12  # Cost factor; existing hashes are upgraded on login
+    PASSWORD_HASH_CONCURRENCY: int = 4  # bcrypt calls running at once per process
+    PASSWORD_HASH_QUEUE_TIMEOUT: float = 2.0  # Wait for a slot before answering 503
 
     MAX_CONTENT_LENGTH: int = 10 * 1024 * 1024  # 10 MB
 
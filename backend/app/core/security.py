@@ -1,12 +1,17 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Optional, Union
+from typing import Any, Dict, Optional, Tuple, Union
 
 from jose import jwt
 from passlib.context import CryptContext
 
 from app.core.config import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes with a different cost factor verify fine and are flagged for rehash
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS
+)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -17,17 +22,71 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHasherBusy(Exception):
+    """No hashing slot freed up within PASSWORD_HASH_QUEUE_TIMEOUT."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt (~100-300ms of CPU per call) on a bounded thread pool instead
+    of the event loop. bcrypt releases the GIL, so the threads run in parallel.
+    Callers that wait longer than the queue timeout for a slot are rejected,
+    so a login storm does not build an unbounded backlog.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_CONCURRENCY,
+            thread_name_prefix="bcrypt",
+        )
+        self._slots = asyncio.Semaphore(settings.PASSWORD_HASH_CONCURRENCY)
+        self.rejected = 0
+
+    async def _run(self, fn, *args):
+        try:
+            await asyncio.wait_for(
+                self._slots.acquire(), settings.PASSWORD_HASH_QUEUE_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    async def verify_and_update(
+        self, plain_password: str, hashed_password: str
+    ) -> Tuple[bool, Optional[str]]:
+        """(valid, new hash if the stored one uses outdated settings, else None)"""
+        return await self._run(
+            pwd_context.verify_and_update, plain_password, hashed_password
+        )
+
+
+password_hasher = PasswordHasher()
+
+
 def create_access_token(
-    subject: Union[str, Any], expires_delta: Optional[timedelta] = None
+    subject: Union[str, Any],
+    expires_delta: Optional[timedelta] = None,
+    claims: Optional[Dict[str, Any]] = None,
 ) -> str:
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(
+        expire = now + timedelta(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
 
-    to_encode = {"exp": expire, "sub": str(subject), "type": "access"}
+    to_encode = {"exp": expire, "iat": now, "sub": str(subject), "type": "access"}
+    if claims:
+        to_encode["usr"] = claims  # User profile, for the auth fast path
     encoded_jwt = jwt.encode(
         to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM
     )
@@ -0,0 +1,19 @@
+"""
+Compact JSON encoding shared by WebSocket frames, broadcast events and NDJSON
+exports. Uses orjson when available.
+"""
+from typing import Any, Dict
+
+try:
+    import orjson
+
+    def dumps(message: Dict[str, Any]) -> str:
+        return orjson.dumps(message).decode("utf-8")
+
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    import json
+
+    def dumps(message: Dict[str, Any]) -> str:
+        return json.dumps(
+            message, separators=(",", ":"), ensure_ascii=False, default=str
+        )
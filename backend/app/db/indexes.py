@@ -0,0 +1,142 @@
+"""
+MongoDB schema bootstrap.
+
+`ensure_schema()` runs at startup. It builds the indexes the hot queries need
+(create_index is a no-op when an identical index exists). When
+MONGO_QUERY_AUDIT is on (dev/test), it also runs `explain()` on each hot
+query shape and warns about any that fall back to a collection scan or an
+in-memory sort.
+"""
+import logging
+from typing import Any, Dict, Iterable, List, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.core.config import settings
+from app.db.mongodb import mongo_db
+
+logger = logging.getLogger(__name__)
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [IndexModel([("email", ASCENDING)], name="email_unique", unique=True)],
+    "chat_sessions": [
+        IndexModel(
+            [("user_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)],
+            name="user_recent_sessions",
+        )
+    ],
+    "chat_messages": [
+        IndexModel(
+            [("session_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)],
+            name="session_timeline",
+        )
+    ],
+    "documents": [
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)], name="user_documents"),
+        IndexModel(
+            [("user_id", ASCENDING), ("filename", ASCENDING), ("_id", DESCENDING)],
+            name="user_document_names",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("content_hash", ASCENDING), ("_id", DESCENDING)],
+            name="user_document_hashes",
+        ),
+    ],
+}
+
+# (name, collection, filter, sort) of the queries on the request path.
+# Values only need the right types; explain() does not care whether they match.
+HOT_QUERIES: List[Tuple[str, str, Dict[str, Any], List[Tuple[str, int]]]] = [
+    ("login by email", "users", {"email": "audit@example.com"}, []),
+    (
+        "list sessions",
+        "chat_sessions",
+        {"user_id": "audit"},
+        [("updated_at", DESCENDING), ("_id", DESCENDING)],
+    ),
+    (
+        "session history",
+        "chat_messages",
+        {"session_id": "audit"},
+        [("timestamp", ASCENDING), ("_id", ASCENDING)],
+    ),
+    (
+        "recent history",
+        "chat_messages",
+        {"session_id": "audit"},
+        [("timestamp", DESCENDING), ("_id", DESCENDING)],
+    ),
+    ("list documents", "documents", {"user_id": "audit"}, [("_id", DESCENDING)]),
+    (
+        "document by name",
+        "documents",
+        {"user_id": "audit", "filename": "audit.pdf"},
+        [("_id", DESCENDING)],
+    ),
+    (
+        "document by content",
+        "documents",
+        {"user_id": "audit", "content_hash": {"$in": ["0" * 64]}},
+        [("_id", DESCENDING)],
+    ),
+]
+
+
+async def ensure_indexes():
+    db = mongo_db.db
+    for collection, models in INDEXES.items():
+        try:
+            await db[collection].create_indexes(models)
+        except OperationFailure as e:
+            # E.g. duplicate emails from before the unique index existed
+            logger.error(f"Could not build indexes on {collection}: {e}")
+
+
+def _stages(plan: Dict[str, Any]) -> Iterable[str]:
+    yield plan.get("stage", "")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+    for shard in plan.get("shards", []):  # Sharded cluster
+        yield from _stages(shard.get("winningPlan", shard))
+
+
+async def audit_queries() -> List[str]:
+    """explain() each hot query; returns (and logs) a warning per bad plan."""
+    db = mongo_db.db
+    warnings = []
+    for name, collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        try:
+            explained = await cursor.explain()
+        except Exception as e:
+            warnings.append(f"{name}: explain() failed: {e}")
+            continue
+        plan = explained.get("queryPlanner", {}).get("winningPlan", {})
+        stages = set(_stages(plan))
+        if "COLLSCAN" in stages:
+            warnings.append(f"{name}: COLLSCAN on {collection} for {query} sort {sort}")
+        elif "SORT" in stages:
+            warnings.append(f"{name}: in-memory SORT on {collection} for sort {sort}")
+    for warning in warnings:
+        logger.warning(f"Query audit: {warning}")
+    if not warnings:
+        logger.info(f"Query audit: {len(HOT_QUERIES)} hot queries use indexes")
+    return warnings
+
+
+async def ensure_schema():
+    """All collections' indexes (including service-owned ones), then the audit."""
+    from app.services import lexical_index
+    from app.services.job_queue import job_queue
+
+    await ensure_indexes()
+    await job_queue.ensure_indexes()
+    await lexical_index.ensure_indexes()
+    if settings.MONGO_QUERY_AUDIT:
+        await audit_queries()
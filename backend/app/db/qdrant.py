@@ -1,21 +1,199 @@
-from qdrant_client import QdrantClient
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import httpx
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models
 
 from app.core.config import settings
 
+COLLECTION_NAME = "documents"
+SPARSE_VECTOR_NAME = "bm25"
+
 
 class QdrantDB:
-    client: QdrantClient = None
+    client: AsyncQdrantClient = None
+    _collection_ready: bool = False
+    # False for collections created before the BM25 sparse vector was added
+    sparse_enabled: bool = False
 
     def connect(self):
-        # QdrantClient handles connection pooling internally usually,
-        # but here we initialize it.
-        # For Async, we might need AsyncQdrantClient, but standard client is often used for operations.
-        # Let's use the standard synchronous client for simplicity in vector searches first,
-        # or check if we need async. Qdrant 1.7+ supports async.
-        # We will use the synchronous client wrapped or AsyncQdrantClient if preferred.
-        # For now, standard client is safer for broad compatibility.
-        self.client = QdrantClient(url=settings.QDRANT_URL)
-        print(f"Connected to Qdrant at {settings.QDRANT_URL}")
+        # AsyncQdrantClient keeps vector I/O off the event loop. The REST transport
+        # shares one pooled httpx client; gRPC is used instead when preferred.
+        self.client = AsyncQdrantClient(
+            url=settings.QDRANT_URL,
+            prefer_grpc=settings.QDRANT_PREFER_GRPC,
+            grpc_port=settings.QDRANT_GRPC_PORT,
+            timeout=int(settings.QDRANT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.QDRANT_POOL_SIZE,
+                max_keepalive_connections=settings.QDRANT_POOL_SIZE,
+            ),
+        )
+        transport = "gRPC" if settings.QDRANT_PREFER_GRPC else "REST"
+        print(f"Connected to Qdrant at {settings.QDRANT_URL} ({transport})")
+
+    async def close(self):
+        if self.client:
+            await self.client.close()
+            print("Closed Qdrant connection")
+
+    async def _call(self, coro, timeout: Optional[float]):
+        return await asyncio.wait_for(coro, timeout or settings.QDRANT_TIMEOUT)
+
+    async def ensure_collection(self, vector_size: int = 384):
+        """Create the documents collection (dense + BM25 sparse) if needed."""
+        if self._collection_ready:
+            return
+        try:
+            await self._call(
+                self.client.create_collection(
+                    collection_name=COLLECTION_NAME,
+                    vectors_config=models.VectorParams(
+                        size=vector_size, distance=models.Distance.COSINE
+                    ),
+                    sparse_vectors_config={
+                        SPARSE_VECTOR_NAME: models.SparseVectorParams()
+                    },
+                ),
+                None,
+            )
+        except Exception as e:
+            if "already exists" not in str(e):
+                return  # Let the following upsert surface the real error
+            info = await self._call(self.client.get_collection(COLLECTION_NAME), None)
+            sparse = info.config.params.sparse_vectors or {}
+            self.sparse_enabled = SPARSE_VECTOR_NAME in sparse
+            if not self.sparse_enabled:
+                print(
+                    f"Qdrant collection '{COLLECTION_NAME}' has no "
+                    f"'{SPARSE_VECTOR_NAME}' sparse vector; "
+                    "lexical indexing disabled until it is recreated"
+                )
+        else:
+            self.sparse_enabled = True
+        self._collection_ready = True
+
+    async def search(
+        self,
+        query_vector: Union[List[float], models.NamedSparseVector],
+        query_filter: Optional[models.Filter] = None,
+        limit: int = 4,
+        timeout: Optional[float] = None,
+        **kwargs: Any,
+    ) -> List[models.ScoredPoint]:
+        return await self._call(
+            self.client.search(
+                collection_name=COLLECTION_NAME,
+                query_vector=query_vector,
+                query_filter=query_filter,
+                limit=limit,
+                **kwargs,
+            ),
+            timeout or settings.QDRANT_SEARCH_TIMEOUT,
+        )
+
+    async def upsert(
+        self, points: List[models.PointStruct], timeout: Optional[float] = None
+    ):
+        return await self._call(
+            self.client.upsert(collection_name=COLLECTION_NAME, points=points),
+            timeout or settings.QDRANT_UPSERT_TIMEOUT,
+        )
+
+    async def delete(
+        self, points_selector: Any, timeout: Optional[float] = None
+    ):
+        return await self._call(
+            self.client.delete(
+                collection_name=COLLECTION_NAME, points_selector=points_selector
+            ),
+            timeout,
+        )
+
+    async def delete_points(self, ids: List[str], timeout: Optional[float] = None):
+        return await self.delete(models.PointIdsList(points=ids), timeout=timeout)
+
+    async def retrieve(
+        self,
+        ids: List[str],
+        with_vectors: Any = False,
+        timeout: Optional[float] = None,
+    ) -> List[models.Record]:
+        return await self._call(
+            self.client.retrieve(
+                collection_name=COLLECTION_NAME,
+                ids=ids,
+                with_payload=False,
+                with_vectors=with_vectors,
+            ),
+            timeout,
+        )
+
+    async def set_payloads(
+        self, payloads: Dict[str, Dict[str, Any]], timeout: Optional[float] = None
+    ):
+        """Merge a different payload update into each point, in one request."""
+        if not payloads:
+            return
+        return await self._call(
+            self.client.batch_update_points(
+                collection_name=COLLECTION_NAME,
+                update_operations=[
+                    models.SetPayloadOperation(
+                        set_payload=models.SetPayload(
+                            payload=payload, points=[point_id]
+                        )
+                    )
+                    for point_id, payload in payloads.items()
+                ],
+            ),
+            timeout or settings.QDRANT_UPSERT_TIMEOUT,
+        )
+
+    async def delete_document_points(
+        self, doc_id: str, timeout: Optional[float] = None
+    ):
+        """Remove every chunk vector that belongs to one document."""
+        return await self.delete(
+            models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="doc_id", match=models.MatchValue(value=doc_id)
+                        )
+                    ]
+                )
+            ),
+            timeout=timeout,
+        )
+
+    async def scroll_document_points(
+        self,
+        doc_id: str,
+        with_vectors: Any = False,
+        offset: Any = None,
+        limit: int = 256,
+        timeout: Optional[float] = None,
+        with_payload: Any = False,
+    ) -> Tuple[List[models.Record], Any]:
+        return await self._call(
+            self.client.scroll(
+                collection_name=COLLECTION_NAME,
+                scroll_filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="doc_id", match=models.MatchValue(value=doc_id)
+                        )
+                    ]
+                ),
+                with_payload=with_payload,
+                with_vectors=with_vectors,
+                offset=offset,
+                limit=limit,
+            ),
+            timeout,
+        )
 
 
 qdrant_db = QdrantDB()
@@ -1,13 +1,26 @@
+import asyncio
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from app.api.endpoints import auth, chats, ingestion, websockets
+from app.core import auth_cache, background
 from app.core.config import settings
-
-
+from app.db.indexes import ensure_schema
 from app.db.mongodb import mongo_db
 from app.db.qdrant import qdrant_db
+from app.services import cache_invalidation
+from app.services.cpu_pool import cpu_pool
+from app.services.embedding_service import embedding_service
+from app.services.history_store import history_store
+from app.services.llm_client import llm_gateway
+from app.services.prompt_builder import load_tokenizer
+from app.services.reranker import reranker
+from app.services.response_cache import response_cache
+from app.websockets.connection_manager import manager
+from app.worker import IngestionWorker
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -15,10 +28,29 @@ async def lifespan(app: FastAPI):
     print("Starting up AI Document Platform...")
     mongo_db.connect()
     qdrant_db.connect()
+    await ensure_schema()
+    await manager.start(on_event=cache_invalidation.on_event)
+    # Token counts are estimated until the tokenizer has loaded
+    asyncio.get_running_loop().run_in_executor(None, load_tokenizer)
+
+    # Dev/single-node mode, opt-in: set INGESTION_EMBEDDED_WORKERS to run
+    # ingestion jobs in this process instead of in `python -m app.worker`.
+    worker = None
+    if settings.INGESTION_EMBEDDED_WORKERS > 0:
+        worker = IngestionWorker(settings.INGESTION_EMBEDDED_WORKERS)
+        worker.start()
     yield
     # Shutdown: Close connections
     print("Shutting down...")
+    if worker:
+        await worker.stop()
+    await background.drain()
+    await llm_gateway.close()
+    await manager.close()
+    await embedding_service.close()
+    cpu_pool.shutdown()
     mongo_db.close()
+    await qdrant_db.close()
 
 
 app = FastAPI(
@@ -31,15 +63,17 @@ app = FastAPI(
 if settings.BACKEND_CORS_ORIGINS:
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=["http://localhost:3000", "http://127.0.0.1:3000", "http://localhost:8000"],
+        allow_origins=[
+            "http://localhost:3000",
+            "http://127.0.0.1:3000",
+            "http://localhost:8000",
+        ],
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],  # Pagination cursor (app/api/pagination.py)
     )
 
-from app.api.api import api_router
-from app.api.endpoints import auth, ingestion, websockets, chats
-
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(ingestion.router, prefix="/api/v1/ingestion", tags=["ingestion"])
 app.include_router(chats.router, prefix="/api/v1/chats", tags=["chats"])
@@ -54,3 +88,15 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
+
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "embedding": embedding_service.stats(),
+        "response_cache": response_cache.stats(),
+        "reranker": reranker.stats(),
+        "llm": llm_gateway.stats(),
+        "auth": auth_cache.stats(),
+        "history": history_store.stats(),
+    }
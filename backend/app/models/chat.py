@@ -1,7 +1,8 @@
 from datetime import datetime
-from typing import Optional, List, Annotated
-from pydantic import BaseModel, Field, BeforeValidator, ConfigDict
+from typing import Annotated, List, Optional
+
 from bson import ObjectId
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field
 
 # Helper to automatically convert ObjectId to string
 PyObjectId = Annotated[str, BeforeValidator(str)]
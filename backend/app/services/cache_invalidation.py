@@ -0,0 +1,46 @@
+"""
+Cache invalidation across processes.
+
+The response and auth caches live in the memory of each API process, while
+a user's corpus also changes in ingestion workers, and their profile on
+whichever API process handled the change. Invalidations are applied to this
+process's caches and published as broadcast events
+(app/websockets/broadcast.py), which every API process applies to its own.
+Applying an event twice is harmless.
+"""
+import json
+import time
+from typing import Any, Dict
+
+from app.core import auth_cache
+from app.services.response_cache import response_cache
+from app.websockets.connection_manager import manager
+
+INVALIDATE_RESPONSES = "invalidate_responses"
+INVALIDATE_USER = "invalidate_user"
+
+
+def _apply(event: Dict[str, Any]):
+    if event.get("type") == INVALIDATE_RESPONSES:
+        response_cache.invalidate_user(event["user_id"])
+    elif event.get("type") == INVALIDATE_USER:
+        auth_cache.invalidate_user(event["user_id"], at=event["at"])
+
+
+async def invalidate_responses(user_id: str):
+    """Called whenever the user's document set changes."""
+    event = {"type": INVALIDATE_RESPONSES, "user_id": user_id}
+    _apply(event)
+    await manager.publish_event(event)
+
+
+async def invalidate_user(user_id: str):
+    """Called when a user is changed or deactivated (see app/core/auth_cache.py)."""
+    event = {"type": INVALIDATE_USER, "user_id": user_id, "at": int(time.time())}
+    _apply(event)
+    await manager.publish_event(event)
+
+
+async def on_event(text: str):
+    """Applies events published by any process (passed to `manager.start`)."""
+    _apply(json.loads(text))
@@ -1,43 +1,113 @@
 import asyncio
+import logging
 import time
 from datetime import datetime
-import logging
-from typing import AsyncGenerator, Dict, List
+from typing import AsyncGenerator, Dict, List, Optional
 
-from qdrant_client.models import FieldCondition, Filter, MatchValue
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from qdrant_client.models import FieldCondition, Filter, MatchValue, NamedSparseVector
 
-from app.db.qdrant import qdrant_db
-from app.services.ingestion_service import get_embedding_model
-from app.services.llm_client import groq_client
+from app.core import background
 from app.core.config import settings
+from app.db.mongodb import mongo_db
+from app.db.qdrant import SPARSE_VECTOR_NAME, qdrant_db
+from app.services import lexical_index, session_memory
+from app.services.embedding_service import embedding_service
+from app.services.history_store import history_store
+from app.services.llm_client import llm_gateway
+from app.services.prompt_builder import assemble_prompt
+from app.services.reranker import drop_near_duplicates, reranker
+from app.services.response_cache import (
+    fingerprint_chunks,
+    fingerprint_conversation,
+    response_cache,
+)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from bson import ObjectId
-from app.db.mongodb import mongo_db
-
 # Removed in-memory chat_sessions as we now use MongoDB persistence
 
-async def retrieve_context(query: str, user_id: str, limit: int = 4) -> List[Dict]:
-    model = get_embedding_model()
-    # Run blocking encode in thread pool
-    query_vector = await asyncio.to_thread(model.encode, query)
-    query_vector = query_vector.tolist()
-
+async def _dense_search(
+    query_vector: List[float], user_filter: Filter, limit: int, with_vectors: bool
+):
     try:
-        hits = qdrant_db.client.search(
-            collection_name="documents",
+        return await qdrant_db.search(
             query_vector=query_vector,
-            query_filter=Filter(
-                must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))]
-            ),
+            query_filter=user_filter,
             limit=limit,
+            with_vectors=with_vectors,
         )
     except Exception as e:
         logger.warning(f"Qdrant search failed: {e}")
         return []
 
+
+async def _lexical_search(
+    query: str, user_id: str, user_filter: Filter, limit: int, with_vectors: bool
+):
+    try:
+        sparse = await lexical_index.query_sparse_vector(query, user_id)
+        if sparse is None:
+            return []
+        return await qdrant_db.search(
+            query_vector=NamedSparseVector(name=SPARSE_VECTOR_NAME, vector=sparse),
+            query_filter=user_filter,
+            limit=limit,
+            with_vectors=with_vectors,
+        )
+    except Exception as e:
+        logger.warning(f"Lexical search failed: {e}")
+        return []
+
+
+def _dense_vector(hit) -> Optional[List[float]]:
+    vector = hit.vector
+    if isinstance(vector, dict):  # Named vectors: dense one is unnamed ("")
+        vector = vector.get("")
+    return vector
+
+
+async def retrieve_context(query: str, user_id: str, limit: int = 4) -> List[Dict]:
+    # Coalesced with concurrent queries into one forward pass
+    query_vector = await embedding_service.encode_query(query)
+    query_vector = query_vector.tolist()
+
+    user_filter = Filter(
+        must=[FieldCondition(key="user_id", match=MatchValue(value=user_id))]
+    )
+    # Two-stage mode over-fetches candidates (with vectors, for de-duplication)
+    # and lets the cross-encoder pick the final `limit`.
+    two_stage = reranker.enabled
+    first_stage = max(settings.RERANK_CANDIDATES, limit) if two_stage else limit
+    if settings.HYBRID_SEARCH_ENABLED:
+        # Dense and BM25 searches run in parallel, merged by reciprocal rank fusion
+        candidates = max(settings.HYBRID_CANDIDATES, first_stage)
+        dense_hits, lexical_hits = await asyncio.gather(
+            _dense_search(query_vector, user_filter, candidates, two_stage),
+            _lexical_search(query, user_id, user_filter, candidates, two_stage),
+        )
+        fused = lexical_index.reciprocal_rank_fusion(
+            [
+                (dense_hits, settings.HYBRID_DENSE_WEIGHT),
+                (lexical_hits, settings.HYBRID_LEXICAL_WEIGHT),
+            ],
+            k=settings.HYBRID_RRF_K,
+        )[:first_stage]
+    else:
+        dense_hits = await _dense_search(
+            query_vector, user_filter, first_stage, two_stage
+        )
+        lexical_hits = []
+        fused = [(hit, hit.score) for hit in dense_hits]
+
+    # Keep the cosine score where we have one; lexical-only hits have none
+    dense_scores = {str(h.id): h.score for h in dense_hits}
+    lexical_ids = {str(h.id) for h in lexical_hits}
+    hits = [hit for hit, _ in fused]
+    fused_scores = {str(hit.id): score for hit, score in fused}
+
     results = []
     logger.info(f"Query: '{query}' for User: {user_id}")
     
@@ -58,113 +128,203 @@ async def retrieve_context(query: str, user_id: str, limit: int = 4) -> List[Dic
         
         filename = filename or "Unknown Document"
         
-        logger.info(f" - Hit: {filename} (Score: {hit.score:.4f}): {hit.payload.get('text', '')[:50]}...")
+        chunk_id = str(hit.id)
+        score = dense_scores.get(chunk_id, 0.0)
+        logger.info(
+            f" - Hit: {filename} (Score: {score:.4f}, "
+            f"Fused: {fused_scores[chunk_id]:.4f}): "
+            f"{hit.payload.get('text', '')[:50]}..."
+        )
         results.append(
             {
                 "text": hit.payload.get("text", ""),
                 "metadata": {
+                    "chunk_id": chunk_id,
                     "doc_id": doc_id, 
                     "filename": filename,
-                    "score": hit.score
+                    "score": score,
+                    "fused_score": fused_scores[chunk_id],
+                    "lexical_match": chunk_id in lexical_ids,
                 },
             }
         )
+
+    if two_stage:
+        vectors = [_dense_vector(hit) for hit in hits]
+        results = drop_near_duplicates(
+            results, vectors, settings.RERANK_DEDUP_SIMILARITY
+        )
+        results = await reranker.rerank(query, results, top_n=limit)
     return results
 
 
-def build_prompt(query: str, context_chunks: List[Dict], history: List[Dict[str, str]] = None) -> str:
-    # Format History
-    history_text = ""
-    if history:
-        history_text = "\n".join([f"{m['role'].capitalize()}: {m['content']}" for m in history[-8:]]) # Last 8 turns
+class _TurnTimer:
+    """Per-stage wall-clock timings of one chat turn, in milliseconds."""
 
-    if not context_chunks:
-        return f"""You are 'Infinity', a highly advanced and elegant AI intelligence. 
-Your tone is sophisticated, direct, and slightly futuristic. 
-You are currently helping a user within their private intelligent workspace.
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
 
-The user's query did not match any specific knowledge base documents. 
-Answer conversationally and with high-level intellect, using the provided history as your only context. 
-Avoid saying "I don't know" if the history allows for a meaningful logical inference.
+    async def timed(self, stage: str, awaitable):
+        started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.stages[stage] = round((time.perf_counter() - started) * 1000, 1)
 
-Conversation History:
-{history_text}
+    def mark(self, stage: str):
+        """Time from the start of the turn to now."""
+        self.stages[stage] = round((time.perf_counter() - self.started) * 1000, 1)
 
-Query: {query}
-Infinity:"""
 
-    context_text = "\n\n".join(
-        [f"[Document: {c['metadata']['filename']}]: {c['text']}" for c in context_chunks]
-    )
+async def _load_history(session_id: Optional[str], before: datetime):
+    if not session_id:
+        return "", []
+    return await session_memory.load_history(session_id, before=before)
 
-    prompt = f"""You are 'Infinity', a premier AI intelligence integrated into this private workspace.
-Your primary directive is to provide elegant, precise, and highly intelligent insights based on the user's uploaded knowledge and conversation history.
 
-Guidelines:
-1. FLUIDITY OVER FORMALITY: Speak like a human expert, not a search engine. Integrate document facts seamlessly into your narrative without always roboticly citing "According to...".
-2. SEAMLESS KNOWLEDGE: Use the provided Context to construct your reality. If the information is there, state it as a fact. 
-3. CITATION ETIQUETTE: Mention document names ONLY if it adds necessary weight to an answer, or if you are comparing information from multiple sources.
-4. CONTEXTUAL MEMORY: Heavily rely on the Conversation History to maintain the "flow" of deep thought.
-5. NO REPETITION: Do not repeat phrases like "Based on the information provided" or "I can answer based on history". Just speak.
+async def _insert_message(db, message: Dict):
+    """
+    Idempotent insert: messages carry a client-generated _id, so an attempt
+    retried after a lost reply cannot store the message twice.
+    """
+    try:
+        await db.chat_messages.insert_one(dict(message))
+    except DuplicateKeyError:
+        pass  # An earlier attempt went through
+
 
-Contextual Data:
-{context_text}
+async def _save_user_message(db, session_id: str, user_msg: Dict):
+    await background.with_retries(lambda: _insert_message(db, user_msg))
+    # Update session last activity (retried on its own)
+    await background.with_retries(
+        lambda: db.chat_sessions.update_one(
+            {"_id": ObjectId(session_id)},
+            {"$set": {"updated_at": datetime.utcnow()}}
+        )
+    )
 
-Conversation History:
-{history_text}
 
-User Query: {query}
-Infinity:"""
-    return prompt
+async def _finish_turn(
+    db, session_id: str, user_write: asyncio.Task, assistant_msg: Dict
+):
+    # The assistant message and the summary must not overtake the user message
+    await asyncio.gather(user_write, return_exceptions=True)
+    await background.with_retries(lambda: _insert_message(db, assistant_msg))
+    # Fold older turns into the session summary
+    await session_memory.maybe_summarize(session_id)
 
 
-async def chat_stream(query: str, user_id: str, session_id: str = None) -> AsyncGenerator[str, None]:
-    db = mongo_db.db
-    
-    # 1. Load History from MongoDB
-    history = []
-    if session_id:
-        cursor = db.chat_messages.find({"session_id": session_id}).sort("timestamp", 1).limit(20)
-        async for msg in cursor:
-            history.append({"role": msg["role"], "content": msg["content"]})
-    
-    # 2. Retrieve Context
-    context = await retrieve_context(query, user_id)
-    # Be more lenient with score to show sources if any exist
-    valid_context = [c for c in context if c["metadata"]["score"] > 0.20]
+async def _generate_title(db, session_id: str, query: str):
+    title_prompt = f"Summarize this user question into a 3-5 word title: {query}"
+    try:
+        title = await llm_gateway.generate_completion(
+            settings.GROQ_MODEL, title_prompt, max_tokens=32
+        )
+        title = title.strip().strip('"').strip("'")
+        await db.chat_sessions.update_one(
+            {"_id": ObjectId(session_id)},
+            {"$set": {"title": title}}
+        )
+    except Exception as e:
+        logger.warning(f"Auto-title failed for session {session_id}: {e}")
 
-    # 3. Build Prompt with History
-    prompt = build_prompt(query, valid_context, history)
 
-    # 4. Stream Response
-    logger.info(f"[{datetime.utcnow().isoformat()}] User: {user_id} | Session: {session_id} | Prompting LLM. History: {len(history)}")
-    
-    full_response = []
+async def chat_stream(
+    query: str, user_id: str, session_id: str = None
+) -> AsyncGenerator[str, None]:
+    db = mongo_db.db
+    timer = _TurnTimer()
+    # Millisecond precision, as stored by MongoDB, so `$lt` excludes this turn
+    turn_started = datetime.utcnow()
+    turn_started = turn_started.replace(
+        microsecond=turn_started.microsecond // 1000 * 1000
+    )
 
-    try:
-        # Save User Message
+    # 1. Persist the user message right away, off the critical path
+    user_write = None
+    if session_id:
         user_msg = {
+            "_id": ObjectId(),
             "session_id": session_id,
             "user_id": user_id,
             "role": "user",
             "content": query,
-            "timestamp": datetime.utcnow()
+            "timestamp": turn_started
         }
-        if session_id:
-            await db.chat_messages.insert_one(user_msg)
-            # Update session last activity
-            await db.chat_sessions.update_one(
-                {"_id": ObjectId(session_id)},
-                {"$set": {"updated_at": datetime.utcnow()}}
+        history_store.append(session_id, user_msg)
+        user_write = background.spawn(
+            _save_user_message(db, session_id, user_msg),
+            name=f"save-user-{session_id}",
+        )
+
+    # 2. Load History (rolling summary + unsummarized tail) and Retrieve Context
+    # in parallel
+    (summary, history), context = await asyncio.gather(
+        timer.timed("history", _load_history(session_id, turn_started)),
+        timer.timed("retrieval", retrieve_context(query, user_id)),
+    )
+    # Auto-title generation for the first message of a session
+    if session_id and len(history) == 0 and not summary:
+        background.spawn(_generate_title(db, session_id, query))
+
+    # Be more lenient with score to show sources if any exist
+    # (exact-term BM25 matches are kept even when their cosine score is low)
+    valid_context = [
+        c for c in context
+        if c["metadata"]["score"] > 0.20 or c["metadata"]["lexical_match"]
+    ]
+
+    # 3. Semantic response cache (opt-in): same user, similar query, same chunks,
+    # same conversation so far (a follow-up like "and the second one?" means
+    # something else in every session)
+    query_vector = None
+    fingerprint = None
+    cached_response = None
+    if response_cache.enabled and valid_context:
+        query_vector = await embedding_service.encode_query(query)  # query-cache hit
+        fingerprint = ":".join(
+            (
+                fingerprint_chunks(c["metadata"]["chunk_id"] for c in valid_context),
+                fingerprint_conversation(summary, history),
             )
+        )
+        cached_response = response_cache.lookup(user_id, query_vector, fingerprint)
 
-        async for token in groq_client.generate_stream(settings.GROQ_MODEL, prompt):
+    # 4. Build Prompt with History (fitted to the token budget)
+    prompt, usage = assemble_prompt(query, valid_context, history, summary=summary)
+    timer.mark("prompt_ready")
+    logger.info(f"Prompt tokens: {usage.as_dict()}")
+
+    # 5. Stream Response
+    logger.info(
+        f"[{datetime.utcnow().isoformat()}] User: {user_id} | Session: {session_id}"
+        f" | Prompting LLM. History: {len(history)}"
+        f" | Cached: {cached_response is not None}"
+    )
+    
+    full_response = []
+    stream = None
+
+    try:
+        if cached_response is not None:
+            stream = response_cache.replay(cached_response)
+        else:
+            stream = llm_gateway.generate_stream(settings.GROQ_MODEL, prompt)
+
+        async for token in stream:
+            if not full_response:
+                timer.mark("first_token")
             full_response.append(token)
             yield token
-            
-        # 5. Save Assistant Message
+        timer.mark("last_token")
+
+        # 6. Save Assistant Message (after the user message lands)
         response_text = "".join(full_response)
+        if fingerprint and cached_response is None:
+            response_cache.store(user_id, query_vector, fingerprint, response_text)
         assistant_msg = {
+            "_id": ObjectId(),
             "session_id": session_id,
             "user_id": user_id,
             "role": "assistant",
@@ -172,21 +332,14 @@ async def chat_stream(query: str, user_id: str, session_id: str = None) -> Async
             "timestamp": datetime.utcnow()
         }
         if session_id:
-            await db.chat_messages.insert_one(assistant_msg)
-            
-            # Auto-title generation for first message
-            if len(history) == 0:
-                title_prompt = f"Summarize this user question into a 3-5 word title: {query}"
-                try:
-                    title = await groq_client.generate_completion(settings.GROQ_MODEL, title_prompt)
-                    title = title.strip().strip('"').strip("'")
-                    await db.chat_sessions.update_one(
-                        {"_id": ObjectId(session_id)},
-                        {"$set": {"title": title}}
-                    )
-                except Exception:
-                    pass
+            history_store.append(session_id, assistant_msg)
+            background.spawn(_finish_turn(db, session_id, user_write, assistant_msg))
 
     except Exception as e:
         logger.error(f"LLM Error during stream: {e}")
         yield f"\n[System Error: {e}]"
+    finally:
+        if stream is not None:
+            # Closing early (client gone or cancelled) releases the LLM stream now
+            await stream.aclose()
+        logger.info(f"Turn timings (ms) for session {session_id}: {timer.stages}")
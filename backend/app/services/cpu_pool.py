@@ -0,0 +1,124 @@
+"""
+Process-pool execution for CPU-heavy ingestion stages.
+
+With INGESTION_EXECUTION_MODE=process, bulk embedding and HTML-to-text
+extraction run in a pool of worker processes instead of threads of the API
+process, so they do not compete with request handling for the GIL. Each worker
+loads the embedding model once (in the pool initializer). Embedding results come
+back through shared memory rather than as pickled lists.
+"""
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+
+def _pool_size() -> int:
+    return settings.INGESTION_PROCESS_WORKERS or max(1, (os.cpu_count() or 2) - 1)
+
+
+def _init_worker(threads_per_worker: int):
+    """Runs once in every pool process."""
+    try:
+        import torch
+
+        # Avoid N processes x all-cores threads oversubscribing the CPU
+        torch.set_num_threads(threads_per_worker)
+    except ImportError:
+        pass
+    from app.services.embedding_service import get_embedding_model
+
+    get_embedding_model()
+
+
+def _encode_to_shared_memory(texts: List[str]) -> Tuple[str, Tuple[int, ...], str]:
+    from app.services.embedding_service import get_embedding_model
+
+    vectors = np.ascontiguousarray(get_embedding_model().encode(texts))
+    shm = shared_memory.SharedMemory(create=True, size=max(vectors.nbytes, 1))
+    np.ndarray(vectors.shape, dtype=vectors.dtype, buffer=shm.buf)[:] = vectors
+    shm.close()  # The parent attaches by name and unlinks it
+    return shm.name, vectors.shape, vectors.dtype.str
+
+
+def html_to_text(html: str) -> str:
+    """Strip markup from a scraped page and normalize its whitespace."""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+
+    # Remove script and style elements
+    for script in soup(["script", "style"]):
+        script.decompose()
+
+    # Get text
+    text = soup.get_text()
+
+    # Break into lines and remove leading and trailing whitespace
+    lines = (line.strip() for line in text.splitlines())
+    # Break multi-headlines into a line each
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    # Drop blank lines
+    return "\n".join(chunk for chunk in chunks if chunk)
+
+
+def html_to_chunks(html: str, chunk_size: int) -> List[str]:
+    """Extract text and slice it into fixed-width chunks in one pool round trip."""
+    text = html_to_text(html)
+    return [text[i : i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+
+class CPUPool:
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.INGESTION_EXECUTION_MODE == "process"
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            workers = _pool_size()
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                # spawn: torch and forked event loops do not mix
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads,),
+            )
+            print(f"Started CPU pool with {workers} processes")
+        return self._executor
+
+    async def run(self, fn, *args):
+        """Run `fn(*args)` in the pool when enabled, else in a thread."""
+        if not self.enabled:
+            return await asyncio.to_thread(fn, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), fn, *args)
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        name, shape, dtype = await loop.run_in_executor(
+            self._get_executor(), _encode_to_shared_memory, texts
+        )
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            return np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+cpu_pool = CPUPool()
@@ -0,0 +1,478 @@
+import asyncio
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n?!.,;:"
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form used as cache key: case, spacing and trailing '?' don't matter."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return _WHITESPACE.sub(" ", text).strip(_EDGE_PUNCTUATION)
+
+
+class _SqliteBackend:
+    """
+    Local-file second tier shared by every uvicorn worker on the host.
+    WAL mode lets readers in other processes proceed while one of them writes.
+
+    The connection is only used from one dedicated thread: a commit can wait
+    up to `timeout` for another process's write lock, which must not stall
+    the event loop.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._puts = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="query-cache"
+        )
+        self.conn = sqlite3.connect(path, timeout=1.0, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            "key TEXT PRIMARY KEY, expires REAL, dtype TEXT, vec BLOB)"
+        )
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self.conn.execute(
+            "SELECT expires, dtype, vec FROM query_embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[0] < time.time():
+            return None
+        return np.frombuffer(row[2], dtype=row[1])
+
+    def put(self, key: str, vector: np.ndarray, expires: float):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+            (key, expires, vector.dtype.str, vector.tobytes()),
+        )
+        self._puts += 1
+        if self._puts % 500 == 0:
+            self._evict()
+        self.conn.commit()
+
+    def _evict(self):
+        self.conn.execute(
+            "DELETE FROM query_embeddings WHERE expires < ?", (time.time(),)
+        )
+        # Keep only the entries that expire last (i.e. were written most recently)
+        self.conn.execute(
+            "DELETE FROM query_embeddings WHERE key NOT IN ("
+            "SELECT key FROM query_embeddings ORDER BY expires DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    async def run(self, fn, *args):
+        """Runs fn on the tier's thread; None if sqlite fails (best-effort)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._quietly, fn, *args)
+
+    def submit(self, fn, *args):
+        """Queues fn on the tier's thread without waiting (write-behind)."""
+        self._executor.submit(self._quietly, fn, *args)
+
+    @staticmethod
+    def _quietly(fn, *args):
+        try:
+            return fn(*args)
+        except sqlite3.Error:
+            return None  # e.g. locked by another writer for longer than timeout
+
+    def close(self):
+        self._executor.shutdown(wait=True)  # Lets queued writes land
+        self.conn.close()
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU of query embeddings keyed by normalized query text.
+
+    Entries expire after a TTL and the cache is capped both by entry count and
+    by total vector bytes. Vectors can be stored as float16 to halve memory.
+    An optional sqlite file backs the in-process tier so workers share hits;
+    it is read by `aget` and written behind by `put`, off the event loop.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        max_bytes: int,
+        ttl_seconds: float,
+        use_float16: bool = False,
+        path: str = "",
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.dtype = np.float16 if use_float16 else np.float32
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._bytes = 0
+        self._shared = _SqliteBackend(path, max_entries) if path else None
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(text: str) -> str:
+        raw = f"{settings.EMBEDDING_MODEL}\0{normalize_query(text)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """In-process tier only."""
+        vector = self._get_local(self._key(text))
+        if vector is None:
+            self.misses += 1
+        return vector
+
+    async def aget(self, text: str) -> Optional[np.ndarray]:
+        """In-process tier, then the shared tier (read on its own thread)."""
+        key = self._key(text)
+        vector = self._get_local(key)
+        if vector is not None:
+            return vector
+        if self._shared is not None:
+            vector = await self._shared.run(self._shared.get, key)
+            if vector is not None:
+                self.shared_hits += 1
+                self._store(key, vector)
+                return vector.astype(np.float32)
+        self.misses += 1
+        return None
+
+    def _get_local(self, key: str) -> Optional[np.ndarray]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        vector, expires = entry
+        if expires < time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return vector.astype(np.float32)
+
+    def put(self, text: str, vector: np.ndarray):
+        key = self._key(text)
+        vector = np.asarray(vector, dtype=self.dtype)
+        expires = self._store(key, vector)
+        if self._shared is not None:
+            self._shared.submit(self._shared.put, key, vector, expires)
+
+    def _store(self, key: str, vector: np.ndarray) -> float:
+        if key in self._entries:
+            self._remove(key)
+        expires = time.time() + self.ttl_seconds
+        self._entries[key] = (vector, expires)
+        self._bytes += vector.nbytes
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+        return expires
+
+    def _remove(self, key: str):
+        vector, _ = self._entries.pop(key)
+        self._bytes -= vector.nbytes
+
+    def close(self):
+        if self._shared is not None:
+            self._shared.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+        }
+
+
+class ChunkEmbeddingStore:
+    """
+    Persistent embeddings of ingested chunk texts, keyed by model + text hash.
+
+    Vectors live in fixed-size slots of a memory-mapped file, and a sqlite
+    index (WAL) maps keys to slots and tracks when each was last used. Every
+    process on the host maps the same file, so lookups read straight from the
+    shared page cache. When all slots are taken, the least recently used
+    CHUNK_CACHE_COMPACT_FRACTION of the entries is dropped and their slots
+    are reused. Each slot carries a tag derived from its key, cleared while
+    the vector is rewritten, so a reader never accepts a recycled slot.
+
+    The capacity is fixed when the files are created (from max_bytes and the
+    model's dimension); delete the directory to resize the cache.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        use_float16: bool = False,
+        model: str = "",
+    ):
+        self.model = model or settings.EMBEDDING_MODEL
+        self.max_bytes = max_bytes
+        self.dtype = np.float16 if use_float16 else np.float32
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", self.model)
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, f"{slug}.vectors")
+        self.conn = sqlite3.connect(
+            os.path.join(directory, f"{slug}.index"),
+            timeout=5.0,
+            check_same_thread=False,
+            isolation_level=None,  # Transactions are explicit
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (dim INTEGER, dtype TEXT, "
+            "capacity INTEGER, next_slot INTEGER)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+            "key TEXT PRIMARY KEY, slot INTEGER UNIQUE, last_used REAL)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS chunk_embeddings_lru "
+            "ON chunk_embeddings (last_used)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS free_slots (slot INTEGER)")
+        self._lock = threading.Lock()
+        self._slots: Optional[np.memmap] = None
+        self.capacity = 0
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.evicted = 0
+
+    def _key(self, text: str) -> str:
+        raw = f"{self.model}\0{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _tag(key: str) -> int:
+        return int(key[:16], 16) | 1  # Never 0, which marks a slot being written
+
+    def _map(self, dim: int, dtype: str, capacity: int, create: bool):
+        record = np.dtype([("tag", "<u8"), ("vec", dtype, (dim,))])
+        self._slots = np.memmap(
+            self.vectors_path,
+            dtype=record,
+            mode="w+" if create else "r+",
+            shape=(capacity,),
+        )
+        self.capacity = capacity
+
+    def _mapped(self, dim: Optional[int] = None) -> bool:
+        """Map the slot file, creating it on the first write (dim known)."""
+        if self._slots is not None:
+            return True
+        row = self.conn.execute("SELECT dim, dtype, capacity FROM meta").fetchone()
+        if row is not None and os.path.exists(self.vectors_path):
+            self._map(*row, create=False)
+            return True
+        if dim is None:
+            return False
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT dim, dtype, capacity FROM meta").fetchone()
+            if row is not None and os.path.exists(self.vectors_path):
+                self._map(*row, create=False)
+            else:
+                # Missing or stale (the slot file was removed): start empty
+                dtype = np.dtype(self.dtype).str
+                record_bytes = 8 + dim * np.dtype(self.dtype).itemsize
+                capacity = max(1, self.max_bytes // record_bytes)
+                self._map(dim, dtype, capacity, create=True)
+                for table in ("meta", "chunk_embeddings", "free_slots"):
+                    self.conn.execute(f"DELETE FROM {table}")
+                self.conn.execute(
+                    "INSERT INTO meta VALUES (?, ?, ?, 0)", (dim, dtype, capacity)
+                )
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def _lookup(self, keys: List[str]) -> Dict[str, int]:
+        slots: Dict[str, int] = {}
+        for i in range(0, len(keys), 500):  # Stay under sqlite's variable limit
+            part = keys[i : i + 500]
+            slots.update(
+                self.conn.execute(
+                    "SELECT key, slot FROM chunk_embeddings WHERE key IN "
+                    f"({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+            )
+        return slots
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        Cached float32 vectors for `texts` (None where missing).
+
+        Each vector is copied out of its slot before the slot's tag is checked
+        again: a view would change under the caller once the slot is recycled.
+        """
+        found: List[Optional[np.ndarray]] = [None] * len(texts)
+        with self._lock:
+            try:
+                if not self._mapped():
+                    self.misses += len(texts)
+                    return found
+                keys = [self._key(text) for text in texts]
+                slots = self._lookup(keys)
+                used = []
+                for i, key in enumerate(keys):
+                    slot = slots.get(key)
+                    if slot is None:
+                        continue
+                    tag = self._tag(key)
+                    if self._slots["tag"][slot] != tag:
+                        continue
+                    vector = np.array(self._slots["vec"][slot], dtype=np.float32)
+                    if self._slots["tag"][slot] == tag:  # Not recycled meanwhile
+                        found[i] = vector
+                        used.append(key)
+                if used:
+                    now = time.time()
+                    self.conn.executemany(
+                        "UPDATE chunk_embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in used],
+                    )
+            except (sqlite3.Error, OSError, ValueError):
+                pass  # Best-effort: misses fall through to the encoder
+        hits = sum(vector is not None for vector in found)
+        self.hits += hits
+        self.misses += len(texts) - hits
+        return found
+
+    def _allocate(self, n: int) -> Tuple[List[int], List[int]]:
+        """
+        Free slots for `n` entries, plus the slots of entries evicted to make
+        room (inside a write transaction; the caller clears their tags once it
+        has committed).
+        """
+        next_slot = self.conn.execute("SELECT next_slot FROM meta").fetchone()[0]
+        slots = list(range(next_slot, min(self.capacity, next_slot + n)))
+        if slots:
+            self.conn.execute("UPDATE meta SET next_slot = ?", (slots[-1] + 1,))
+        if len(slots) < n:
+            reused = [
+                row[0]
+                for row in self.conn.execute(
+                    "SELECT slot FROM free_slots LIMIT ?", (n - len(slots),)
+                ).fetchall()
+            ]
+            self.conn.executemany(
+                "DELETE FROM free_slots WHERE slot = ?", [(s,) for s in reused]
+            )
+            slots += reused
+        if len(slots) < n:
+            # Compaction: drop the least recently used entries in one go
+            count = max(
+                n - len(slots),
+                int(self.capacity * settings.CHUNK_CACHE_COMPACT_FRACTION),
+            )
+            victims = self.conn.execute(
+                "SELECT key, slot FROM chunk_embeddings ORDER BY last_used LIMIT ?",
+                (count,),
+            ).fetchall()
+            self.conn.executemany(
+                "DELETE FROM chunk_embeddings WHERE key = ?",
+                [(key,) for key, _ in victims],
+            )
+            freed = [slot for _, slot in victims]
+            needed = n - len(slots)
+            slots += freed[:needed]
+            self.conn.executemany(
+                "INSERT INTO free_slots VALUES (?)", [(s,) for s in freed[needed:]]
+            )
+            return slots, freed
+        return slots, []
+
+    def put_many(self, texts: Sequence[str], vectors: np.ndarray):
+        with self._lock:
+            try:
+                if not self._mapped(dim=vectors.shape[1]):
+                    return
+                if vectors.shape[1] != self._slots["vec"].shape[1]:
+                    return  # Different model output; never mix dimensions
+                entries: Dict[str, np.ndarray] = {}
+                for text, vector in zip(texts, vectors):
+                    entries.setdefault(self._key(text), vector)
+                keys = list(entries)[: self.capacity]
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    present = self._lookup(keys)
+                    new = [key for key in keys if key not in present]
+                    slots, freed = self._allocate(len(new))
+                    now = time.time()
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO chunk_embeddings VALUES (?, ?, ?)",
+                        [(key, slot, now) for key, slot in zip(new, slots)],
+                    )
+                    self.conn.execute("COMMIT")
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    raise
+                # The slot file is only touched once the index change is
+                # durable, so a failed transaction leaves it as it was. Until
+                # the vectors land, the new rows point at slots whose tags do
+                # not match and read as misses. Entries whose write never
+                # landed (e.g. the process died here) are rewritten in place.
+                written = list(zip(new, slots))
+                written += [
+                    (key, slot)
+                    for key, slot in present.items()
+                    if self._slots["tag"][slot] != self._tag(key)
+                ]
+                self._slots["tag"][freed] = 0
+                for key, slot in written:
+                    self._slots["tag"][slot] = 0
+                    self._slots["vec"][slot] = entries[key]
+                    self._slots["tag"][slot] = self._tag(key)
+                self._slots.flush()
+                self.evicted += len(freed)
+                self.stored += len(new)
+            except (sqlite3.Error, OSError, ValueError):
+                pass  # Best-effort (e.g. locked by another writer)
+
+    def close(self):
+        with self._lock:
+            if self._slots is not None:
+                self._slots.flush()
+                self._slots = None
+            self.conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "evicted": self.evicted,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,233 @@
+import asyncio
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.cpu_pool import cpu_pool
+from app.services.embedding_cache import ChunkEmbeddingStore, QueryEmbeddingCache
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Global model instance
+_embedding_model = None
+
+
+def get_embedding_model():
+    global _embedding_model
+    from sentence_transformers import SentenceTransformer
+
+    if _embedding_model is None:
+        _embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
+    return _embedding_model
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    # Runs on the embedding thread, so the first call also loads the model there
+    return get_embedding_model().encode(texts)
+
+
+@dataclass(order=True)
+class _EncodeRequest:
+    priority: int
+    seq: int
+    texts: List[str] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.perf_counter)
+
+
+class EmbeddingService:
+    """
+    Single owner of the embedding model.
+
+    Chat and ingestion both submit encode requests here. A scheduler task drains
+    a priority queue, coalescing concurrent interactive queries into one forward
+    pass (waiting at most EMBEDDING_MAX_WAIT_MS for company), and runs bulk
+    ingestion batches only when no interactive work is pending.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._seq = itertools.count()
+        # One dedicated thread: forward passes are serialized instead of
+        # competing with each other on the default executor.
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="embedding"
+        )
+        self.query_cache = QueryEmbeddingCache(
+            max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+            max_bytes=settings.QUERY_CACHE_MAX_MB * 1024 * 1024,
+            ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS,
+            use_float16=settings.QUERY_CACHE_FLOAT16,
+            path=settings.QUERY_CACHE_PATH,
+        )
+        self.chunk_store: Optional[ChunkEmbeddingStore] = None
+        if settings.CHUNK_CACHE_ENABLED:
+            self.chunk_store = ChunkEmbeddingStore(
+                settings.CHUNK_CACHE_DIR
+                or os.path.join(tempfile.gettempdir(), "ai_doc_embeddings"),
+                max_bytes=settings.CHUNK_CACHE_MAX_MB * 1024 * 1024,
+                use_float16=settings.CHUNK_CACHE_FLOAT16,
+            )
+        self._batches = 0
+        self._encoded = 0
+        self._last_batch_size = 0
+        self._max_batch_size = 0
+        self._wait_ms_total = 0.0
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._executor.shutdown(wait=False)
+        self.query_cache.close()
+        if self.chunk_store is not None:
+            self.chunk_store.close()
+
+    async def _submit(self, texts: List[str], priority: int) -> np.ndarray:
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(
+            _EncodeRequest(priority, next(self._seq), texts, future)
+        )
+        return await future
+
+    async def encode_query(self, text: str) -> np.ndarray:
+        """Embed a single interactive query (chat retrieval)."""
+        cached = await self.query_cache.aget(text)
+        if cached is not None:
+            return cached
+        vectors = await self._submit([text], PRIORITY_INTERACTIVE)
+        self.query_cache.put(text, vectors[0])
+        return vectors[0]
+
+    async def encode_documents(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed ingestion chunks. Texts already in the persistent chunk store are
+        not re-encoded; the rest run at bulk priority, in bounded sub-batches.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        if self.chunk_store is None:
+            return await self._encode_bulk(texts)
+
+        vectors = await asyncio.to_thread(self.chunk_store.get_many, texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            encoded = await self._encode_bulk(missing_texts)
+            await asyncio.to_thread(self.chunk_store.put_many, missing_texts, encoded)
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+        return np.vstack(vectors)
+
+    async def _encode_bulk(self, texts: List[str]) -> np.ndarray:
+        size = settings.EMBEDDING_BULK_BATCH_SIZE
+        # Process mode: sub-batches run in parallel on the CPU pool, leaving this
+        # process's model to interactive queries.
+        encode = cpu_pool.encode if cpu_pool.enabled else (
+            lambda part: self._submit(part, PRIORITY_BULK)
+        )
+        parts = await asyncio.gather(
+            *[encode(texts[i : i + size]) for i in range(0, len(texts), size)]
+        )
+        return np.vstack(parts)
+
+    async def _collect_batch(self) -> List[_EncodeRequest]:
+        first = await self._queue.get()
+        batch = [first]
+        if first.priority != PRIORITY_INTERACTIVE:
+            # Bulk requests are already sized; run them alone so a queued
+            # query never waits behind more than one bulk forward pass.
+            return batch
+
+        max_items = settings.EMBEDDING_MAX_BATCH_SIZE
+        deadline = time.perf_counter() + settings.EMBEDDING_MAX_WAIT_MS / 1000
+        count = len(first.texts)
+        while count < max_items:
+            if not self._queue.empty():
+                nxt = self._queue.get_nowait()
+            else:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    nxt = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if nxt.priority != PRIORITY_INTERACTIVE:
+                self._queue.put_nowait(nxt)  # Leave bulk work for later
+                break
+            batch.append(nxt)
+            count += len(nxt.texts)
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect_batch()
+            batch = [r for r in batch if not r.future.cancelled()]
+            if not batch:
+                continue
+
+            texts = [t for r in batch for t in r.texts]
+            now = time.perf_counter()
+            self._wait_ms_total += sum((now - r.enqueued_at) * 1000 for r in batch)
+            try:
+                vectors = await loop.run_in_executor(self._executor, _encode, texts)
+            except Exception as e:
+                for r in batch:
+                    if not r.future.done():
+                        r.future.set_exception(e)
+                continue
+
+            self._batches += 1
+            self._encoded += len(batch)
+            self._last_batch_size = len(texts)
+            self._max_batch_size = max(self._max_batch_size, len(texts))
+
+            offset = 0
+            for r in batch:
+                n = len(r.texts)
+                if not r.future.done():
+                    r.future.set_result(vectors[offset : offset + n])
+                offset += n
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "batches": self._batches,
+            "requests": self._encoded,
+            "last_batch_size": self._last_batch_size,
+            "max_batch_size": self._max_batch_size,
+            "avg_requests_per_batch": (
+                self._encoded / self._batches if self._batches else 0.0
+            ),
+            "avg_queue_wait_ms": (
+                self._wait_ms_total / self._encoded if self._encoded else 0.0
+            ),
+            "query_cache": self.query_cache.stats(),
+            "chunk_cache": self.chunk_store.stats() if self.chunk_store else None,
+        }
+
+
+embedding_service = EmbeddingService()
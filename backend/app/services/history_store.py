@@ -0,0 +1,170 @@
+"""
+Recent-history access for chat turns.
+
+Each active session has an in-process ring buffer holding the session's
+rolling summary and its latest HISTORY_BUFFER_MESSAGES messages. A cold
+session is loaded with one reverse scan of the (session_id, timestamp, _id)
+index, projected to role/content/timestamp. After that, messages written by
+this process are appended as they are saved, so an active session reads
+MongoDB once per process. Entries expire after HISTORY_CACHE_TTL_SECONDS,
+which bounds staleness when another process writes to the same session.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from app.core.config import settings
+from app.db.mongodb import mongo_db
+
+MESSAGE_FIELDS = {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+
+
+@dataclass
+class SessionHistory:
+    summary: str = ""
+    summary_until: Optional[datetime] = None
+    messages: Deque[Dict] = field(default_factory=deque)
+    loaded_at: float = field(default_factory=time.monotonic)
+
+
+def _key(message: Dict) -> Tuple:
+    return (message["timestamp"], message["role"], message["content"])
+
+
+def _insert(messages: Deque[Dict], message: Dict):
+    """Keep timestamp order and skip duplicates (a load can race a write)."""
+    if any(_key(m) == _key(message) for m in messages):
+        return
+    if not messages or messages[-1]["timestamp"] <= message["timestamp"]:
+        messages.append(message)
+        return
+    ordered = sorted([*messages, message], key=lambda m: m["timestamp"])
+    messages.clear()
+    messages.extend(ordered[-messages.maxlen :])
+
+
+class HistoryStore:
+    def __init__(self):
+        self._sessions: "OrderedDict[str, SessionHistory]" = OrderedDict()
+        # Loads in flight (concurrent turns of a cold session share one) and
+        # the messages saved while they run
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._pending: Dict[str, List[Dict]] = {}
+        self.loads = 0
+        self.hits = 0
+
+    def _get(self, session_id: str) -> Optional[SessionHistory]:
+        history = self._sessions.get(session_id)
+        if history is None:
+            return None
+        if time.monotonic() - history.loaded_at > settings.HISTORY_CACHE_TTL_SECONDS:
+            del self._sessions[session_id]
+            return None
+        self._sessions.move_to_end(session_id)
+        return history
+
+    async def _load(self, session_id: str) -> SessionHistory:
+        try:
+            db = mongo_db.db
+            session = await db.chat_sessions.find_one(
+                {"_id": ObjectId(session_id)}, {"summary": 1, "summary_until": 1}
+            )
+            # Latest messages first, via a reverse walk of the index
+            latest = (
+                await db.chat_messages.find({"session_id": session_id}, MESSAGE_FIELDS)
+                .sort([("timestamp", -1), ("_id", -1)])
+                .limit(settings.HISTORY_BUFFER_MESSAGES)
+                .to_list(length=settings.HISTORY_BUFFER_MESSAGES)
+            )
+        finally:
+            pending = self._pending.pop(session_id, [])
+        history = SessionHistory(
+            summary=(session or {}).get("summary", ""),
+            summary_until=(session or {}).get("summary_until"),
+            messages=deque(reversed(latest), maxlen=settings.HISTORY_BUFFER_MESSAGES),
+        )
+        for message in pending:
+            _insert(history.messages, message)
+        self.loads += 1
+        self._sessions[session_id] = history
+        while len(self._sessions) > settings.HISTORY_CACHE_SESSIONS:
+            self._sessions.popitem(last=False)
+        return history
+
+    async def get(self, session_id: str) -> SessionHistory:
+        history = self._get(session_id)
+        if history is not None:
+            self.hits += 1
+            return history
+        return await asyncio.shield(self._start_load(session_id))
+
+    def _start_load(self, session_id: str) -> asyncio.Future:
+        loading = self._loading.get(session_id)
+        if loading is None:
+            # Registered before the load runs, so no append can fall between
+            self._pending[session_id] = []
+            loading = asyncio.ensure_future(self._load(session_id))
+            self._loading[session_id] = loading
+            loading.add_done_callback(lambda f: self._load_done(session_id, f))
+        return loading
+
+    def _load_done(self, session_id: str, loading: asyncio.Future):
+        self._loading.pop(session_id, None)
+        if not loading.cancelled():
+            loading.exception()  # Awaiting callers get it; appends do not wait
+
+    async def recent(
+        self, session_id: str, limit: int, before: Optional[datetime] = None
+    ) -> Tuple[str, List[Dict[str, str]]]:
+        """(summary, up to `limit` unsummarized messages oldest first)"""
+        history = await self.get(session_id)
+        messages = [
+            {"role": m["role"], "content": m["content"]}
+            for m in history.messages
+            if (history.summary_until is None or m["timestamp"] > history.summary_until)
+            and (before is None or m["timestamp"] < before)
+        ]
+        return history.summary, messages[-limit:]
+
+    def append(self, session_id: str, message: Dict):
+        """
+        Record a message saved by this process (role, content, timestamp). On
+        a cold session this starts the load, which merges the message in
+        whether or not its write has landed by the time the query runs.
+        """
+        timestamp = message["timestamp"]
+        entry = {
+            "role": message["role"],
+            "content": message["content"],
+            # As stored by MongoDB (milliseconds), so it matches loaded copies
+            "timestamp": timestamp.replace(
+                microsecond=timestamp.microsecond // 1000 * 1000
+            ),
+        }
+        history = self._get(session_id)
+        if history is not None:
+            _insert(history.messages, entry)
+        else:
+            self._start_load(session_id)
+        if session_id in self._pending:
+            self._pending[session_id].append(entry)
+
+    def set_summary(self, session_id: str, summary: str, summary_until: datetime):
+        history = self._sessions.get(session_id)
+        if history is not None:
+            history.summary = summary
+            history.summary_until = summary_until
+
+    def forget(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"sessions": len(self._sessions), "loads": self.loads, "hits": self.hits}
+
+
+history_store = HistoryStore()
@@ -0,0 +1,372 @@
+"""
+Staged, bounded-memory ingestion.
+
+    parse (incremental JSON) -> chunk (generator) -> embed (fixed batches)
+        -> upsert (bounded number in flight)
+
+Each stage pulls from the previous one through a small bounded buffer, so
+peak memory depends on the batch size, not on the document size. Batch
+ingestion `interleave`s the chunk streams of many documents into one
+`embed_and_upsert`, so small documents share embedding batches and upserts.
+"""
+import asyncio
+import hashlib
+import json
+import mimetypes
+import uuid
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+
+import httpx
+from qdrant_client.models import PointStruct
+
+from app.core.config import settings
+from app.db.qdrant import SPARSE_VECTOR_NAME, qdrant_db
+from app.services import lexical_index
+from app.services.cpu_pool import cpu_pool
+from app.services.embedding_service import embedding_service
+
+_END = object()
+
+# Point IDs are uuid5(doc_id, chunk hash, occurrence) in this namespace, so
+# re-ingesting a document maps unchanged chunks onto their existing points
+POINT_ID_NAMESPACE = uuid.UUID("5b0e6a0c-8f3e-4c1e-9d5a-2f7c1b6e4a90")
+
+
+@dataclass
+class Chunk:
+    text: str
+    payload: Dict[str, Any]
+    id: str = ""
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def point_id(doc_id: str, chunk_hash: str, occurrence: int = 0) -> str:
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{doc_id}:{chunk_hash}:{occurrence}"))
+
+
+async def iter_json_array(pieces: AsyncIterator[str]) -> AsyncIterator[Any]:
+    """Yield the items of a top-level JSON array as its text arrives."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    started = False
+    async for piece in pieces:
+        buf += piece
+        pos = 0
+        while True:
+            while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+                pos += 1
+            if pos >= len(buf):
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("Expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, pos_end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # Item not complete yet; wait for more text
+            yield item
+            pos = pos_end
+        buf = buf[pos:]
+    if buf.strip():
+        raise ValueError("Truncated JSON array")
+
+
+class DocumentError(Exception):
+    """The document itself cannot be parsed; retrying will not help."""
+
+
+# Client errors from the Unstructured API that are still worth retrying
+TRANSIENT_CLIENT_STATUS = {408, 429}
+
+
+async def stream_unstructured_elements(file_path: str) -> AsyncIterator[Dict]:
+    """
+    Post a file to the Unstructured API and yield elements as they are parsed.
+    Raises DocumentError when the API rejects the file (4xx), and ValueError
+    for malformed output. Transport errors and 5xx propagate as transient.
+    """
+    mime_type, _ = mimetypes.guess_type(file_path)
+    if not mime_type:
+        mime_type = "application/octet-stream"
+
+    api_url = f"{settings.UNSTRUCTURED_URL}/general/v0/general"
+
+    # Use 'fast' strategy to bypass slow layout analysis models (detectron2/OCR)
+    # This significantly speeds up ingestion for text-based PDFs.
+    data = {"strategy": "fast"}
+
+    async with httpx.AsyncClient(
+        timeout=httpx.Timeout(300.0, connect=10.0, read=None)
+    ) as client:
+        with open(file_path, "rb") as f:
+            files = {"files": (file_path.split("/")[-1], f, mime_type)}
+            async with client.stream(
+                "POST", api_url, files=files, data=data
+            ) as response:
+                status = response.status_code
+                if status != 200:
+                    await response.aread()
+                    error = f"Unstructured API failed ({status}): {response.text}"
+                    if 400 <= status < 500 and status not in TRANSIENT_CLIENT_STATUS:
+                        raise DocumentError(error)
+                    raise Exception(error)
+                async for element in iter_json_array(response.aiter_text()):
+                    yield element
+
+
+async def chunk_elements(
+    elements: AsyncIterator[Dict], chunk_size: int
+) -> AsyncIterator[str]:
+    """Greedy character-based packing of element texts into chunks."""
+    current_chunk = ""
+    async for element in elements:
+        text = element.get("text", "")
+        if current_chunk and len(current_chunk) + len(text) > chunk_size:
+            yield current_chunk
+            current_chunk = text
+        else:
+            current_chunk += "\n" + text
+    if current_chunk.strip():
+        yield current_chunk
+
+
+def chunk_text(text: str, chunk_size: int) -> Iterable[str]:
+    """Fixed-width slicing for plain text sources."""
+    for i in range(0, len(text), chunk_size):
+        yield text[i : i + chunk_size]
+
+
+async def _prefetch(source: AsyncIterator[Any], maxsize: int) -> AsyncIterator[Any]:
+    """Run `source` in its own task, buffering at most `maxsize` items ahead."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    async def produce():
+        try:
+            async for item in source:
+                await queue.put(item)
+            await queue.put(_END)
+        except Exception as e:
+            await queue.put(e)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+
+
+async def interleave(
+    sources: List[Callable[[], AsyncIterator[Any]]], concurrency: int, maxsize: int
+) -> AsyncIterator[Any]:
+    """
+    Run up to `concurrency` sources at once and yield their items as they
+    arrive, buffering at most `maxsize` items ahead of the consumer.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def drain(source: Callable[[], AsyncIterator[Any]]):
+        async with limit:
+            async for item in source():
+                await queue.put(item)
+
+    async def produce():
+        try:
+            await asyncio.gather(*(drain(source) for source in sources))
+            await queue.put(_END)
+        except Exception as e:
+            await queue.put(e)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+
+
+async def _batched(source: AsyncIterator[Any], size: int) -> AsyncIterator[List[Any]]:
+    batch = []
+    async for item in source:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def embed_and_upsert(
+    chunks: AsyncIterator[Chunk],
+    on_batch: Optional[Callable[[List[Chunk]], Awaitable[None]]] = None,
+) -> int:
+    """
+    Embed chunks in fixed-size batches and upsert them with a bounded number of
+    upserts in flight. `on_batch` is awaited after each batch is stored.
+    Returns the number of chunks written.
+    """
+    await qdrant_db.ensure_collection(vector_size=384)  # all-MiniLM-L6-v2 is 384
+
+    batches = _prefetch(
+        _batched(chunks, settings.INGESTION_BATCH_SIZE),
+        settings.INGESTION_PREFETCH_BATCHES,
+    )
+    in_flight: deque = deque()
+    total = 0
+
+    async def store(batch: List[Chunk], points: List[PointStruct]):
+        await qdrant_db.upsert(points)
+        if qdrant_db.sparse_enabled:
+            by_user = defaultdict(list)
+            for point in points:
+                if isinstance(point.vector, dict):
+                    by_user[point.payload["user_id"]].append(
+                        point.vector[SPARSE_VECTOR_NAME]
+                    )
+            for user_id, sparse in by_user.items():
+                await lexical_index.update_term_stats(user_id, sparse)
+        if on_batch is not None:
+            await on_batch(batch)
+
+    def point_vector(dense, sparse):
+        if not qdrant_db.sparse_enabled or not sparse.indices:
+            return dense.tolist()
+        return {"": dense.tolist(), SPARSE_VECTOR_NAME: sparse}
+
+    try:
+        async for batch in batches:
+            texts = [c.text for c in batch]
+            vectors, sparse_vectors = await asyncio.gather(
+                embedding_service.encode_documents(texts),
+                cpu_pool.run(lexical_index.chunk_sparse_vectors, texts),
+            )
+            points = [
+                PointStruct(
+                    id=chunk.id or str(uuid.uuid4()),
+                    vector=point_vector(vectors[i], sparse_vectors[i]),
+                    payload={**chunk.payload, "text": chunk.text},
+                )
+                for i, chunk in enumerate(batch)
+            ]
+            in_flight.append(asyncio.create_task(store(batch, points)))
+            total += len(batch)
+            if len(in_flight) >= settings.INGESTION_MAX_UPSERTS_IN_FLIGHT:
+                await in_flight.popleft()
+        while in_flight:
+            await in_flight.popleft()
+    finally:
+        for task in in_flight:
+            task.cancel()
+        # Let cancelled upserts unwind before the caller cleans up after them
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        await batches.aclose()
+    return total
+
+
+async def to_chunks(texts: Any, payload: Dict[str, Any]) -> AsyncIterator[Chunk]:
+    """
+    Attach the document payload, a running chunk_index and the chunk's content
+    hash to each text. Point IDs derive from the hash (repeated texts within
+    the document are told apart by their occurrence number).
+    """
+    occurrences: Counter = Counter()
+
+    def chunk(text: str, index: int) -> Chunk:
+        digest = content_hash(text)
+        occurrence = occurrences[digest]
+        occurrences[digest] += 1
+        return Chunk(
+            text,
+            {**payload, "chunk_index": index, "chunk_hash": digest},
+            point_id(payload["doc_id"], digest, occurrence),
+        )
+
+    index = 0
+    if hasattr(texts, "__aiter__"):
+        async for text in texts:
+            yield chunk(text, index)
+            index += 1
+    else:
+        for text in texts:
+            yield chunk(text, index)
+            index += 1
+
+
+async def _document_points(doc_id: str) -> Dict[str, Any]:
+    """point id -> stored chunk_index, for every point of a document."""
+    points: Dict[str, Any] = {}
+    offset = None
+    while True:
+        records, offset = await qdrant_db.scroll_document_points(
+            doc_id, offset=offset, limit=1024, with_payload=["chunk_index"]
+        )
+        for record in records:
+            points[str(record.id)] = (record.payload or {}).get("chunk_index")
+        if offset is None:
+            return points
+
+
+async def sync_document(
+    doc_id: str,
+    user_id: str,
+    chunks: AsyncIterator[Chunk],
+    on_batch: Optional[Callable[[List[Chunk]], Awaitable[None]]] = None,
+) -> Tuple[int, int]:
+    """
+    Incrementally (re-)ingest a document: only chunks without a point yet are
+    embedded and upserted, unchanged chunks that moved get their chunk_index
+    updated, and points of chunks that are gone are deleted. Also resumes a
+    partially ingested document. Returns (chunks in the document, chunks embedded).
+    """
+    await qdrant_db.ensure_collection(vector_size=384)
+    existing = await _document_points(doc_id)
+    seen = set()
+    moved: Dict[str, Dict[str, Any]] = {}
+
+    async def changed() -> AsyncIterator[Chunk]:
+        async for chunk in chunks:
+            seen.add(chunk.id)
+            if chunk.id not in existing:
+                yield chunk
+            elif existing[chunk.id] != chunk.payload["chunk_index"]:
+                moved[chunk.id] = {"chunk_index": chunk.payload["chunk_index"]}
+
+    written = await embed_and_upsert(changed(), on_batch=on_batch)
+    await qdrant_db.set_payloads(moved)
+    removed = [pid for pid in existing if pid not in seen]
+    if removed:
+        if qdrant_db.sparse_enabled:
+            await lexical_index.forget_points(user_id, removed)
+        await qdrant_db.delete_points(removed)
+    return len(seen), written
@@ -1,155 +1,245 @@
+import asyncio
+import hashlib
+import logging
 import os
-import shutil
+import tarfile
+import tempfile
+import zipfile
+from collections import Counter
 from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Tuple
 
 from bson import ObjectId
 from fastapi import UploadFile
+from pymongo import ReturnDocument, UpdateOne
 
 from app.core.config import settings
 from app.db.mongodb import mongo_db
 from app.db.qdrant import qdrant_db
+from app.services import cache_invalidation, lexical_index
+from app.services.cpu_pool import cpu_pool, html_to_chunks
+from app.services.ingestion_pipeline import (
+    Chunk,
+    DocumentError,
+    chunk_elements,
+    embed_and_upsert,
+    interleave,
+    stream_unstructured_elements,
+    sync_document,
+    to_chunks,
+)
 
-import tempfile
 # Ensure temp directory exists
-UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "ai_doc_uploads")
+# (set UPLOAD_DIR to a shared volume when workers run on other nodes)
+UPLOAD_DIR = settings.UPLOAD_DIR or os.path.join(
+    tempfile.gettempdir(), "ai_doc_uploads"
+)
 if not os.path.exists(UPLOAD_DIR):
     os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+COPY_BLOCK_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
 
 def get_timestamp():
     return datetime.utcnow()
 
 
-async def save_upload_file(upload_file: UploadFile, doc_id: str) -> str:
-    destination = os.path.join(UPLOAD_DIR, f"{doc_id}_{upload_file.filename}")
+def _copy_and_hash(source, destination: str) -> str:
+    digest = hashlib.sha256()
     with open(destination, "wb") as buffer:
-        shutil.copyfileobj(upload_file.file, buffer)
-    return destination
+        while True:
+            block = source.read(COPY_BLOCK_SIZE)
+            if not block:
+                return digest.hexdigest()
+            digest.update(block)
+            buffer.write(block)
 
 
-# Global model instance
-_embedding_model = None
+async def save_upload_file(upload_file: UploadFile, name: str) -> Tuple[str, str]:
+    """Copy an upload to UPLOAD_DIR off the event loop; returns (path, sha256)."""
+    destination = os.path.join(UPLOAD_DIR, f"{name}_{upload_file.filename}")
+    digest = await asyncio.to_thread(_copy_and_hash, upload_file.file, destination)
+    return destination, digest
 
 
-def get_embedding_model():
-    global _embedding_model
-    from sentence_transformers import SentenceTransformer
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
 
-    if _embedding_model is None:
-        _embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
-    return _embedding_model
 
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
 
-async def process_document(doc_id: str, file_path: str, user_id: str):
+
+def save_batch_file(
+    source, batch_id: str, index: int, filename: str
+) -> Tuple[str, str]:
     """
-    Background task to process the document.
+    Copy a file object to UPLOAD_DIR in fixed-size blocks (runs in a thread).
+    Returns (path, sha256 of the file).
     """
-    # Re-acquire DB connection for background task context if needed,
-    # but mongo_db singleton should work if event loop is running.
-    # Ideally, we dependency inject, but background tasks are tricky.
-    # We will use the global mongo_db instance.
+    destination = os.path.join(
+        UPLOAD_DIR, f"{batch_id}_{index}_{os.path.basename(filename)}"
+    )
+    return destination, _copy_and_hash(source, destination)
+
+
+def remove_batch_files(batch_id: str):
+    """Delete every file spooled for a batch, partial copies included (in a thread)."""
+    prefix = f"{batch_id}_"
+    for name in os.listdir(UPLOAD_DIR):
+        if name.startswith(prefix):
+            try:
+                os.remove(os.path.join(UPLOAD_DIR, name))
+            except FileNotFoundError:
+                pass
+
+
+def _discard_upload(file_path: str):
+    """Delete an uploaded file once its document will not be processed again."""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+def _skip_member(name: str) -> bool:
+    base = os.path.basename(name)
+    return not base or base.startswith(".") or "__MACOSX/" in name
+
+
+def extract_archive(
+    archive_path: str, batch_id: str, first_index: int, max_files: int
+) -> List[Tuple[str, str, str]]:
+    """
+    Unpack the regular files of a zip/tar archive into UPLOAD_DIR (runs in a
+    thread). Member paths are flattened, so entries cannot escape UPLOAD_DIR.
+    Raises ValueError when the archive exceeds the batch limits.
+    Returns [(filename, file_path, sha256)].
+    """
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            members = [
+                (m.filename, m.file_size, m)
+                for m in archive.infolist()
+                if not m.is_dir() and not _skip_member(m.filename)
+            ]
+            opener = archive.open
+            return _extract_members(members, opener, batch_id, first_index, max_files)
+    with tarfile.open(archive_path) as archive:
+        members = [
+            (m.name, m.size, m)
+            for m in archive.getmembers()
+            if m.isfile() and not _skip_member(m.name)
+        ]
+        return _extract_members(
+            members, archive.extractfile, batch_id, first_index, max_files
+        )
+
+
+def _extract_members(members, opener, batch_id, first_index, max_files):
+    if len(members) > max_files:
+        raise ValueError(
+            f"Too many files in batch (max {settings.INGESTION_BATCH_MAX_FILES})"
+        )
+    if sum(size for _, size, _ in members) > settings.INGESTION_ARCHIVE_MAX_BYTES:
+        raise ValueError("Archive is too large once unpacked")
+    extracted = []
+    for i, (name, _, member) in enumerate(members):
+        with opener(member) as source:
+            path, digest = save_batch_file(source, batch_id, first_index + i, name)
+        extracted.append((os.path.basename(name), path, digest))
+    return extracted
+
+
+async def delete_document_vectors(doc_id: str, user_id: str):
+    """Remove a document's chunks from Qdrant and from the BM25 term stats."""
+    await lexical_index.forget_document(user_id, doc_id)
+    await qdrant_db.delete_document_points(doc_id)
+
+
+def _progress_reporter(doc_id: str, user_id: str):
+    """Per-batch callback: persist the running chunk count and notify the user."""
+    state = {"chunks": 0, "batches": 0}
+
+    async def report(batch):
+        from app.websockets.connection_manager import manager
 
+        state["chunks"] += len(batch)
+        state["batches"] += 1
+        await cache_invalidation.invalidate_responses(user_id)
+        await mongo_db.db.documents.update_one(
+            {"_id": ObjectId(doc_id)}, {"$set": {"chunks": state["chunks"]}}
+        )
+        await manager.broadcast_to_user(
+            {
+                "type": "ingestion_progress",
+                "doc_id": doc_id,
+                "chunks": state["chunks"],
+                "batches": state["batches"],
+            },
+            user_id,
+        )
+
+    return report
+
+
+async def _report_failure(doc_id: str, user_id: str, error: str, final: bool):
+    """Mark the document failed, or as retrying if the job queue will run it again."""
+    from app.websockets.connection_manager import manager
+
+    status = "failed" if final else "retrying"
+    await mongo_db.db.documents.update_one(
+        {"_id": ObjectId(doc_id)}, {"$set": {"status": status, "error": error}}
+    )
+    await manager.broadcast_to_user(
+        {
+            "type": "ingestion_status",
+            "doc_id": doc_id,
+            "status": status,
+            "error": error,
+        },
+        user_id,
+    )
+
+
+async def process_document(
+    doc_id: str, file_path: str, user_id: str, final_attempt: bool = True
+):
+    """
+    Ingestion job handler for uploaded files. A document the parser rejects
+    fails for good; other errors are raised so the job queue can retry them.
+    """
     db = mongo_db.db
-    if not db:
-        # Fallback reconnect if needed (shouldn't happen in same process)
-        # In production this might need better handling or celery.
-        print("Error: DB not connected in background task")
-        return
 
     try:
         await db.documents.update_one(
             {"_id": ObjectId(doc_id)}, {"$set": {"status": "processing"}}
         )
 
-        # 1. Parse Document via Unstructured API
-        import httpx
-        import mimetypes
-
-        mime_type, _ = mimetypes.guess_type(file_path)
-        if not mime_type:
-            mime_type = "application/octet-stream"
-
-        api_url = f"{settings.UNSTRUCTURED_URL}/general/v0/general"
-        
-        # Use 'fast' strategy to bypass slow layout analysis models (detectron2/OCR)
-        # This significantly speeds up ingestion for text-based PDFs.
-        data = {"strategy": "fast"}
-        
-        async with httpx.AsyncClient(timeout=httpx.Timeout(300.0, connect=10.0, read=None)) as client:
-            with open(file_path, "rb") as f:
-                files = {"files": (file_path.split("/")[-1], f, mime_type)}
-                response = await client.post(api_url, files=files, data=data)
-            
-            if response.status_code != 200:
-                raise Exception(f"Unstructured API failed: {response.text}")
-            
-            elements = response.json()
-
-        # 2. Chunking
-        # Elements are list of dicts now, not objects
-        chunks = []
-        current_chunk = ""
-        CHUNK_SIZE = 500
-
-        for element in elements:
-            text = element.get("text", "")
-            if len(current_chunk) + len(text) > CHUNK_SIZE:
-                chunks.append(current_chunk)
-                current_chunk = text
-            else:
-                current_chunk += "\n" + text
-
-        if current_chunk:
-            chunks.append(current_chunk)
-
-        # 3. Embed & Upsert to Qdrant
-        model = get_embedding_model()
-
-        vectors = model.encode(chunks)
-
-        points = []
-        import uuid
-
-        from qdrant_client.models import PointStruct
-
         # Get filename for metadata
         doc = await db.documents.find_one({"_id": ObjectId(doc_id)})
-        filename = doc.get("filename", "Unknown Document") if doc else "Unknown Document"
-
-        for i, chunk in enumerate(chunks):
-            vector = vectors[i].tolist()
-            points.append(
-                PointStruct(
-                    id=str(uuid.uuid4()),
-                    vector=vector,
-                    payload={
-                        "doc_id": doc_id,
-                        "user_id": user_id,
-                        "filename": filename,
-                        "text": chunk,
-                        "chunk_index": i,
-                    },
-                )
-            )
-
-        # Ensure collection exists
-        try:
-            qdrant_db.client.create_collection(
-                collection_name="documents",
-                vectors_config={
-                    "size": 384,
-                    "distance": "Cosine",
-                },  # all-MiniLM-L6-v2 is 384
-            )
-        except Exception:
-            pass
+        filename = (
+            doc.get("filename", "Unknown Document") if doc else "Unknown Document"
+        )
 
-        qdrant_db.client.upsert(collection_name="documents", points=points)
+        # 1-3. Parse -> chunk -> embed -> upsert, one bounded batch at a time.
+        # Only chunks the document did not already have are embedded.
+        elements = stream_unstructured_elements(file_path)
+        chunks = to_chunks(
+            chunk_elements(elements, chunk_size=500),
+            {"doc_id": doc_id, "user_id": user_id, "filename": filename},
+        )
+        total_chunks, embedded = await sync_document(
+            doc_id, user_id, chunks, on_batch=_progress_reporter(doc_id, user_id)
+        )
+        await cache_invalidation.invalidate_responses(user_id)
+        print(f"Doc {doc_id}: {total_chunks} chunks, {embedded} embedded")
 
         # 4. Update Status and Cleanup
         await db.documents.update_one(
             {"_id": ObjectId(doc_id)},
-            {"$set": {"status": "completed", "chunks": len(chunks)}},
+            {"$set": {"status": "completed", "chunks": total_chunks}},
         )
 
         # Broadcast success
@@ -162,34 +252,277 @@ async def process_document(doc_id: str, file_path: str, user_id: str):
 
         os.remove(file_path)
 
+    except (DocumentError, ValueError) as e:
+        # The document's own problem (rejected file, malformed output), which a
+        # retry would only repeat: fail it now and let the job complete
+        logger.warning(f"Error parsing doc {doc_id}: {e}")
+        await _report_failure(doc_id, user_id, str(e), final=True)
+        # Chunks produced before the error were still stored
+        await delete_document_vectors(doc_id, user_id)
+        await cache_invalidation.invalidate_responses(user_id)
+        _discard_upload(file_path)
+
     except Exception as e:
         import traceback
         traceback.print_exc()
         print(f"Error processing doc {doc_id}: {e}")
+        await _report_failure(doc_id, user_id, str(e), final_attempt)
+        if final_attempt:
+            _discard_upload(file_path)
+        raise
+
+
+class _BatchProgress:
+    """
+    Chunk accounting for the documents of one batch job. Chunks of many
+    documents share embedding batches, so a document is complete once it has
+    been fully parsed and every chunk it produced has been stored. Counters on
+    the `ingestion_batches` record aggregate progress across the batch's jobs.
+    """
+
+    def __init__(self, batch_id: str, user_id: str, documents: List[Dict[str, Any]]):
+        self.batch_id = batch_id
+        self.user_id = user_id
+        self.file_paths = {d["doc_id"]: d["file_path"] for d in documents}
+        self.emitted: Counter = Counter()
+        self.stored: Counter = Counter()
+        self.parsed = set()
+        self.finished = set()
+
+    @property
+    def unfinished(self) -> List[str]:
+        return [doc_id for doc_id in self.file_paths if doc_id not in self.finished]
+
+    async def _broadcast(self, message: Dict[str, Any]):
+        from app.websockets.connection_manager import manager
+
+        await manager.broadcast_to_user(message, self.user_id)
+
+    async def bump(self, **counters: int):
+        """Add to the batch counters and publish the aggregated progress."""
+        batch = await mongo_db.db.ingestion_batches.find_one_and_update(
+            {"_id": ObjectId(self.batch_id)},
+            {"$inc": counters, "$set": {"updated_at": get_timestamp()}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if batch is None:
+            return
+        settled = batch["completed"] + batch["failed"]
+        if settled >= batch["documents"] and batch["status"] != "completed":
+            await mongo_db.db.ingestion_batches.update_one(
+                {"_id": batch["_id"]}, {"$set": {"status": "completed"}}
+            )
+            batch["status"] = "completed"
+        await self._broadcast(
+            {
+                "type": "batch_progress",
+                "batch_id": self.batch_id,
+                "status": batch["status"],
+                "documents": batch["documents"],
+                "completed": batch["completed"],
+                "failed": batch["failed"],
+                "chunks": batch["chunks"],
+            }
+        )
+
+    async def on_batch(self, batch: List[Chunk]):
+        counts = Counter(c.payload["doc_id"] for c in batch)
+        for doc_id in self.finished.intersection(counts):
+            del counts[doc_id]  # Failed mid-parse; its vectors are dropped later
+        if not counts:
+            return
+        self.stored.update(counts)
+        await cache_invalidation.invalidate_responses(self.user_id)
+        await mongo_db.db.documents.bulk_write(
+            [
+                UpdateOne({"_id": ObjectId(doc_id)}, {"$inc": {"chunks": n}})
+                for doc_id, n in counts.items()
+            ],
+            ordered=False,
+        )
+        completed = [doc_id for doc_id in counts if self._done(doc_id)]
+        await self._complete(completed)
+        await self.bump(chunks=sum(counts.values()), completed=len(completed))
+
+    def _done(self, doc_id: str) -> bool:
+        return (
+            doc_id in self.parsed
+            and doc_id not in self.finished
+            and self.stored[doc_id] >= self.emitted[doc_id]
+        )
+
+    async def parse_finished(self, doc_id: str):
+        self.parsed.add(doc_id)
+        if self._done(doc_id):
+            await self._complete([doc_id])
+            await self.bump(completed=1)
+
+    async def _complete(self, doc_ids: List[str]):
+        if not doc_ids:
+            return
+        self.finished.update(doc_ids)
+        await mongo_db.db.documents.update_many(
+            {"_id": {"$in": [ObjectId(d) for d in doc_ids]}},
+            {"$set": {"status": "completed"}},
+        )
+        for doc_id in doc_ids:
+            await self._broadcast(
+                {"type": "ingestion_status", "doc_id": doc_id, "status": "completed"}
+            )
+            os.remove(self.file_paths[doc_id])
+
+    async def fail(self, doc_id: str, error: str, final: bool):
+        if doc_id in self.finished:
+            return
+        await _report_failure(doc_id, self.user_id, error, final)
+        if final:
+            self.finished.add(doc_id)
+            await self.bump(failed=1)
+
+
+async def process_batch(
+    batch_id: str,
+    documents: List[Dict[str, str]],
+    user_id: str,
+    final_attempt: bool = True,
+    retry: bool = False,
+):
+    """
+    Ingestion job handler for one group of a batch upload. The documents are
+    parsed up to INGESTION_BATCH_PARSE_CONCURRENCY at a time and their chunks
+    feed one shared embed/upsert pipeline. A document the parser rejects is
+    marked failed on its own; other errors (including transient parser
+    outages) fail and retry the whole job, which then redoes only the
+    documents that did not finish.
+    """
+    db = mongo_db.db
+    records = {
+        str(doc["_id"]): doc
+        async for doc in db.documents.find(
+            {"_id": {"$in": [ObjectId(d["doc_id"]) for d in documents]}},
+            {"filename": 1, "status": 1, "chunks": 1},
+        )
+    }
+    todo = [
+        d
+        for d in documents
+        if d["doc_id"] in records
+        and records[d["doc_id"]].get("status") not in ("completed", "failed")
+    ]
+    if not todo:
+        return
+    progress = _BatchProgress(batch_id, user_id, todo)
+
+    if retry:
+        # Drop what an earlier, partially completed attempt stored
+        for d in todo:
+            await delete_document_vectors(d["doc_id"], user_id)
+        stale = sum(records[d["doc_id"]].get("chunks", 0) for d in todo)
+        if stale:
+            await progress.bump(chunks=-stale)
+    await db.documents.update_many(
+        {"_id": {"$in": [ObjectId(d["doc_id"]) for d in todo]}},
+        {"$set": {"status": "processing", "chunks": 0}},
+    )
+    await db.ingestion_batches.update_one(
+        {"_id": ObjectId(batch_id), "status": "pending"},
+        {"$set": {"status": "processing"}},
+    )
+
+    def parse(doc: Dict[str, str]):
+        doc_id = doc["doc_id"]
+        payload = {
+            "doc_id": doc_id,
+            "user_id": user_id,
+            "filename": records[doc_id].get("filename", "Unknown Document"),
+        }
+
+        async def chunks() -> AsyncIterator[Chunk]:
+            try:
+                elements = stream_unstructured_elements(doc["file_path"])
+                async for chunk in to_chunks(chunk_elements(elements, 500), payload):
+                    progress.emitted[doc_id] += 1
+                    yield chunk
+            except (DocumentError, ValueError) as e:
+                # The document's own problem (rejected file, malformed output).
+                # Anything else (transport, 5xx) fails and retries the job.
+                logger.warning(f"Error parsing doc {doc_id} of batch {batch_id}: {e}")
+                await progress.fail(doc_id, str(e), final=True)
+                return
+            await progress.parse_finished(doc_id)
+
+        return chunks
+
+    failed_parse: List[str] = []
+    try:
+        await embed_and_upsert(
+            interleave(
+                [parse(d) for d in todo],
+                settings.INGESTION_BATCH_PARSE_CONCURRENCY,
+                settings.INGESTION_BATCH_SIZE,
+            ),
+            on_batch=progress.on_batch,
+        )
+        failed_parse = [
+            doc_id for doc_id in progress.file_paths if doc_id not in progress.parsed
+        ]
+    except Exception as e:
+        logger.exception(f"Batch {batch_id} failed")
+        for doc_id in progress.unfinished:
+            await progress.fail(doc_id, str(e), final_attempt)
+            if final_attempt:
+                _discard_upload(progress.file_paths[doc_id])
+        raise
+    finally:
+        await cache_invalidation.invalidate_responses(user_id)
+
+    # Chunks a failed document produced before its error were still stored
+    for doc_id in failed_parse:
+        await delete_document_vectors(doc_id, user_id)
         await db.documents.update_one(
-            {"_id": ObjectId(doc_id)}, {"$set": {"status": "failed", "error": str(e)}}
+            {"_id": ObjectId(doc_id)}, {"$set": {"chunks": 0}}
         )
-        # Broadcast failure
-        from app.websockets.connection_manager import manager
+        _discard_upload(progress.file_paths[doc_id])
 
-        await manager.broadcast_to_user(
+
+async def abandon_job(job: Dict[str, Any], error: str):
+    """
+    Record the final failure of a job that never reported back (its worker
+    died on every attempt): its documents are marked failed, and batch
+    counters are settled, exactly as a failed last attempt would.
+    """
+    user_id = job["user_id"]
+    if job["kind"] != "batch":
+        await _report_failure(job["doc_id"], user_id, error, final=True)
+        if job["kind"] == "document":
+            _discard_upload(job["args"]["file_path"])
+        return
+    documents = job["args"]["documents"]
+    unfinished = [
+        str(doc["_id"])
+        async for doc in mongo_db.db.documents.find(
             {
-                "type": "ingestion_status",
-                "doc_id": doc_id,
-                "status": "failed",
-                "error": str(e),
+                "_id": {"$in": [ObjectId(d["doc_id"]) for d in documents]},
+                "status": {"$nin": ["completed", "failed"]},
             },
-            user_id,
+            {"_id": 1},
         )
+    ]
+    file_paths = {d["doc_id"]: d["file_path"] for d in documents}
+    for doc_id in unfinished:
+        await _report_failure(doc_id, user_id, error, final=True)
+        _discard_upload(file_paths[doc_id])
+    if unfinished:
+        progress = _BatchProgress(job["args"]["batch_id"], user_id, documents)
+        await progress.bump(failed=len(unfinished))
 
 
-def scrape_url_sync(url: str) -> str:
+def fetch_url_html_sync(url: str) -> str:
     """
-    Scrape a URL using Playwright (Sync API) and extract clean text.
+    Render a URL using Playwright (Sync API) and return its HTML.
     This is used in a thread pool to avoid event loop issues on Windows.
     """
     from playwright.sync_api import sync_playwright
-    from bs4 import BeautifulSoup
 
     with sync_playwright() as p:
         print(f"[*] Launching browser for: {url}")
@@ -199,34 +532,18 @@ def scrape_url_sync(url: str) -> str:
             print(f"[*] Navigating to: {url}")
             # Add a timeout and wait until network is somewhat idle
             page.goto(url, wait_until="networkidle", timeout=60000)
-            print(f"[*] Page loaded, extracting content...")
-            content = page.content()
-            
-            soup = BeautifulSoup(content, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-
-            # Get text
-            text = soup.get_text()
-            print(f"[*] Extracted {len(text)} characters of raw text")
-
-            # Break into lines and remove leading and trailing whitespace
-            lines = (line.strip() for line in text.splitlines())
-            # Break multi-headlines into a line each
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            # Drop blank lines
-            text = '\n'.join(chunk for chunk in chunks if chunk)
-            
-            return text
+            print("[*] Page loaded, extracting content...")
+            return page.content()
         finally:
             browser.close()
 
 
-async def process_url(doc_id: str, url: str, user_id: str):
+async def process_url(
+    doc_id: str, url: str, user_id: str, final_attempt: bool = True
+):
     """
-    Background task to process a URL.
+    Ingestion job handler for scraped URLs. Raises on failure so the job
+    queue can retry it.
     """
     import asyncio
     db = mongo_db.db
@@ -235,56 +552,29 @@ async def process_url(doc_id: str, url: str, user_id: str):
             {"_id": ObjectId(doc_id)}, {"$set": {"status": "processing"}}
         )
 
-        # 1. Scrape (using sync method in thread pool)
-        text_content = await asyncio.to_thread(scrape_url_sync, url)
-        if not text_content:
-            raise Exception("No text content found on the page.")
-
-        # 2. Chunking (Simple character-based for now, similar to process_document)
-        chunks = []
-        CHUNK_SIZE = 1000
-        for i in range(0, len(text_content), CHUNK_SIZE):
-            chunks.append(text_content[i : i + CHUNK_SIZE])
-
-        # 3. Embed & Upsert
-        model = get_embedding_model()
-        vectors = model.encode(chunks)
-        
-        points = []
-        import uuid
-        from qdrant_client.models import PointStruct
-
-        for i, chunk in enumerate(chunks):
-            vector = vectors[i].tolist()
-            points.append(
-                PointStruct(
-                    id=str(uuid.uuid4()),
-                    vector=vector,
-                    payload={
-                        "doc_id": doc_id,
-                        "user_id": user_id,
-                        "filename": url,  # Using URL as filename for reference
-                        "text": chunk,
-                        "chunk_index": i,
-                    },
-                )
-            )
+        # 1. Render (using sync method in thread pool)
+        html = await asyncio.to_thread(fetch_url_html_sync, url)
 
-        # Ensure collection exists
-        try:
-            qdrant_db.client.create_collection(
-                collection_name="documents",
-                vectors_config={"size": 384, "distance": "Cosine"},
-            )
-        except Exception:
-            pass
+        # 2. Extract text and chunk (simple character-based) on the CPU pool
+        text_chunks = await cpu_pool.run(html_to_chunks, html, 1000)
+        if not text_chunks:
+            raise Exception("No text content found on the page.")
 
-        qdrant_db.client.upsert(collection_name="documents", points=points)
+        # 3. Embed & upsert in batches
+        chunks = to_chunks(
+            text_chunks,
+            # Using URL as filename for reference
+            {"doc_id": doc_id, "user_id": user_id, "filename": url},
+        )
+        total_chunks, _ = await sync_document(
+            doc_id, user_id, chunks, on_batch=_progress_reporter(doc_id, user_id)
+        )
+        await cache_invalidation.invalidate_responses(user_id)
 
         # 4. Update Status
         await db.documents.update_one(
             {"_id": ObjectId(doc_id)},
-            {"$set": {"status": "completed", "chunks": len(chunks)}},
+            {"$set": {"status": "completed", "chunks": total_chunks}},
         )
 
         # Broadcast success
@@ -296,16 +586,5 @@ async def process_url(doc_id: str, url: str, user_id: str):
 
     except Exception as e:
         print(f"Error processing URL {url}: {e}")
-        await db.documents.update_one(
-            {"_id": ObjectId(doc_id)}, {"$set": {"status": "failed", "error": str(e)}}
-        )
-        from app.websockets.connection_manager import manager
-        await manager.broadcast_to_user(
-            {
-                "type": "ingestion_status",
-                "doc_id": doc_id,
-                "status": "failed",
-                "error": str(e),
-            },
-            user_id,
-        )
+        await _report_failure(doc_id, user_id, str(e), final_attempt)
+        raise
@@ -0,0 +1,191 @@
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+from app.core.config import settings
+from app.db.mongodb import mongo_db
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+LEASE_EXPIRED = "Lease expired"
+
+
+class IngestionJobQueue:
+    """
+    Durable ingestion queue stored in the `ingestion_jobs` collection.
+
+    Workers claim jobs atomically with find_one_and_update and hold a lease that
+    they renew by heartbeat. A job whose lease expires (worker crashed or was
+    killed) becomes claimable again, so nothing is lost on restart.
+
+    Fairness: every job gets a `fair_rank` equal to the number of jobs its user
+    already had queued, and workers claim by (fair_rank, created_at). Users are
+    therefore served round-robin, and no user may hold more than
+    INGESTION_MAX_JOBS_PER_USER running jobs at once.
+    """
+
+    @property
+    def collection(self):
+        return mongo_db.db.ingestion_jobs
+
+    async def ensure_indexes(self):
+        await self.collection.create_index(
+            [("status", ASCENDING), ("fair_rank", ASCENDING), ("created_at", ASCENDING)]
+        )
+        await self.collection.create_index(
+            [("user_id", ASCENDING), ("status", ASCENDING)]
+        )
+
+    async def enqueue(
+        self, kind: str, user_id: str, doc_id: str, args: Dict[str, Any]
+    ) -> str:
+        now = datetime.utcnow()
+        rank = await self.collection.count_documents(
+            {"user_id": user_id, "status": {"$in": [QUEUED, RUNNING]}}
+        )
+        result = await self.collection.insert_one(
+            {
+                "kind": kind,
+                "user_id": user_id,
+                "doc_id": doc_id,
+                "args": args,
+                "status": QUEUED,
+                "fair_rank": rank,
+                "attempts": 0,
+                "max_attempts": settings.INGESTION_MAX_ATTEMPTS,
+                "available_at": now,
+                "lease_expires_at": None,
+                "worker_id": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+        )
+        return str(result.inserted_id)
+
+    async def _saturated_users(self, now: datetime):
+        pipeline = [
+            {"$match": {"status": RUNNING, "lease_expires_at": {"$gt": now}}},
+            {"$group": {"_id": "$user_id", "running": {"$sum": 1}}},
+            {"$match": {"running": {"$gte": settings.INGESTION_MAX_JOBS_PER_USER}}},
+        ]
+        return [row["_id"] async for row in self.collection.aggregate(pipeline)]
+
+    async def give_up_expired(self) -> List[Dict[str, Any]]:
+        """
+        Fail the jobs whose lease expired on their last attempt (they keep
+        killing their worker) and return them, so the caller can record the
+        failure on their documents.
+        """
+        given_up = []
+        while True:
+            now = datetime.utcnow()
+            job = await self.collection.find_one_and_update(
+                {
+                    "status": RUNNING,
+                    "lease_expires_at": {"$lt": now},
+                    "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+                },
+                {
+                    "$set": {
+                        "status": FAILED,
+                        "last_error": LEASE_EXPIRED,
+                        "lease_expires_at": None,
+                        "updated_at": now,
+                    }
+                },
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                return given_up
+            given_up.append(job)
+
+    async def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Lease the next runnable job, recovering jobs with expired leases."""
+        now = datetime.utcnow()
+        saturated = await self._saturated_users(now)
+        query = {
+            "$or": [
+                {"status": QUEUED, "available_at": {"$lte": now}},
+                {
+                    "status": RUNNING,
+                    "lease_expires_at": {"$lt": now},
+                    # Out of attempts: left to give_up_expired()
+                    "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+                },
+            ]
+        }
+        if saturated:
+            query["user_id"] = {"$nin": saturated}
+        return await self.collection.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker_id": worker_id,
+                    "lease_expires_at": now
+                    + timedelta(seconds=settings.INGESTION_LEASE_SECONDS),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("fair_rank", ASCENDING), ("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def heartbeat(self, job_id: ObjectId, worker_id: str) -> bool:
+        """Extend the lease. Returns False if another worker has taken the job over."""
+        now = datetime.utcnow()
+        result = await self.collection.update_one(
+            {"_id": job_id, "worker_id": worker_id, "status": RUNNING},
+            {
+                "$set": {
+                    "lease_expires_at": now
+                    + timedelta(seconds=settings.INGESTION_LEASE_SECONDS),
+                    "updated_at": now,
+                }
+            },
+        )
+        return result.matched_count == 1
+
+    async def complete(self, job: Dict[str, Any]):
+        await self.collection.update_one(
+            {"_id": job["_id"], "worker_id": job["worker_id"]},
+            {
+                "$set": {
+                    "status": COMPLETED,
+                    "lease_expires_at": None,
+                    "updated_at": datetime.utcnow(),
+                }
+            },
+        )
+
+    async def fail(self, job: Dict[str, Any], error: str) -> bool:
+        """Record a failed attempt. Returns True if the job will be retried."""
+        now = datetime.utcnow()
+        retry = job["attempts"] < job["max_attempts"]
+        update: Dict[str, Any] = {
+            "last_error": error,
+            "lease_expires_at": None,
+            "updated_at": now,
+        }
+        if retry:
+            # Exponential backoff with jitter
+            delay = settings.INGESTION_RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1)
+            delay *= random.uniform(0.5, 1.0)
+            update["status"] = QUEUED
+            update["available_at"] = now + timedelta(seconds=delay)
+        else:
+            update["status"] = FAILED
+        await self.collection.update_one(
+            {"_id": job["_id"], "worker_id": job["worker_id"]}, {"$set": update}
+        )
+        return retry
+
+
+job_queue = IngestionJobQueue()
@@ -0,0 +1,180 @@
+"""
+BM25 lexical index stored as Qdrant sparse vectors.
+
+At ingest time every chunk is tokenized once and stored as a sparse vector of
+BM25 term-frequency weights, and per-user document frequencies are accumulated
+in MongoDB (`lexical_terms`, `lexical_stats`). At query time the query's terms
+are weighted by IDF, so the sparse dot product computed by Qdrant is the BM25
+score of the chunk.
+"""
+import asyncio
+import math
+import re
+import zlib
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+from qdrant_client.http import models
+
+from app.core.config import settings
+from app.db.mongodb import mongo_db
+from app.db.qdrant import SPARSE_VECTOR_NAME, qdrant_db
+
+# Keeps identifiers such as "ERR-404", "v1.2.3" or "a_b" as single terms
+_TOKEN = re.compile(r"[a-z0-9]+(?:[._\-/][a-z0-9]+)*")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i if in is it its of on "
+    "or that the this to was were what when where which who why will with you "
+    "your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def term_id(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8"))
+
+
+def chunk_sparse_vector(text: str) -> models.SparseVector:
+    """BM25 term-frequency component of one chunk (IDF is applied at query time)."""
+    counts = Counter(term_id(t) for t in tokenize(text))
+    length_norm = 1 - settings.BM25_B + settings.BM25_B * (
+        sum(counts.values()) / settings.BM25_AVG_CHUNK_TOKENS
+    )
+    k1 = settings.BM25_K1
+    indices = sorted(counts)
+    values = [
+        counts[i] * (k1 + 1) / (counts[i] + k1 * length_norm) for i in indices
+    ]
+    return models.SparseVector(indices=indices, values=values)
+
+
+def chunk_sparse_vectors(texts: List[str]) -> List[models.SparseVector]:
+    """Batch form of chunk_sparse_vector (picklable, so it can run on the CPU pool)."""
+    return [chunk_sparse_vector(text) for text in texts]
+
+
+@lru_cache(maxsize=4096)
+def _query_terms(query: str) -> Tuple[int, ...]:
+    return tuple(sorted({term_id(t) for t in tokenize(query)}))
+
+
+async def update_term_stats(
+    user_id: str, vectors: Iterable[models.SparseVector], sign: int = 1
+):
+    """Add (sign=1) or remove (sign=-1) chunks from the user's document frequencies."""
+    df: Dict[int, int] = defaultdict(int)
+    chunks = 0
+    for vector in vectors:
+        chunks += 1
+        for index in vector.indices:
+            df[index] += 1
+    if not chunks:
+        return
+    db = mongo_db.db
+    await db.lexical_terms.bulk_write(
+        [
+            UpdateOne(
+                {"user_id": user_id, "term": term},
+                {"$inc": {"df": sign * count}},
+                upsert=True,
+            )
+            for term, count in df.items()
+        ],
+        ordered=False,
+    )
+    await db.lexical_stats.update_one(
+        {"user_id": user_id}, {"$inc": {"chunks": sign * chunks}}, upsert=True
+    )
+
+
+async def forget_document(user_id: str, doc_id: str):
+    """Subtract a document's chunks from the term stats before deleting its points."""
+    offset = None
+    while True:
+        records, offset = await qdrant_db.scroll_document_points(
+            doc_id, with_vectors=[SPARSE_VECTOR_NAME], offset=offset
+        )
+        await update_term_stats(
+            user_id,
+            [
+                r.vector[SPARSE_VECTOR_NAME]
+                for r in records
+                if isinstance(r.vector, dict) and SPARSE_VECTOR_NAME in r.vector
+            ],
+            sign=-1,
+        )
+        if offset is None:
+            return
+
+
+async def forget_points(user_id: str, point_ids: List[str]):
+    """Subtract specific chunks from the term stats before their points are deleted."""
+    for i in range(0, len(point_ids), 256):
+        records = await qdrant_db.retrieve(
+            point_ids[i : i + 256], with_vectors=[SPARSE_VECTOR_NAME]
+        )
+        await update_term_stats(
+            user_id,
+            [
+                r.vector[SPARSE_VECTOR_NAME]
+                for r in records
+                if isinstance(r.vector, dict) and SPARSE_VECTOR_NAME in r.vector
+            ],
+            sign=-1,
+        )
+
+
+async def ensure_indexes():
+    await mongo_db.db.lexical_terms.create_index(
+        [("user_id", ASCENDING), ("term", ASCENDING)], unique=True
+    )
+    await mongo_db.db.lexical_stats.create_index("user_id", unique=True)
+
+
+async def query_sparse_vector(
+    query: str, user_id: str
+) -> Optional[models.SparseVector]:
+    """IDF-weighted query vector, or None if the query has no indexable terms."""
+    terms = _query_terms(query)
+    if not terms:
+        return None
+    db = mongo_db.db
+    stats, rows = await asyncio.gather(
+        db.lexical_stats.find_one({"user_id": user_id}),
+        db.lexical_terms.find(
+            {"user_id": user_id, "term": {"$in": list(terms)}},
+            {"term": 1, "df": 1, "_id": 0},
+        ).to_list(length=len(terms)),
+    )
+    total = max((stats or {}).get("chunks", 0), 1)
+    df = {row["term"]: max(row["df"], 0) for row in rows}
+    indices, values = [], []
+    for term in terms:
+        n = df.get(term, 0)
+        if n == 0:
+            continue  # Term never indexed for this user; cannot match anything
+        indices.append(term)
+        values.append(math.log(1 + (total - n + 0.5) / (n + 0.5)))
+    if not indices:
+        return None
+    return models.SparseVector(indices=indices, values=values)
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: List[Tuple[List[models.ScoredPoint], float]], k: int
+) -> List[Tuple[models.ScoredPoint, float]]:
+    """Merge (hits, weight) rankings; returns (point, fused score) best first."""
+    fused: Dict[str, float] = defaultdict(float)
+    points: Dict[str, models.ScoredPoint] = {}
+    for hits, weight in ranked_lists:
+        for rank, hit in enumerate(hits):
+            key = str(hit.id)
+            fused[key] += weight / (k + rank + 1)
+            points.setdefault(key, hit)
+    order = sorted(fused, key=fused.get, reverse=True)
+    return [(points[key], fused[key]) for key in order]
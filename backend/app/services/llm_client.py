@@ -1,46 +1,486 @@
-from typing import AsyncGenerator
-from groq import AsyncGroq
+"""
+LLM gateway.
+
+All completions go through `llm_gateway`, which adds the following on top of a
+provider (Groq, or any OpenAI-compatible server such as Ollama):
+
+- a pooled keep-alive HTTP client per provider
+- a per-process concurrency cap
+- token buckets for the provider's requests- and tokens-per-minute limits
+- retries with jittered exponential backoff, which are only possible before
+  the first token has been streamed to the caller
+- a circuit breaker per provider; while the primary provider's circuit is open,
+  requests fail over to LLM_FALLBACK_PROVIDER if one is configured
+- single-flight coalescing: concurrent requests for the same prompt and
+  parameters share one upstream stream
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from groq import APIConnectionError, APIStatusError, AsyncGroq
+
 from app.core.config import settings
 
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    def __init__(
+        self,
+        message: str,
+        retryable: bool = False,
+        status: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(message)
+        self.retryable = retryable
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _status_error(provider: str, status: int, headers, detail: str) -> LLMError:
+    retry_after = None
+    try:
+        retry_after = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        pass
+    return LLMError(
+        f"{provider} API error {status}: {detail}",
+        retryable=status in RETRYABLE_STATUS,
+        status=status,
+        retry_after=retry_after,
+    )
+
+
+def _http_client(
+    base_url: str = "", headers: Dict[str, str] = None
+) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            settings.LLM_READ_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT
+        ),
+    )
+
+
+class LLMProvider:
+    """A chat-completions backend. `stream` yields content deltas."""
+
+    name = "base"
+
+    def stream(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        temperature: float,
+    ) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class GroqProvider(LLMProvider):
+    name = "groq"
 
-class GroqClient:
     def __init__(self):
-        self.client = AsyncGroq(api_key=settings.GROQ_API_KEY)
-        self.model = settings.GROQ_MODEL
-
-    async def generate_completion(self, model: str, prompt: str) -> str:
-        """Non-streaming completion (not used in current implementation)"""
-        response = await self.client.chat.completions.create(
-            model=model or self.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7,
-            max_tokens=2048,
+        self._http = _http_client()
+        # Retries are done by the gateway, which knows whether tokens were sent
+        self.client = AsyncGroq(
+            api_key=settings.GROQ_API_KEY, http_client=self._http, max_retries=0
         )
-        return response.choices[0].message.content
 
-    async def generate_stream(
-        self, model: str, prompt: str
-    ) -> AsyncGenerator[str, None]:
-        """Streaming completion - yields tokens as they arrive"""
+    async def stream(self, model, messages, max_tokens, temperature):
         try:
             stream = await self.client.chat.completions.create(
-                model=model or self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.7,
-                max_tokens=2048,
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
                 stream=True,
             )
-
             async for chunk in stream:
-                if chunk.choices[0].delta.content:
+                if chunk.choices and chunk.choices[0].delta.content:
                     yield chunk.choices[0].delta.content
+        except APIStatusError as e:
+            raise _status_error(self.name, e.status_code, e.response.headers, e.message)
+        except APIConnectionError as e:  # Includes timeouts
+            raise LLMError(f"groq connection error: {e}", retryable=True)
+
+    async def close(self):
+        await self._http.aclose()
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """Any server speaking the OpenAI chat-completions API (vLLM, LM Studio, Ollama)."""
+
+    def __init__(self, name: str, base_url: str, api_key: str = ""):
+        self.name = name
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else None
+        self._http = _http_client(base_url.rstrip("/"), headers)
+
+    async def stream(self, model, messages, max_tokens, temperature):
+        body = {
+            "model": model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+        }
+        try:
+            async with self._http.stream(
+                "POST", "/chat/completions", json=body
+            ) as response:
+                if response.status_code >= 400:
+                    detail = (await response.aread()).decode(errors="replace")[:200]
+                    raise _status_error(
+                        self.name, response.status_code, response.headers, detail
+                    )
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        return
+                    choices = json.loads(data).get("choices") or [{}]
+                    content = (choices[0].get("delta") or {}).get("content")
+                    if content:
+                        yield content
+        except httpx.TransportError as e:
+            raise LLMError(f"{self.name} connection error: {e}", retryable=True)
+
+    async def close(self):
+        await self._http.aclose()
+
+
+def create_provider(name: str) -> LLMProvider:
+    if name == "groq":
+        return GroqProvider()
+    if name == "openai":
+        return OpenAICompatibleProvider(
+            "openai", settings.OPENAI_COMPAT_BASE_URL, settings.OPENAI_COMPAT_API_KEY
+        )
+    if name == "ollama":
+        # Ollama serves the OpenAI API under /v1
+        return OpenAICompatibleProvider("ollama", f"{settings.OLLAMA_BASE_URL}/v1")
+    raise ValueError(f"Unknown LLM provider: {name}")
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute; waiters are served in order."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float) -> float:
+        """Take `amount` units, waiting for them if needed; returns seconds waited."""
+        amount = min(amount, self.capacity)  # A single oversized request still runs
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return time.monotonic() - started
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def refund(self, amount: float):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
 
+class CircuitBreaker:
+    """Opens after N consecutive failures; after a cooldown, one probe goes through."""
+
+    def __init__(self, failures: int, cooldown: float):
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release(self):
+        """An attempt ended without a verdict (cancelled); free the probe slot."""
+        self._probing = False
+
+
+class _Flight:
+    """
+    One upstream stream shared by every concurrent request for the same prompt.
+
+    Tokens are kept, so a subscriber joining late first gets the prefix that
+    was already produced. When the last subscriber leaves, the upstream request
+    is cancelled and the flight is abandoned: requests arriving before the
+    cancellation lands start a new flight instead of joining this one.
+    """
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done = False
+        self.abandoned = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def _notify(self):
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    async def produce(self, upstream: AsyncIterator[str]):
+        try:
+            async for token in upstream:
+                self.tokens.append(token)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = LLMError("Upstream request cancelled")
+            raise
         except Exception as e:
-            raise Exception(f"Groq API error: {str(e)}")
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    async def follow(self) -> AsyncGenerator[str, None]:
+        self.subscribers += 1
+        try:
+            position = 0
+            while True:
+                wakeup = self._wakeup
+                while position < len(self.tokens):
+                    position += 1
+                    yield self.tokens[position - 1]
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await wakeup.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.abandoned = True
+                self.task.cancel()
+
+
+class LLMGateway:
+    def __init__(self):
+        self.primary = create_provider(settings.LLM_PROVIDER)
+        self.fallback = (
+            create_provider(settings.LLM_FALLBACK_PROVIDER)
+            if settings.LLM_FALLBACK_PROVIDER
+            else None
+        )
+        self._breakers = {
+            provider.name: CircuitBreaker(
+                settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_COOLDOWN_SECONDS
+            )
+            for provider in (self.primary, self.fallback)
+            if provider is not None
+        }
+        # Rate limits are those of the primary (hosted) provider
+        rpm, tpm = settings.LLM_RPM_LIMIT, settings.LLM_TPM_LIMIT
+        self._rpm = TokenBucket(rpm) if rpm else None
+        self._tpm = TokenBucket(tpm) if tpm else None
+        self._semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        self._flights: Dict[str, _Flight] = {}
+        self.requests = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.failovers = 0
+        self.failures = 0
+        self.rate_limit_wait_seconds = 0.0
+
+    def _candidates(self, model: str) -> List[Tuple[LLMProvider, str]]:
+        candidates = [(self.primary, model or settings.GROQ_MODEL)]
+        if self.fallback is not None:
+            candidates.append((self.fallback, settings.LLM_FALLBACK_MODEL))
+        return candidates
+
+    async def _acquire(self, provider: LLMProvider, tokens: int):
+        if provider is not self.primary:
+            return
+        if self._rpm:
+            self.rate_limit_wait_seconds += await self._rpm.acquire(1)
+        if self._tpm:
+            self.rate_limit_wait_seconds += await self._tpm.acquire(tokens)
+
+    def _backoff(self, attempt: int, error: LLMError) -> float:
+        ceiling = min(
+            settings.LLM_RETRY_MAX_SECONDS, settings.LLM_RETRY_BASE_SECONDS * 2**attempt
+        )
+        delay = random.uniform(0, ceiling)  # Full jitter
+        if error.retry_after:
+            delay = max(delay, min(error.retry_after, settings.LLM_RETRY_MAX_SECONDS))
+        return delay
+
+    def generate_stream(
+        self, model: str, prompt: str, max_tokens: int = 2048, temperature: float = 0.7
+    ) -> AsyncGenerator[str, None]:
+        """Streaming completion - yields tokens as they arrive"""
+        if not settings.LLM_COALESCE_ENABLED:
+            return self._upstream(model, prompt, max_tokens, temperature)
+        key = hashlib.sha256(
+            f"{model}\0{max_tokens}\0{temperature}\0{prompt}".encode("utf-8")
+        ).hexdigest()
+        flight = self._flights.get(key)
+        if flight is None or flight.abandoned:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(
+                flight.produce(self._upstream(model, prompt, max_tokens, temperature))
+            )
+            flight.task.add_done_callback(lambda _: self._land(key, flight))
+        else:
+            self.coalesced += 1
+        return flight.follow()
+
+    def _land(self, key: str, flight: _Flight):
+        # An abandoned flight may already have been replaced under its key
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def _upstream(
+        self, model: str, prompt: str, max_tokens: int, temperature: float
+    ) -> AsyncGenerator[str, None]:
+        messages = [{"role": "user", "content": prompt}]
+        # Reserve the worst case against TPM and refund the unused part afterwards
+        reserved = len(prompt) // 4 + max_tokens
+        last_error: Optional[LLMError] = None
+        async with self._semaphore:
+            self.requests += 1
+            for index, (provider, provider_model) in enumerate(self._candidates(model)):
+                breaker = self._breakers[provider.name]
+                if index > 0:
+                    self.failovers += 1
+                for attempt in range(settings.LLM_MAX_RETRIES + 1):
+                    if not breaker.allow():
+                        last_error = LLMError(
+                            f"{provider.name} circuit is open", retryable=True
+                        )
+                        break
+                    streamed = 0
+                    acquired = settled = False
+                    try:
+                        await self._acquire(provider, reserved)
+                        acquired = True
+                        async for token in provider.stream(
+                            provider_model, messages, max_tokens, temperature
+                        ):
+                            streamed += len(token)
+                            yield token
+                    except LLMError as e:
+                        settled = True
+                        if e.retryable:
+                            breaker.record_failure()
+                        else:
+                            breaker.record_success()  # The provider itself is up
+                        if streamed or not e.retryable:
+                            self.failures += 1
+                            raise
+                        last_error = e
+                        if attempt < settings.LLM_MAX_RETRIES:
+                            self.retries += 1
+                            await asyncio.sleep(self._backoff(attempt, e))
+                        continue
+                    except Exception:
+                        settled = True
+                        breaker.record_failure()
+                        self.failures += 1
+                        raise
+                    else:
+                        settled = True
+                        breaker.record_success()
+                        return
+                    finally:
+                        if not settled:
+                            # Cancelled or closed by the consumer: no verdict on
+                            # the provider, but a half-open probe must not stay
+                            # claimed or the circuit never closes again
+                            breaker.release()
+                        if acquired and self._tpm and provider is self.primary:
+                            used = len(prompt) // 4 + streamed // 4
+                            self._tpm.refund(max(reserved - used, 0))
+        self.failures += 1
+        raise last_error or LLMError("No LLM provider available")
+
+    async def generate_completion(
+        self, model: str, prompt: str, max_tokens: int = 2048
+    ) -> str:
+        """Non-streaming completion (session titles and summaries)"""
+        return "".join(
+            [token async for token in self.generate_stream(model, prompt, max_tokens)]
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "provider": self.primary.name,
+            "fallback": self.fallback.name if self.fallback else None,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "retries": self.retries,
+            "failovers": self.failovers,
+            "failures": self.failures,
+            "rate_limit_wait_seconds": round(self.rate_limit_wait_seconds, 3),
+            "circuits": {name: b.state for name, b in self._breakers.items()},
+        }
+
+    async def close(self):
+        for provider in (self.primary, self.fallback):
+            if provider is not None:
+                await provider.close()
 
 
-# Create singleton instance
-groq_client = GroqClient()
+llm_gateway = LLMGateway()
 
-# Backward compatibility alias (so chat_service doesn't need changes)
-ollama_client = groq_client
+# Backward compatibility aliases
+groq_client = llm_gateway
+ollama_client = llm_gateway
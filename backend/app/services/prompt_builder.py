@@ -0,0 +1,255 @@
+"""
+Token-budgeted prompt assembly.
+
+The persona text is fixed, so it is built (and counted) once at import time.
+Per request, the remaining budget (PROMPT_TOKEN_BUDGET minus persona, query
+and framing) is split between retrieved context and conversation history.
+The lowest-value parts are dropped first: lower-ranked chunks and older turns.
+"""
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+PERSONA_NO_CONTEXT = (
+    "You are 'Infinity', a highly advanced and elegant AI intelligence. \n"
+    "Your tone is sophisticated, direct, and slightly futuristic. \n"
+    "You are currently helping a user within their private intelligent workspace.\n"
+    "\n"
+    "The user's query did not match any specific knowledge base documents. \n"
+    "Answer conversationally and with high-level intellect, using the provided"
+    " history as your only context. \n"
+    "Avoid saying \"I don't know\" if the history allows for a meaningful logical"
+    " inference.\n"
+    "\n"
+)
+
+PERSONA_RAG = (
+    "You are 'Infinity', a premier AI intelligence integrated into this private"
+    " workspace.\n"
+    "Your primary directive is to provide elegant, precise, and highly intelligent"
+    " insights based on the user's uploaded knowledge and conversation history.\n"
+    "\n"
+    "Guidelines:\n"
+    "1. FLUIDITY OVER FORMALITY: Speak like a human expert, not a search engine."
+    " Integrate document facts seamlessly into your narrative without always"
+    " roboticly citing \"According to...\".\n"
+    "2. SEAMLESS KNOWLEDGE: Use the provided Context to construct your reality. If"
+    " the information is there, state it as a fact. \n"
+    "3. CITATION ETIQUETTE: Mention document names ONLY if it adds necessary"
+    " weight to an answer, or if you are comparing information from multiple"
+    " sources.\n"
+    "4. CONTEXTUAL MEMORY: Heavily rely on the Conversation History to maintain"
+    " the \"flow\" of deep thought.\n"
+    "5. NO REPETITION: Do not repeat phrases like \"Based on the information"
+    " provided\" or \"I can answer based on history\". Just speak.\n"
+    "\n"
+)
+
+_tokenizer = None
+
+
+def load_tokenizer():
+    """Load the prompt tokenizer (blocking; call from a thread at startup)."""
+    global _tokenizer
+    if _tokenizer is not None or not settings.PROMPT_TOKENIZER:
+        return _tokenizer
+    try:
+        from transformers import AutoTokenizer
+
+        _tokenizer = AutoTokenizer.from_pretrained(settings.PROMPT_TOKENIZER)
+        count_tokens.cache_clear()  # Drop counts estimated before it was loaded
+        print(f"Loaded prompt tokenizer {settings.PROMPT_TOKENIZER}")
+    except Exception as e:
+        print(f"Prompt tokenizer unavailable, estimating token counts: {e}")
+    return _tokenizer
+
+
+@lru_cache(maxsize=16384)
+def count_tokens(text: str) -> int:
+    """Token count of `text`; ~4 characters/token until the tokenizer loads."""
+    if _tokenizer is None:
+        return (len(text) + 3) // 4
+    return len(_tokenizer.encode(text, add_special_tokens=False))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    if _tokenizer is None:
+        return text[: max_tokens * 4]
+    ids = _tokenizer.encode(text, add_special_tokens=False)
+    return _tokenizer.decode(ids[:max_tokens])
+
+
+@dataclass
+class PromptUsage:
+    system: int = 0
+    query: int = 0
+    context: int = 0
+    summary: int = 0
+    history: int = 0
+    total: int = 0
+    chunks_used: int = 0
+    chunks_dropped: int = 0
+    turns_used: int = 0
+    turns_dropped: int = 0
+    truncated: bool = False
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _format_chunk(chunk: Dict) -> str:
+    return f"[Document: {chunk['metadata']['filename']}]: {chunk['text']}"
+
+
+def _format_turn(turn: Dict[str, str]) -> str:
+    return f"{turn['role'].capitalize()}: {turn['content']}"
+
+
+def _fit_context(
+    chunks: List[Dict], budget: int, usage: PromptUsage
+) -> List[str]:
+    """Keep chunks in rank order; the last one that does not fit is truncated."""
+    parts: List[str] = []
+    separator = count_tokens("\n\n")
+    for chunk in chunks:
+        text = _format_chunk(chunk)
+        cost = count_tokens(text) + (separator if parts else 0)
+        if cost <= budget:
+            parts.append(text)
+            budget -= cost
+            usage.context += cost
+            continue
+        if budget >= settings.PROMPT_MIN_CHUNK_TOKENS:
+            parts.append(truncate_to_tokens(text, budget))
+            usage.context += budget
+            usage.truncated = True
+            budget = 0
+        break
+    usage.chunks_used = len(parts)
+    usage.chunks_dropped = len(chunks) - len(parts)
+    return parts
+
+
+def _fit_history(
+    history: List[Dict[str, str]], budget: int, usage: PromptUsage
+) -> List[str]:
+    """Keep the most recent turns that fit; older ones are dropped first."""
+    recent = history[-settings.PROMPT_MAX_HISTORY_TURNS :]
+    kept: List[str] = []
+    for turn in reversed(recent):
+        text = _format_turn(turn)
+        cost = count_tokens(text) + 1  # newline
+        if cost > budget:
+            break
+        kept.append(text)
+        budget -= cost
+        usage.history += cost
+    kept.reverse()
+    usage.turns_used = len(kept)
+    usage.turns_dropped = len(history) - len(kept)
+    return kept
+
+
+def assemble_prompt(
+    query: str,
+    context_chunks: List[Dict],
+    history: Optional[List[Dict[str, str]]] = None,
+    budget: Optional[int] = None,
+    summary: str = "",
+) -> Tuple[str, PromptUsage]:
+    """Build the prompt within the token budget; returns it with its token usage."""
+    budget = budget or settings.PROMPT_TOKEN_BUDGET
+    history = history or []
+    usage = PromptUsage()
+
+    persona = PERSONA_RAG if context_chunks else PERSONA_NO_CONTEXT
+    usage.system = count_tokens(persona) + _FRAMING_TOKENS
+    usage.query = count_tokens(query)
+    remaining = max(budget - usage.system - usage.query, 0)
+
+    context_parts: List[str] = []
+    if context_chunks:
+        context_budget = int(remaining * (1 - settings.PROMPT_HISTORY_SHARE))
+        context_parts = _fit_context(context_chunks, context_budget, usage)
+    # History also gets whatever the context did not use
+    history_budget = remaining - usage.context
+    summary_text = ""
+    if summary:
+        # The summary stands in for older turns, so it is kept ahead of them
+        header = "Summary of earlier conversation:\n"
+        summary_budget = history_budget - count_tokens(header) - 2
+        if summary_budget > 0:
+            summary = truncate_to_tokens(summary, summary_budget)
+            summary_text = header + summary + "\n\n"
+            usage.summary = count_tokens(summary_text)
+            history_budget -= usage.summary
+    history_parts = _fit_history(history, history_budget, usage)
+
+    history_text = summary_text + "\n".join(history_parts)
+    if context_chunks:
+        prompt = (
+            PERSONA_RAG
+            + "Contextual Data:\n"
+            + "\n\n".join(context_parts)
+            + "\n\nConversation History:\n"
+            + history_text
+            + "\n\nUser Query: "
+            + query
+            + "\nInfinity:"
+        )
+    else:
+        prompt = (
+            PERSONA_NO_CONTEXT
+            + "Conversation History:\n"
+            + history_text
+            + "\n\nQuery: "
+            + query
+            + "\nInfinity:"
+        )
+    usage.total = (
+        usage.system + usage.query + usage.context + usage.summary + usage.history
+    )
+    return prompt, usage
+
+
+def build_prompt(
+    query: str, context_chunks: List[Dict], history: List[Dict[str, str]] = None
+) -> str:
+    return assemble_prompt(query, context_chunks, history)[0]
+
+
+def build_summary_prompt(summary: str, messages: List[Dict]) -> str:
+    """Prompt that folds `messages` into the running `summary` of a session."""
+    transcript = "\n".join(
+        _format_turn(
+            {
+                "role": m["role"],
+                "content": truncate_to_tokens(m["content"], _SUMMARY_TURN_TOKENS),
+            }
+        )
+        for m in messages
+    )
+    return (
+        "You maintain the running memory of a conversation between a user and "
+        "an AI assistant.\n"
+        "Update the summary with the new messages. Keep facts, names, numbers, "
+        "decisions, the user's goals and open questions; drop pleasantries. "
+        f"Write at most {settings.SESSION_SUMMARY_MAX_TOKENS * 3 // 4} words "
+        "of plain prose and reply with the summary only.\n\n"
+        f"Current summary:\n{summary or '(none)'}\n\n"
+        f"New messages:\n{transcript}\n\n"
+        "Updated summary:"
+    )
+
+
+# Long messages are clipped before summarization
+_SUMMARY_TURN_TOKENS = 400
+
+# Section headers and the trailing "User Query: ... Infinity:" scaffolding
+_FRAMING_TOKENS = count_tokens(
+    "Contextual Data:\n\n\nConversation History:\n\n\nUser Query: \nInfinity:"
+)
@@ -0,0 +1,153 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+
+# Global model instance
+_cross_encoder = None
+
+
+def get_cross_encoder():
+    global _cross_encoder
+    from sentence_transformers import CrossEncoder
+
+    if _cross_encoder is None:
+        _cross_encoder = CrossEncoder(settings.RERANK_MODEL, device="cpu")
+    return _cross_encoder
+
+
+def _predict(query: str, texts: List[str]) -> np.ndarray:
+    model = get_cross_encoder()
+    return model.predict(
+        [(query, text) for text in texts], batch_size=settings.RERANK_BATCH_SIZE
+    )
+
+
+def drop_near_duplicates(
+    candidates: List[Dict],
+    vectors: Sequence[Optional[Sequence[float]]],
+    threshold: float,
+) -> List[Dict]:
+    """Greedy: drop a candidate within `threshold` cosine of one already kept."""
+    kept: List[Dict] = []
+    kept_vectors: List[np.ndarray] = []
+    for candidate, vector in zip(candidates, vectors):
+        if vector is None:
+            kept.append(candidate)
+            continue
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        v = v / norm if norm else v
+        if any(float(np.dot(v, k)) >= threshold for k in kept_vectors):
+            continue
+        kept.append(candidate)
+        kept_vectors.append(v)
+    return kept
+
+
+class Reranker:
+    """
+    Second retrieval stage: score (query, chunk) pairs with a small CPU
+    cross-encoder and keep the best N.
+
+    Re-ranking has a latency budget. If the moving-average cost per pair says
+    the candidates will not fit, or the call overruns, the first-stage order
+    is used instead. Overrunning predictions still finish in the background and
+    are folded into the average, and every RERANK_PROBE_SECONDS one call is let
+    through regardless, so a single slow measurement does not disable
+    re-ranking for good.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="rerank"
+        )
+        self._ms_per_pair: Optional[float] = None
+        self._pending = 0  # Predictions queued or running on the rerank thread
+        self._last_started = time.monotonic()
+        self.reranked = 0
+        self.skipped = 0
+        self.timeouts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.RERANK_ENABLED
+
+    def _fits_budget(self, pairs: int) -> bool:
+        if self._pending >= settings.RERANK_MAX_PENDING:
+            # Earlier overrunning predictions are still occupying the thread
+            return False
+        if self._ms_per_pair is None:
+            return True
+        if self._ms_per_pair * pairs <= settings.RERANK_BUDGET_MS:
+            return True
+        # Probe now and then, in case the estimate is stale
+        return time.monotonic() - self._last_started >= settings.RERANK_PROBE_SECONDS
+
+    def _done(self, pairs: int, started: float, future: asyncio.Future):
+        self._pending -= 1
+        if future.cancelled() or future.exception() is not None:
+            return  # Retrieving the exception stops timed-out failures being logged
+        # Also runs for predictions that overran, once they finish
+        per_pair = (time.perf_counter() - started) * 1000 / pairs
+        if self._ms_per_pair is None:
+            self._ms_per_pair = per_pair
+        else:
+            self._ms_per_pair = 0.8 * self._ms_per_pair + 0.2 * per_pair
+
+    async def rerank(
+        self, query: str, candidates: List[Dict], top_n: int
+    ) -> List[Dict]:
+        if len(candidates) <= 1:
+            return candidates[:top_n]
+        if not self._fits_budget(len(candidates)):
+            self.skipped += 1
+            return candidates[:top_n]
+
+        loop = asyncio.get_running_loop()
+        self._last_started = time.monotonic()
+        self._pending += 1
+        future = loop.run_in_executor(
+            self._executor, _predict, query, [c["text"] for c in candidates]
+        )
+        future.add_done_callback(
+            functools.partial(self._done, len(candidates), time.perf_counter())
+        )
+        try:
+            scores = await asyncio.wait_for(
+                asyncio.shield(future), settings.RERANK_BUDGET_MS / 1000
+            )
+        except asyncio.TimeoutError:
+            # The thread finishes in the background (which also warms the model up)
+            self.timeouts += 1
+            return candidates[:top_n]
+        except Exception as e:
+            print(f"Re-ranking failed, using first-stage order: {e}")
+            return candidates[:top_n]
+
+        self.reranked += 1
+
+        order = np.argsort(-np.asarray(scores))[:top_n]
+        ranked = []
+        for i in order:
+            candidate = candidates[int(i)]
+            candidate["metadata"]["rerank_score"] = float(scores[int(i)])
+            ranked.append(candidate)
+        return ranked
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "reranked": self.reranked,
+            "skipped_over_budget": self.skipped,
+            "timeouts": self.timeouts,
+            "ms_per_pair": self._ms_per_pair,
+        }
+
+
+reranker = Reranker()
@@ -0,0 +1,133 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+_REPLAY_TOKEN = re.compile(r"\S+\s*|\s+")
+
+
+def fingerprint_chunks(chunk_ids: Iterable[str]) -> str:
+    """Order-independent identity of the retrieved context."""
+    return hashlib.sha1("\0".join(sorted(chunk_ids)).encode("utf-8")).hexdigest()
+
+
+def fingerprint_conversation(
+    summary: Optional[str], history: Iterable[Dict[str, str]]
+) -> str:
+    """Identity of the conversation a query is asked in (summary + recent turns)."""
+    digest = hashlib.sha1((summary or "").encode("utf-8"))
+    for message in history:
+        digest.update(f"\0{message['role']}\0{message['content']}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+@dataclass
+class _CachedResponse:
+    vector: np.ndarray  # L2-normalized query embedding
+    fingerprint: str
+    response: str
+    expires: float
+
+
+class SemanticResponseCache:
+    """
+    Opt-in per-user cache of final RAG answers.
+
+    A stored answer is reused when the new query embedding is within
+    RESPONSE_CACHE_SIMILARITY (cosine) of a cached one *and* the fingerprint
+    matches: retrieval returned exactly the same chunks, in the same
+    conversation state. Any change to a user's corpus drops their entries.
+    """
+
+    def __init__(self):
+        self._entries: "OrderedDict[str, List[_CachedResponse]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.RESPONSE_CACHE_ENABLED
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(
+        self, user_id: str, query_vector: np.ndarray, fingerprint: str
+    ) -> Optional[str]:
+        if not self.enabled:
+            return None
+        entries = self._entries.get(user_id)
+        if not entries:
+            self.misses += 1
+            return None
+
+        now = time.time()
+        entries[:] = [e for e in entries if e.expires >= now]
+        query = self._normalize(query_vector)
+        best, best_score = None, settings.RESPONSE_CACHE_SIMILARITY
+        for entry in entries:
+            if entry.fingerprint != fingerprint:
+                continue
+            score = float(np.dot(entry.vector, query))
+            if score >= best_score:
+                best, best_score = entry, score
+
+        if best is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        return best.response
+
+    def store(
+        self, user_id: str, query_vector: np.ndarray, fingerprint: str, response: str
+    ):
+        if not self.enabled or not response:
+            return
+        entries = self._entries.setdefault(user_id, [])
+        entries.append(
+            _CachedResponse(
+                vector=self._normalize(query_vector),
+                fingerprint=fingerprint,
+                response=response,
+                expires=time.time() + settings.RESPONSE_CACHE_TTL_SECONDS,
+            )
+        )
+        del entries[: -settings.RESPONSE_CACHE_MAX_PER_USER]
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > settings.RESPONSE_CACHE_MAX_USERS:
+            self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: str):
+        """Called whenever the user's document set changes."""
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    @staticmethod
+    async def replay(response: str) -> AsyncGenerator[str, None]:
+        """Stream a cached answer through the same token interface as the LLM."""
+        for match in _REPLAY_TOKEN.finditer(response):
+            yield match.group(0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "users": len(self._entries),
+            "entries": sum(len(v) for v in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = SemanticResponseCache()
@@ -0,0 +1,99 @@
+"""
+Rolling conversation summaries.
+
+Once a session has more than SESSION_SUMMARY_TRIGGER_MESSAGES messages that
+are not yet summarized, all but the latest SESSION_RECENT_MESSAGES of them are
+folded into `chat_sessions.summary` (in the background, after the assistant
+message is saved). `summary_until` is the timestamp of the last folded
+message, so each turn uses the summary plus a bounded tail of messages (both
+served by the history store).
+"""
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from bson import ObjectId
+
+from app.core.config import settings
+from app.db.mongodb import mongo_db
+from app.services.history_store import history_store
+from app.services.llm_client import llm_gateway
+from app.services.prompt_builder import build_summary_prompt
+
+logger = logging.getLogger(__name__)
+
+# Sessions being summarized by this process
+_running: Set[str] = set()
+
+
+def _unsummarized(session_id: str, session: Dict) -> Dict:
+    query = {"session_id": session_id}
+    if session and session.get("summary_until"):
+        query["timestamp"] = {"$gt": session["summary_until"]}
+    return query
+
+
+async def load_history(
+    session_id: str, before: Optional[datetime] = None
+) -> Tuple[str, List[Dict[str, str]]]:
+    """Returns (summary, recent messages oldest first) for the prompt."""
+    # One extra turn in case the previous summary update is still running
+    # (the current turn's message, if already recorded, is excluded by `before`)
+    return await history_store.recent(
+        session_id, settings.SESSION_SUMMARY_TRIGGER_MESSAGES + 2, before=before
+    )
+
+
+async def maybe_summarize(session_id: str):
+    if session_id in _running:
+        return
+    _running.add(session_id)
+    try:
+        await _summarize(session_id)
+    except Exception as e:
+        logger.warning(f"Summary update failed for session {session_id}: {e}")
+    finally:
+        _running.discard(session_id)
+
+
+async def _summarize(session_id: str):
+    db = mongo_db.db
+    session = await db.chat_sessions.find_one(
+        {"_id": ObjectId(session_id)}, {"summary": 1, "summary_until": 1}
+    )
+    if not session:
+        return
+    query = _unsummarized(session_id, session)
+    pending = await db.chat_messages.count_documents(query)
+    if pending <= settings.SESSION_SUMMARY_TRIGGER_MESSAGES:
+        return
+
+    fold = pending - settings.SESSION_RECENT_MESSAGES
+    messages = (
+        await db.chat_messages.find(query, {"role": 1, "content": 1, "timestamp": 1})
+        .sort("timestamp", 1)
+        .limit(fold)
+        .to_list(length=fold)
+    )
+    if not messages:
+        return
+    summary = await llm_gateway.generate_completion(
+        settings.GROQ_MODEL,
+        build_summary_prompt(session.get("summary", ""), messages),
+        max_tokens=settings.SESSION_SUMMARY_MAX_TOKENS,
+    )
+    # Only applies if no other worker moved the summary on in the meantime
+    result = await db.chat_sessions.update_one(
+        {"_id": session["_id"], "summary_until": session.get("summary_until")},
+        {
+            "$set": {
+                "summary": summary.strip(),
+                "summary_until": messages[-1]["timestamp"],
+            }
+        },
+    )
+    if result.modified_count:
+        history_store.set_summary(
+            session_id, summary.strip(), messages[-1]["timestamp"]
+        )
+    logger.info(f"Session {session_id}: folded {len(messages)} messages into summary")
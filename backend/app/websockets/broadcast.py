@@ -0,0 +1,179 @@
+"""
+Cross-process delivery of per-user WebSocket messages.
+
+`broadcast_to_user` may be called from any API process or ingestion worker,
+while the user's sockets can live on any API process. Messages are
+published to a backend. Every API process subscribes only to the users it
+currently holds sockets for, and hands received messages to its local
+ConnectionManager.
+
+Process-wide events (e.g. cache invalidations) are published the same way
+and applied by every API process.
+
+- "memory": single process (and tests); publish delivers directly.
+- "redis": Redis pub/sub on channel `ws:user:<user_id>`, and `ws:events`
+  for events. Publishes are buffered for a few milliseconds and sent in one
+  pipeline round trip.
+"""
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+
+# Called with (user_id, serialized message) for messages to deliver locally
+Deliver = Callable[[str, str], Awaitable[None]]
+# Called with a serialized event published by any process (including this one)
+OnEvent = Callable[[str], Awaitable[None]]
+
+CHANNEL_PREFIX = "ws:user:"
+EVENTS_CHANNEL = "ws:events"
+READ_TIMEOUT_SECONDS = 1.0
+
+
+class BroadcastBackend:
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+        self._on_event: Optional[OnEvent] = None
+
+    async def start(
+        self, deliver: Optional[Deliver] = None, on_event: Optional[OnEvent] = None
+    ):
+        """Both are None for publish-only processes (ingestion workers)."""
+        self._deliver = deliver
+        self._on_event = on_event
+
+    async def publish(self, user_id: str, text: str):
+        raise NotImplementedError
+
+    async def publish_event(self, text: str):
+        raise NotImplementedError
+
+    async def subscribe(self, user_id: str):
+        pass
+
+    async def unsubscribe(self, user_id: str):
+        pass
+
+    async def close(self):
+        pass
+
+
+class InMemoryBroadcast(BroadcastBackend):
+    async def publish(self, user_id: str, text: str):
+        if self._deliver is not None:
+            await self._deliver(user_id, text)
+
+    async def publish_event(self, text: str):
+        if self._on_event is not None:
+            await self._on_event(text)
+
+
+class RedisBroadcast(BroadcastBackend):
+    def __init__(self, url: str):
+        super().__init__()
+        self.url = url
+        self._redis = None
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+        self._channels: Set[str] = set()
+        self._outbox: List[Tuple[str, str]] = []
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def start(
+        self, deliver: Optional[Deliver] = None, on_event: Optional[OnEvent] = None
+    ):
+        import redis.asyncio as aioredis
+
+        await super().start(deliver, on_event)
+        self._redis = aioredis.from_url(self.url)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        if on_event is not None:
+            await self._subscribe(EVENTS_CHANNEL)
+
+    # Publishing
+
+    async def publish(self, user_id: str, text: str):
+        self._enqueue(CHANNEL_PREFIX + user_id, text)
+
+    async def publish_event(self, text: str):
+        self._enqueue(EVENTS_CHANNEL, text)
+
+    def _enqueue(self, channel: str, text: str):
+        self._outbox.append((channel, text))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        await asyncio.sleep(settings.BROADCAST_BATCH_MS / 1000)
+        batch, self._outbox = self._outbox, []
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for channel, text in batch:
+                    pipe.publish(channel, text)
+                await pipe.execute()
+        except Exception as e:
+            print(f"Broadcast publish of {len(batch)} messages failed: {e}")
+        if self._outbox:  # Published to while we were sending
+            self._flusher = asyncio.create_task(self._flush())
+
+    # Subscribing
+
+    async def subscribe(self, user_id: str):
+        await self._subscribe(CHANNEL_PREFIX + user_id)
+
+    async def _subscribe(self, channel: str):
+        if channel in self._channels:
+            return
+        self._channels.add(channel)
+        await self._pubsub.subscribe(channel)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+
+    async def unsubscribe(self, user_id: str):
+        channel = CHANNEL_PREFIX + user_id
+        if channel not in self._channels:
+            return
+        self._channels.discard(channel)
+        await self._pubsub.unsubscribe(channel)
+
+    async def _read(self):
+        # get_message() always awaits the connection (unlike listen(), which
+        # returns at once while no subscription is confirmed yet, e.g. between
+        # the last unsubscribe reply and a new subscribe's reply)
+        while self._channels:
+            try:
+                message = await self._pubsub.get_message(
+                    timeout=READ_TIMEOUT_SECONDS
+                )
+                if message is None or message["type"] != "message":
+                    continue
+                channel = message["channel"].decode()
+                text = message["data"].decode()
+                if channel == EVENTS_CHANNEL:
+                    await self._on_event(text)
+                else:
+                    await self._deliver(channel[len(CHANNEL_PREFIX) :], text)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Broadcast subscription error, reconnecting: {e}")
+                await asyncio.sleep(1)
+        # Restarted by the next subscribe()
+
+    async def close(self):
+        if self._flusher is not None:
+            await asyncio.gather(self._flusher, return_exceptions=True)
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        if self._redis is not None:
+            await self._redis.aclose()
+
+
+def create_backend() -> BroadcastBackend:
+    if settings.BROADCAST_BACKEND == "redis":
+        return RedisBroadcast(settings.REDIS_URL)
+    if settings.BROADCAST_BACKEND == "memory":
+        return InMemoryBroadcast()
+    raise ValueError(f"Unknown broadcast backend: {settings.BROADCAST_BACKEND}")
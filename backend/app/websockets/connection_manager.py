@@ -1,39 +1,89 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from fastapi import WebSocket
 
+from app.core.config import settings
+from app.core.serialization import dumps
+from app.websockets.broadcast import BroadcastBackend, OnEvent, create_backend
+from app.websockets.streaming import WebSocketSender
+
 
 class ConnectionManager:
     def __init__(self):
         # Map user_id to a list of active WebSockets (user might have multiple tabs)
         self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Outbound queue and writer task of each connection
+        self.senders: Dict[WebSocket, WebSocketSender] = {}
+        # Chat turns streaming per user, across all of their connections
+        self.active_turns: Dict[str, int] = {}
+        # Carries broadcast_to_user messages between processes
+        self.backend: BroadcastBackend = create_backend()
+
+    async def start(self, receive: bool = True, on_event: Optional[OnEvent] = None):
+        """`receive=False` for processes that only broadcast (ingestion workers)."""
+        await self.backend.start(self._deliver_local if receive else None, on_event)
 
-    async def connect(self, websocket: WebSocket, user_id: str):
+    async def close(self):
+        await self.backend.close()
+
+    async def connect(self, websocket: WebSocket, user_id: str) -> WebSocketSender:
         await websocket.accept()
         if user_id not in self.active_connections:
             self.active_connections[user_id] = []
+            # First socket of this user on this process
+            await self.backend.subscribe(user_id)
         self.active_connections[user_id].append(websocket)
+        sender = WebSocketSender(websocket)
+        self.senders[websocket] = sender
+        return sender
 
-    def disconnect(self, websocket: WebSocket, user_id: str):
+    async def disconnect(self, websocket: WebSocket, user_id: str):
+        sender = self.senders.pop(websocket, None)
+        if sender is not None:
+            sender.close()
         if user_id in self.active_connections:
             if websocket in self.active_connections[user_id]:
                 self.active_connections[user_id].remove(websocket)
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
+                await self.backend.unsubscribe(user_id)
+
+    def acquire_turn(self, user_id: str) -> bool:
+        if self.active_turns.get(user_id, 0) >= settings.WS_MAX_TURNS_PER_USER:
+            return False
+        self.active_turns[user_id] = self.active_turns.get(user_id, 0) + 1
+        return True
+
+    def release_turn(self, user_id: str):
+        remaining = self.active_turns.get(user_id, 0) - 1
+        if remaining > 0:
+            self.active_turns[user_id] = remaining
+        else:
+            self.active_turns.pop(user_id, None)
 
     async def send_message(self, message: dict, websocket: WebSocket):
-        await websocket.send_json(message)
+        await self.senders[websocket].send(message)
 
     async def broadcast_to_user(self, message: dict, user_id: str):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id][:]: # Iterate over a copy
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"Error sending message to user {user_id}: {e}")
-                    # Remove dead connection
-                    if connection in self.active_connections[user_id]:
-                        self.active_connections[user_id].remove(connection)
+        """Deliver to all of the user's sockets, on whichever process they are."""
+        await self.backend.publish(user_id, dumps(message))
+
+    async def publish_event(self, event: dict):
+        """Send a process-wide event to every API process (see `start`)."""
+        await self.backend.publish_event(dumps(event))
+
+    async def _deliver_local(self, user_id: str, text: str):
+        # Non-blocking: every socket has its own queue and writer task, so the
+        # frame goes out on all of them concurrently. Iterate over a copy.
+        for connection in self.active_connections.get(user_id, [])[:]:
+            sender = self.senders.get(connection)
+            if sender is None or sender.try_send_text(text):
+                continue
+            if sender.closed:
+                # Remove dead connection
+                await self.disconnect(connection, user_id)
+            else:
+                print(f"Dropped message for slow WebSocket of user {user_id}")
 
 
 manager = ConnectionManager()
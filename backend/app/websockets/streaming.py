@@ -0,0 +1,129 @@
+"""
+Outbound WebSocket framing.
+
+Every connection gets a `WebSocketSender`: frames are serialized once and
+queued, and a writer task drains the bounded queue to the socket. A client
+that cannot keep up fills the queue. If a frame cannot be queued within
+WS_SLOW_CONSUMER_SECONDS, `SlowConsumerError` is raised so the producer can
+give up instead of stalling.
+
+`TokenBatcher` coalesces streamed tokens into `chat_token` frames, flushing
+every WS_TOKEN_FLUSH_MS or once WS_TOKEN_FLUSH_BYTES are buffered.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from fastapi import WebSocket
+
+from app.core.config import settings
+from app.core.serialization import dumps
+
+
+class SlowConsumerError(Exception):
+    pass
+
+
+class WebSocketSender:
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.closed = False
+        self.frames_sent = 0
+        self._writer = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            while True:
+                text = await self.queue.get()
+                await self.websocket.send_text(text)
+                self.frames_sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.closed = True  # Client went away; the receive loop handles it
+
+    def try_send(self, message: Dict[str, Any]) -> bool:
+        """Queue without waiting; False if the client is closed or behind."""
+        return self.try_send_text(dumps(message))
+
+    def try_send_text(self, text: str) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def send(self, message: Dict[str, Any]):
+        if self.closed:
+            raise ConnectionError("WebSocket is closed")
+        text = dumps(message)
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(
+                    self.queue.put(text), settings.WS_SLOW_CONSUMER_SECONDS
+                )
+            except asyncio.TimeoutError:
+                raise SlowConsumerError(
+                    f"Client did not read {self.queue.maxsize} frames "
+                    f"in {settings.WS_SLOW_CONSUMER_SECONDS}s"
+                )
+
+    def close(self):
+        self.closed = True
+        self._writer.cancel()
+
+
+class TokenBatcher:
+    """Buffers tokens and sends them as one frame per time window or byte budget."""
+
+    def __init__(self, sender: WebSocketSender, extra: Optional[Dict[str, Any]] = None):
+        self.sender = sender
+        self.extra = extra or {}
+        self._parts: List[str] = []
+        self._bytes = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._window = settings.WS_TOKEN_FLUSH_MS / 1000
+
+    def _frame(self) -> Dict[str, Any]:
+        return {"type": "chat_token", "token": "".join(self._parts), **self.extra}
+
+    def _clear(self):
+        self._parts = []
+        self._bytes = 0
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _on_timer(self):
+        # Sent from the event loop (no awaiting); a full queue leaves the
+        # tokens buffered for the next add() or flush()
+        self._timer = None
+        if self._parts and self.sender.try_send(self._frame()):
+            self._clear()
+
+    async def add(self, token: str):
+        self._parts.append(token)
+        self._bytes += len(token.encode("utf-8"))
+        if self._window <= 0 or self._bytes >= settings.WS_TOKEN_FLUSH_BYTES:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self._window, self._on_timer
+            )
+
+    async def flush(self):
+        self._cancel_timer()
+        if self._parts:
+            frame = self._frame()
+            self._clear()
+            await self.sender.send(frame)
+
+    def discard(self):
+        self._cancel_timer()
+        self._clear()
@@ -0,0 +1,173 @@
+"""
+Ingestion worker.
+
+Run one or more of these next to the API (on any node that shares MongoDB,
+Qdrant and UPLOAD_DIR):
+
+    python -m app.worker
+"""
+import asyncio
+import os
+import signal
+import socket
+import traceback
+import uuid
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.db.indexes import ensure_schema
+from app.db.mongodb import mongo_db
+from app.db.qdrant import qdrant_db
+from app.services import ingestion_service
+from app.services.cpu_pool import cpu_pool
+from app.services.embedding_service import embedding_service
+from app.services.job_queue import LEASE_EXPIRED, job_queue
+from app.websockets.connection_manager import manager
+
+
+class IngestionWorker:
+    """Pulls jobs from the durable queue and runs up to `concurrency` at once."""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stopping = asyncio.Event()
+        self._loops: List[asyncio.Task] = []
+
+    def start(self):
+        self._loops = [
+            asyncio.create_task(self._loop()) for _ in range(self.concurrency)
+        ]
+        print(f"Ingestion worker {self.worker_id} started ({self.concurrency} slots)")
+
+    async def stop(self):
+        """Stop claiming new jobs and give the running ones a while to finish."""
+        self._stopping.set()
+        if not self._loops:
+            return
+        _, running = await asyncio.wait(
+            self._loops, timeout=settings.INGESTION_STOP_TIMEOUT_SECONDS
+        )
+        # Their leases expire and another worker picks the jobs up again
+        for loop in running:
+            loop.cancel()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+
+    async def _give_up_expired(self):
+        for job in await job_queue.give_up_expired():
+            print(f"Giving up on job {job['_id']}: lease expired on its last attempt")
+            await ingestion_service.abandon_job(job, LEASE_EXPIRED)
+
+    async def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                await self._give_up_expired()
+                job = await job_queue.claim(self.worker_id)
+            except Exception as e:
+                print(f"Error claiming ingestion job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(
+                        self._stopping.wait(), settings.INGESTION_POLL_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _heartbeat(self, job: Dict[str, Any], runner: asyncio.Task):
+        while True:
+            await asyncio.sleep(settings.INGESTION_HEARTBEAT_SECONDS)
+            try:
+                renewed = await job_queue.heartbeat(job["_id"], self.worker_id)
+            except Exception as e:
+                # Transient (e.g. a MongoDB failover); the lease outlasts
+                # several heartbeat periods, so keep trying
+                print(f"Heartbeat for job {job['_id']} failed: {e}")
+                continue
+            if not renewed:
+                print(f"Lost lease on job {job['_id']}, abandoning it")
+                runner.cancel()
+                return
+
+    async def _run(self, job: Dict[str, Any]):
+        runner = asyncio.create_task(self._execute(job))
+        heartbeat = asyncio.create_task(self._heartbeat(job, runner))
+        error: Optional[str] = None
+        try:
+            await runner
+        except asyncio.CancelledError:
+            return  # Lease was taken over by another worker, or we are stopping
+        except Exception as e:
+            traceback.print_exc()
+            error = str(e)
+        finally:
+            heartbeat.cancel()
+
+        try:
+            if error is None:
+                await job_queue.complete(job)
+            else:
+                await job_queue.fail(job, error)
+        except Exception as e:
+            # The lease will expire and the job will be picked up again
+            print(f"Error recording result of job {job['_id']}: {e}")
+
+    async def _execute(self, job: Dict[str, Any]):
+        final_attempt = job["attempts"] >= job["max_attempts"]
+        args = job["args"]
+        if job["kind"] == "batch":
+            # Cleans up after earlier attempts itself, per document
+            await ingestion_service.process_batch(
+                args["batch_id"],
+                args["documents"],
+                job["user_id"],
+                final_attempt,
+                retry=job["attempts"] > 1,
+            )
+            return
+
+        # Vectors left by an earlier, partially completed attempt are kept:
+        # documents sync incrementally, so the retry only embeds what is missing
+        if job["kind"] == "document":
+            await ingestion_service.process_document(
+                job["doc_id"], args["file_path"], job["user_id"], final_attempt
+            )
+        elif job["kind"] == "url":
+            await ingestion_service.process_url(
+                job["doc_id"], args["url"], job["user_id"], final_attempt
+            )
+        else:
+            raise ValueError(f"Unknown ingestion job kind: {job['kind']}")
+
+
+async def main():
+    mongo_db.connect()
+    qdrant_db.connect()
+    await ensure_schema()
+    await manager.start(receive=False)  # Progress updates reach the API's sockets
+
+    worker = IngestionWorker(settings.INGESTION_WORKER_CONCURRENCY)
+    worker.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    await stop.wait()
+
+    print("Shutting down ingestion worker...")
+    await worker.stop()
+    await embedding_service.close()
+    cpu_pool.shutdown()
+    await manager.close()
+    mongo_db.close()
+    await qdrant_db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Event-loop lag during a burst of concurrent logins.
+
+Runs N concurrent password verifications twice: bcrypt called inline on the
+event loop (as login used to do), then through `security.password_hasher`.
+A ticker measures how late the event loop wakes it up, which is the stall
+every streaming chat on the worker would see.
+
+    python benchmark_login_lag.py [N] [rounds]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from app.core.config import settings
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+if len(sys.argv) > 2:
+    settings.BCRYPT_ROUNDS = int(sys.argv[2])
+settings.PASSWORD_HASH_QUEUE_TIMEOUT = 3600  # Measure lag, not rejections
+
+from app.core import security  # noqa: E402  (reads BCRYPT_ROUNDS at import)
+
+TICK = 0.01
+
+
+async def ticker(lags, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - started - TICK) * 1000)
+
+
+async def inline_login(hashed: str):
+    return security.verify_password("correct horse", hashed)
+
+
+async def offloaded_login(hashed: str):
+    return await security.password_hasher.verify_and_update("correct horse", hashed)
+
+
+async def run(label: str, login, hashed: str):
+    lags = []
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(TICK * 2)
+    started = time.perf_counter()
+    await asyncio.gather(*(login(hashed) for _ in range(N)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+    lags.sort()
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    print(
+        f"{label:<10} {N} logins in {elapsed:6.2f}s ({N / elapsed:6.1f}/s) | "
+        f"loop lag ms: median {statistics.median(lags):7.1f}, "
+        f"p99 {p99:7.1f}, max {lags[-1]:7.1f}"
+    )
+
+
+async def main():
+    hashed = security.get_password_hash("correct horse")
+    print(
+        f"bcrypt rounds={settings.BCRYPT_ROUNDS}, "
+        f"PASSWORD_HASH_CONCURRENCY={settings.PASSWORD_HASH_CONCURRENCY}"
+    )
+    await run("inline", inline_login, hashed)
+    await run("offloaded", offloaded_login, hashed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,7 +1,8 @@
-import requests
 import json
 import sys
 
+import requests
+
 model_name = sys.argv[1] if len(sys.argv) > 1 else "phi3:mini"
 url = "http://localhost:11434/api/pull"
 
@@ -24,5 +25,5 @@ for line in response.iter_lines():
             if status == "success":
                 print("\n✅ Model downloaded successfully!")
                 break
-        except:
+        except Exception:
             pass
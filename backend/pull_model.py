@@ -1,7 +1,9 @@
 import asyncio
-import httpx
 import json
 
+import httpx
+
+
 async def pull_model():
     url = "http://localhost:11434/api/pull"
     payload = {"name": "llama3.2"}
@@ -24,7 +26,7 @@ async def pull_model():
                             
                         if status == "success":
                             print("\nModel pulled successfully!")
-                    except:
+                    except Exception:
                         pass
 
 if __name__ == "__main__":
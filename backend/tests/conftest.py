@@ -0,0 +1,83 @@
+"""
+Shared fixtures. Tests run against in-memory backends: mongomock-motor for
+MongoDB, Qdrant's local mode, fakeredis, and a deterministic fake encoder in
+place of the sentence-transformers model.
+
+    cd backend && pip install -r requirements-dev.txt && pytest
+"""
+import hashlib
+import os
+import tempfile
+
+# Before the app reads its settings
+os.environ.setdefault("UPLOAD_DIR", tempfile.mkdtemp(prefix="test_uploads_"))
+os.environ["CHUNK_CACHE_ENABLED"] = "false"
+os.environ["INGESTION_EMBEDDED_WORKERS"] = "0"
+
+import numpy as np  # noqa: E402
+import pytest  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+from qdrant_client import AsyncQdrantClient  # noqa: E402
+
+from app.db.mongodb import mongo_db  # noqa: E402
+from app.db.qdrant import qdrant_db  # noqa: E402
+from app.services import embedding_service as embedding_module  # noqa: E402
+
+
+def fake_vector(text: str, dim: int = 384) -> np.ndarray:
+    seed = int(hashlib.md5(text.lower().encode()).hexdigest()[:8], 16)
+    return np.random.default_rng(seed).random(dim).astype(np.float32)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    mongo_db.client = AsyncMongoMockClient()
+    mongo_db.db = mongo_db.client["test"]
+    yield mongo_db.db
+    mongo_db.client = mongo_db.db = None
+
+
+@pytest.fixture
+def qdrant():
+    qdrant_db.client = AsyncQdrantClient(location=":memory:")
+    qdrant_db._collection_ready = False
+    qdrant_db.sparse_enabled = False
+    yield qdrant_db
+    qdrant_db.client = None
+    qdrant_db._collection_ready = False
+
+
+@pytest.fixture
+def encoder(monkeypatch):
+    """Fake model; returns the list of text batches it was asked to encode."""
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        return np.array([fake_vector(t) for t in texts])
+
+    monkeypatch.setattr(embedding_module, "_encode", encode)
+    yield calls
+    # The scheduler task and queue belong to this test's event loop
+    service = embedding_module.embedding_service
+    service._queue = None
+    service._worker = None
+
+
+@pytest.fixture
+def broadcasts(monkeypatch):
+    """Messages sent to users' sockets, as (user_id, message)."""
+    from app.websockets.connection_manager import manager
+
+    sent = []
+
+    async def broadcast_to_user(message, user_id):
+        sent.append((user_id, message))
+
+    monkeypatch.setattr(manager, "broadcast_to_user", broadcast_to_user)
+    return sent
@@ -0,0 +1,76 @@
+import json
+import time
+
+import pytest
+from bson import ObjectId
+
+from app.core import auth_cache
+from app.core.config import settings
+from app.services import cache_invalidation
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(auth_cache, "_principals", auth_cache.TTLCache(100))
+    monkeypatch.setattr(auth_cache, "_invalidated_at", {})
+    monkeypatch.setattr(settings, "AUTH_EMBED_CLAIMS", True)
+
+
+@pytest.fixture
+async def user(db):
+    doc = {"email": "a@example.com", "full_name": "Ann", "is_active": True}
+    result = await db.users.insert_one(doc)
+    return {"_id": result.inserted_id, **doc}
+
+
+def token_payload(user, issued_at=None):
+    return {
+        "sub": str(user["_id"]),
+        "iat": int(time.time()) - 5 if issued_at is None else issued_at,
+        "usr": auth_cache.user_claims(user),
+    }
+
+
+async def test_user_change_invalidates_cached_principal_and_claims(db, user):
+    payload = token_payload(user)
+    assert (await auth_cache.get_principal(payload, db)).full_name == "Ann"
+
+    await db.users.update_one({"_id": user["_id"]}, {"$set": {"full_name": "Bo"}})
+    await cache_invalidation.invalidate_user(str(user["_id"]))
+    # The token still carries the old claims; it is now served from MongoDB
+    assert (await auth_cache.get_principal(payload, db)).full_name == "Bo"
+
+
+async def test_deactivation_reaches_tokens_issued_before_it(db, user):
+    payload = token_payload(user)
+    await auth_cache.get_principal(payload, db)
+    await db.users.update_one({"_id": user["_id"]}, {"$set": {"is_active": False}})
+    await cache_invalidation.invalidate_user(str(user["_id"]))
+    assert not (await auth_cache.get_principal(payload, db)).is_active
+
+
+async def test_invalidation_from_another_process(db, user):
+    payload = token_payload(user)
+    await auth_cache.get_principal(payload, db)
+    await db.users.update_one({"_id": user["_id"]}, {"$set": {"full_name": "Bo"}})
+
+    event = {"type": "invalidate_user", "user_id": str(user["_id"])}
+    await cache_invalidation.on_event(json.dumps({**event, "at": int(time.time())}))
+    assert (await auth_cache.get_principal(payload, db)).full_name == "Bo"
+
+
+async def test_replayed_event_does_not_move_the_invalidation_back():
+    now = int(time.time())
+    auth_cache.invalidate_user("u1", at=now)
+    auth_cache.invalidate_user("u1", at=now - 10)
+    assert auth_cache._invalidated_at["u1"] == now
+
+
+async def test_invalidations_older_than_any_access_token_are_pruned():
+    expired = int(time.time()) - settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60 - 1
+    auth_cache.invalidate_user("old", at=expired)
+    auth_cache.invalidate_user(str(ObjectId()))
+    assert "old" not in auth_cache._invalidated_at
+    assert auth_cache.stats()["invalidated_users"] == 1
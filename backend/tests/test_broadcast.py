@@ -0,0 +1,126 @@
+import asyncio
+
+import fakeredis.aioredis
+import pytest
+
+from app.websockets import broadcast
+from app.websockets.broadcast import InMemoryBroadcast, RedisBroadcast
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def redis_backend(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        "redis.asyncio.from_url",
+        lambda url: fakeredis.aioredis.FakeRedis(server=server),
+    )
+    monkeypatch.setattr(broadcast, "READ_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(broadcast.settings, "BROADCAST_BATCH_MS", 1.0)
+
+    async def make(deliver=None, on_event=None):
+        backend = RedisBroadcast("redis://fake")
+        await backend.start(deliver, on_event)
+        return backend
+
+    return make
+
+
+async def wait_for(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+async def test_memory_backend_delivers_directly():
+    received = []
+
+    async def deliver(user_id, text):
+        received.append((user_id, text))
+
+    backend = InMemoryBroadcast()
+    await backend.start(deliver)
+    await backend.publish("u1", "hello")
+    assert received == [("u1", "hello")]
+
+
+async def test_redis_fans_out_to_the_subscribed_process(redis_backend):
+    received = []
+
+    async def deliver(user_id, text):
+        received.append((user_id, text))
+
+    api = await redis_backend(deliver)
+    worker = await redis_backend()  # Publish-only, like an ingestion worker
+    await api.subscribe("u1")
+    await asyncio.sleep(0.05)
+
+    for i in range(3):
+        await worker.publish("u1", f"m{i}")
+    await worker.publish("u2", "not subscribed")
+    await wait_for(lambda: len(received) == 3)
+    assert received == [("u1", "m0"), ("u1", "m1"), ("u1", "m2")]
+    await api.close()
+    await worker.close()
+
+
+async def test_events_reach_every_api_process(redis_backend):
+    delivered, events = [], []
+
+    async def deliver(user_id, text):
+        delivered.append(user_id)
+
+    async def on_event(text):
+        events.append(text)
+
+    api1 = await redis_backend(deliver, on_event)
+    api2 = await redis_backend(deliver, on_event)
+    worker = await redis_backend()
+    await asyncio.sleep(0.05)
+
+    await worker.publish_event("e1")
+    await wait_for(lambda: len(events) == 2)
+    assert events == ["e1", "e1"] and delivered == []
+    for backend in (api1, api2, worker):
+        await backend.close()
+
+
+async def test_reader_yields_while_no_subscription_is_confirmed(redis_backend):
+    received = []
+
+    async def deliver(user_id, text):
+        received.append(user_id)
+
+    api = await redis_backend(deliver)
+    await api.subscribe("u1")
+    await api.unsubscribe("u1")
+    # Another user's subscribe is still in flight: the process tracks a
+    # channel, but the pubsub has no confirmed subscription
+    api._channels.add(broadcast.CHANNEL_PREFIX + "u2")
+    await wait_for(lambda: not api._pubsub.subscribed)
+
+    ticks = 0
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+        ticks += 1
+    assert ticks == 5  # The event loop was not starved by the reader
+
+    api._channels.clear()
+    await api.subscribe("u3")
+    await asyncio.sleep(0.05)
+    await api.publish("u3", "hi")
+    await wait_for(lambda: received == ["u3"])
+    await api.close()
+
+
+async def test_reader_stops_after_the_last_unsubscribe(redis_backend):
+    api = await redis_backend(lambda *_: None)
+    await api.subscribe("u1")
+    reader = api._reader
+    await api.unsubscribe("u1")
+    await asyncio.wait_for(reader, 1.0)
+    await api.subscribe("u1")
+    assert api._reader is not reader and not api._reader.done()
+    await api.close()
@@ -0,0 +1,47 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.services import cache_invalidation
+from app.services.response_cache import response_cache
+from app.websockets.connection_manager import manager
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    monkeypatch.setattr(response_cache.__class__, "enabled", True)
+    response_cache.store("u1", np.ones(4), "fp", "answer")
+    yield
+    response_cache.invalidate_user("u1")
+
+
+@pytest.fixture
+def published(monkeypatch):
+    events = []
+
+    async def publish_event(event):
+        events.append(event)
+
+    monkeypatch.setattr(manager, "publish_event", publish_event)
+    return events
+
+
+async def test_invalidation_is_applied_locally_and_published(cached, published):
+    await cache_invalidation.invalidate_responses("u1")
+    assert response_cache.lookup("u1", np.ones(4), "fp") is None
+    assert published == [{"type": "invalidate_responses", "user_id": "u1"}]
+
+
+async def test_event_from_another_process_drops_the_entries(cached):
+    # e.g. an ingestion worker finished one of u1's documents
+    event = {"type": "invalidate_responses", "user_id": "u1"}
+    await cache_invalidation.on_event(json.dumps(event))
+    assert response_cache.lookup("u1", np.ones(4), "fp") is None
+
+
+async def test_unknown_events_are_ignored(cached):
+    await cache_invalidation.on_event(json.dumps({"type": "something_else"}))
+    assert response_cache.lookup("u1", np.ones(4), "fp") == "answer"
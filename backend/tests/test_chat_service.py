@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+
+from app.core.config import settings
+from app.services import chat_service
+
+pytestmark = pytest.mark.anyio
+
+
+class LostReply:
+    """Collection whose first write goes through but whose reply is lost."""
+
+    def __init__(self, collection, method):
+        self._collection = collection
+        self._method = method
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    async def write(self, *args, **kwargs):
+        self.calls += 1
+        result = await getattr(self._collection, self._method)(*args, **kwargs)
+        if self.calls == 1:
+            raise AutoReconnect("connection reset")
+        return result
+
+
+class FlakyDb:
+    def __init__(self, db, **flaky):
+        self.chat_messages = db.chat_messages
+        self.chat_sessions = db.chat_sessions
+        for name, method in flaky.items():
+            collection = LostReply(getattr(db, name), method)
+            setattr(collection, method, collection.write)
+            setattr(self, name, collection)
+
+
+@pytest.fixture
+def session(db, monkeypatch):
+    monkeypatch.setattr(settings, "BACKGROUND_WRITE_ATTEMPTS", 3)
+    session_id = ObjectId()
+
+    async def create():
+        stale = datetime.utcnow() - timedelta(days=1)
+        await db.chat_sessions.insert_one({"_id": session_id, "updated_at": stale})
+        return str(session_id)
+
+    return create
+
+
+def user_message(session_id):
+    return {
+        "_id": ObjectId(),
+        "session_id": session_id,
+        "role": "user",
+        "content": "hi",
+        "timestamp": datetime.utcnow(),
+    }
+
+
+async def test_retried_user_message_insert_is_not_duplicated(db, session):
+    session_id = await session()
+    flaky = FlakyDb(db, chat_messages="insert_one")
+    await chat_service._save_user_message(flaky, session_id, user_message(session_id))
+    assert flaky.chat_messages.calls == 2
+    assert await db.chat_messages.count_documents({}) == 1
+
+
+async def test_session_touch_is_retried_without_reinserting(db, session):
+    session_id = await session()
+    flaky = FlakyDb(db, chat_sessions="update_one")
+    await chat_service._save_user_message(flaky, session_id, user_message(session_id))
+    assert await db.chat_messages.count_documents({}) == 1
+    touched = await db.chat_sessions.find_one()
+    assert touched["updated_at"] > datetime.utcnow() - timedelta(minutes=1)
@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import cpu_pool as cpu_pool_module
+from app.services import embedding_service as embedding_module
+from app.services.cpu_pool import CPUPool, html_to_chunks
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeModel:
+    def encode(self, texts):
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Process mode, with the pool's tasks run on a thread of this process."""
+    monkeypatch.setattr(settings, "INGESTION_EXECUTION_MODE", "process")
+    monkeypatch.setattr(embedding_module, "get_embedding_model", FakeModel)
+    pool = CPUPool()
+    pool._executor = ThreadPoolExecutor(max_workers=1)
+    yield pool
+    pool.shutdown()
+
+
+async def test_thread_mode_runs_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(settings, "INGESTION_EXECUTION_MODE", "thread")
+    pool = CPUPool()
+    assert not pool.enabled
+    assert await pool.run(threading.current_thread) is not threading.current_thread()
+    assert pool._executor is None
+
+
+async def test_process_mode_runs_in_the_pool(pool):
+    name = await pool.run(lambda: threading.current_thread().name)
+    assert name.startswith("ThreadPoolExecutor")
+
+
+async def test_encoded_vectors_come_back_through_shared_memory(pool, monkeypatch):
+    names = []
+    create = cpu_pool_module._encode_to_shared_memory
+
+    def encode(texts):
+        result = create(texts)
+        names.append(result[0])
+        return result
+
+    monkeypatch.setattr(cpu_pool_module, "_encode_to_shared_memory", encode)
+    vectors = await pool.encode(["a", "abc"])
+    np.testing.assert_array_equal(vectors, [[1, 1], [3, 1]])
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=names[0])  # Unlinked after the copy
+
+
+def test_html_is_stripped_and_chunked():
+    pytest.importorskip("bs4")
+    html = (
+        "<html><head><style>p {}</style><script>x()</script></head>"
+        "<body><h1>Title</h1>\n<p>  first  second </p></body></html>"
+    )
+    assert html_to_chunks(html, chunk_size=8) == ["Title\nfi", "rst\nseco", "nd"]
@@ -0,0 +1,148 @@
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.embedding_cache import (
+    ChunkEmbeddingStore,
+    QueryEmbeddingCache,
+    normalize_query,
+)
+
+DIM = 8
+
+
+def vectors(n, start=0):
+    return np.arange(start * DIM, (start + n) * DIM, dtype=np.float32).reshape(n, DIM)
+
+
+@pytest.fixture
+def store(tmp_path):
+    record_bytes = 8 + DIM * 4
+    store = ChunkEmbeddingStore(str(tmp_path), 4 * record_bytes, model="test")
+    yield store
+    store.close()
+
+
+def test_normalized_queries_share_a_key():
+    assert normalize_query("  What   is RAG?? ") == normalize_query("what is rag")
+    assert normalize_query("what is rag") != normalize_query("what was rag")
+
+
+def test_query_cache_is_bounded_by_bytes_in_lru_order():
+    one = np.ones(DIM, dtype=np.float32)
+    cache = QueryEmbeddingCache(100, max_bytes=2 * one.nbytes, ttl_seconds=60)
+    cache.put("a", one)
+    cache.put("b", one)
+    cache.get("a")
+    cache.put("c", one)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["bytes"] == 2 * one.nbytes
+
+
+def test_query_cache_entries_expire(monkeypatch):
+    cache = QueryEmbeddingCache(100, max_bytes=1 << 20, ttl_seconds=60)
+    cache.put("a", np.ones(DIM))
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_float16_entries_are_returned_as_float32():
+    cache = QueryEmbeddingCache(100, 1 << 20, 60, use_float16=True)
+    cache.put("a", np.full(DIM, 0.5))
+    assert cache.stats()["bytes"] == DIM * 2
+    assert cache.get("a").dtype == np.float32
+
+
+@pytest.mark.anyio
+async def test_shared_tier_serves_other_workers(tmp_path):
+    path = str(tmp_path / "queries.sqlite")
+    first = QueryEmbeddingCache(100, 1 << 20, 60, path=path)
+    second = QueryEmbeddingCache(100, 1 << 20, 60, path=path)
+    first.put("a", np.arange(DIM))
+    first.close()  # Waits for the write-behind
+    assert second.get("a") is None  # The synchronous lookup stays in process
+    np.testing.assert_array_equal(await second.aget("a"), np.arange(DIM))
+    assert second.stats()["shared_hits"] == 1
+    await second.aget("a")
+    assert second.stats()["hits"] == 1
+    second.close()
+
+
+@pytest.mark.anyio
+async def test_shared_tier_is_read_off_the_event_loop(tmp_path):
+    cache = QueryEmbeddingCache(100, 1 << 20, 60, path=str(tmp_path / "q.sqlite"))
+    threads = []
+
+    def get(key):
+        threads.append(threading.current_thread().name)
+
+    cache._shared.get = get
+    assert await cache.aget("a") is None
+    assert threads[0].startswith("query-cache")
+    cache.close()
+
+
+class FailingCommit:
+    """Wraps the sqlite connection so that COMMIT fails."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *args):
+        if sql == "COMMIT":
+            raise sqlite3.OperationalError("database is locked")
+        return self.conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def test_round_trip_returns_copies(store):
+    store.put_many(["a", "b"], vectors(2))
+    a, b, missing = store.get_many(["a", "b", "c"])
+    np.testing.assert_array_equal(a, vectors(2)[0])
+    np.testing.assert_array_equal(b, vectors(2)[1])
+    assert missing is None
+    a[:] = -1
+    np.testing.assert_array_equal(store.get_many(["a"])[0], vectors(2)[0])
+
+
+def test_failed_commit_leaves_slot_file_untouched(store):
+    store.put_many(["a", "b", "c", "d"], vectors(4))
+    before = np.array(store._slots)
+    conn = store.conn
+    store.conn = FailingCommit(conn)
+    store.put_many(["e", "f"], vectors(2, start=4))  # Needs a compaction
+    store.conn = conn
+    np.testing.assert_array_equal(np.array(store._slots), before)
+    assert store.stored == 4 and store.evicted == 0
+    found = store.get_many(["a", "b", "c", "d", "e"])
+    assert [vector is not None for vector in found] == [True] * 4 + [False]
+
+
+def test_compaction_reuses_least_recently_used_slots(store, monkeypatch):
+    monkeypatch.setattr(settings, "CHUNK_CACHE_COMPACT_FRACTION", 0.5)
+    store.put_many(["a", "b", "c", "d"], vectors(4))
+    store.get_many(["c", "d"])
+    store.put_many(["e"], vectors(1, start=4))
+    a, b, c, d, e = store.get_many(["a", "b", "c", "d", "e"])
+    assert a is None and b is None
+    np.testing.assert_array_equal(e, vectors(1, start=4)[0])
+    np.testing.assert_array_equal(c, vectors(4)[2])
+    assert store.evicted == 2
+
+
+def test_entry_whose_write_never_landed_is_rewritten(store):
+    store.put_many(["a"], vectors(1))
+    slot = store._lookup([store._key("a")])[store._key("a")]
+    store._slots["tag"][slot] = 0  # As if the process died after COMMIT
+    assert store.get_many(["a"]) == [None]
+    store.put_many(["a"], vectors(1))
+    np.testing.assert_array_equal(store.get_many(["a"])[0], vectors(1)[0])
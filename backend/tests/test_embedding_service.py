@@ -0,0 +1,61 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import embedding_service as embedding_module
+from app.services.embedding_service import PRIORITY_BULK, EmbeddingService
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def service(encoder):
+    service = EmbeddingService()
+    yield service
+    await service.close()
+
+
+async def test_concurrent_queries_share_one_forward_pass(service, encoder):
+    vectors = await asyncio.gather(
+        *[service.encode_query(text) for text in ("a", "b", "c")]
+    )
+    assert encoder == [["a", "b", "c"]]
+    assert service.stats()["avg_requests_per_batch"] == 3
+    expected = embedding_module._encode(["a", "b", "c"])
+    for vector, row in zip(vectors, expected):
+        np.testing.assert_array_equal(vector, row)
+
+
+async def test_batch_is_capped_at_the_max_size(service, encoder, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_MAX_BATCH_SIZE", 2)
+    await asyncio.gather(*[service.encode_query(text) for text in "abcde"])
+    assert encoder == [["a", "b"], ["c", "d"], ["e"]]
+
+
+async def test_queries_go_ahead_of_queued_bulk_work(service, encoder, monkeypatch):
+    monkeypatch.setattr(settings, "EMBEDDING_BULK_BATCH_SIZE", 2)
+    documents = asyncio.ensure_future(service.encode_documents(["d1", "d2", "d3"]))
+    query = asyncio.ensure_future(service.encode_query("q"))
+    vectors = await documents
+    await query
+    assert encoder == [["q"], ["d1", "d2"], ["d3"]]
+    assert vectors.shape == (3, 384)
+
+
+async def test_repeated_query_is_served_from_the_cache(service, encoder):
+    await service.encode_query("What is RAG?")
+    await service.encode_query("  what is rag ")
+    assert encoder == [["What is RAG?"]]
+
+
+async def test_encoder_error_fails_the_batch_only(service, encoder, monkeypatch):
+    def broken(texts):
+        raise RuntimeError("model failed")
+
+    monkeypatch.setattr(embedding_module, "_encode", broken)
+    with pytest.raises(RuntimeError):
+        await service._submit(["a"], PRIORITY_BULK)
+    monkeypatch.setattr(embedding_module, "_encode", lambda texts: np.ones((1, 4)))
+    assert (await service._submit(["a"], PRIORITY_BULK)).shape == (1, 4)
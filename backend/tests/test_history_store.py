@@ -0,0 +1,73 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.core.config import settings
+from app.services.history_store import HistoryStore
+
+pytestmark = pytest.mark.anyio
+
+
+def message(role, content, seconds=0):
+    timestamp = datetime(2026, 1, 1) + timedelta(seconds=seconds)
+    return {"role": role, "content": content, "timestamp": timestamp}
+
+
+@pytest.fixture
+async def session(db):
+    session_id = ObjectId()
+    await db.chat_sessions.insert_one({"_id": session_id})
+    await db.chat_messages.insert_many(
+        [
+            {"session_id": str(session_id), **message("user", "q1", 0)},
+            {"session_id": str(session_id), **message("assistant", "a1", 1)},
+        ]
+    )
+    return str(session_id)
+
+
+async def test_append_to_a_cold_session_survives_the_load(session):
+    store = HistoryStore()
+    # The user message's write has not landed when the load queries MongoDB
+    store.append(session, message("user", "q2", 2))
+    _, messages = await store.recent(session, 10)
+    assert [m["content"] for m in messages] == ["q1", "a1", "q2"]
+    assert store.loads == 1
+
+
+async def test_append_while_loading_and_write_landing_is_not_doubled(db, session):
+    store = HistoryStore()
+    loading = asyncio.ensure_future(store.recent(session, 10))
+    q2 = message("user", "q2", 2)
+    store.append(session, q2)
+    await db.chat_messages.insert_one({"session_id": session, **q2})
+    await loading
+    _, messages = await store.recent(session, 10)
+    assert [m["content"] for m in messages] == ["q1", "a1", "q2"]
+    assert store.loads == 1
+
+
+async def test_append_to_an_expired_session_reloads_it(session, monkeypatch):
+    store = HistoryStore()
+    await store.recent(session, 10)
+    monkeypatch.setattr(settings, "HISTORY_CACHE_TTL_SECONDS", -1)
+    store.append(session, message("user", "q2", 2))
+    monkeypatch.setattr(settings, "HISTORY_CACHE_TTL_SECONDS", 60)
+    _, messages = await store.recent(session, 10)
+    assert [m["content"] for m in messages] == ["q1", "a1", "q2"]
+    assert store.loads == 2
+
+
+async def test_recent_excludes_summarized_and_later_messages(db, session):
+    store = HistoryStore()
+    await db.chat_sessions.update_one(
+        {"_id": ObjectId(session)},
+        {"$set": {"summary": "s", "summary_until": datetime(2026, 1, 1)}},
+    )
+    store.append(session, message("user", "q2", 2))
+    summary, messages = await store.recent(
+        session, 10, before=datetime(2026, 1, 1, 0, 0, 2)
+    )
+    assert summary == "s" and [m["content"] for m in messages] == ["a1"]
@@ -0,0 +1,81 @@
+import pytest
+
+from app.db import indexes
+from app.db.indexes import HOT_QUERIES, INDEXES
+
+pytestmark = pytest.mark.anyio
+
+
+def serves(index_keys, query, sort):
+    """Equality prefix on the filtered fields, then the sort in either direction."""
+    fields = list(query)
+    if {key for key, _ in index_keys[: len(fields)]} != set(fields):
+        return False
+    rest = index_keys[len(fields) : len(fields) + len(sort)]
+    if len(rest) < len(sort):
+        return False
+    same = all(key == s and d == sd for (key, d), (s, sd) in zip(rest, sort))
+    reverse = all(key == s and d == -sd for (key, d), (s, sd) in zip(rest, sort))
+    return same or reverse
+
+
+@pytest.mark.parametrize("name, collection, query, sort", HOT_QUERIES)
+def test_every_hot_query_has_an_index(name, collection, query, sort):
+    keys = [list(model.document["key"].items()) for model in INDEXES[collection]]
+    assert any(serves(index, query, sort) for index in keys), name
+
+
+async def test_schema_bootstrap_builds_every_index(db, monkeypatch):
+    monkeypatch.setattr(indexes.settings, "MONGO_QUERY_AUDIT", False)
+    await indexes.ensure_schema()
+    await indexes.ensure_schema()  # Idempotent
+    for collection, models in INDEXES.items():
+        built = await db[collection].index_information()
+        for model in models:
+            assert model.document["name"] in built
+
+
+def test_plan_stages_are_found_at_any_depth():
+    plan = {
+        "stage": "FETCH",
+        "inputStage": {
+            "stage": "SORT_MERGE",
+            "inputStages": [{"stage": "IXSCAN"}, {"stage": "COLLSCAN"}],
+        },
+    }
+    assert set(indexes._stages(plan)) == {"FETCH", "SORT_MERGE", "IXSCAN", "COLLSCAN"}
+
+
+async def test_audit_warns_about_scans_and_in_memory_sorts(monkeypatch):
+    plans = {
+        "users": {"stage": "COLLSCAN"},
+        "chat_sessions": {"stage": "SORT", "inputStage": {"stage": "IXSCAN"}},
+    }
+
+    class Cursor:
+        def __init__(self, collection):
+            self.collection = collection
+
+        def sort(self, sort):
+            return self
+
+        async def explain(self):
+            plan = plans.get(self.collection, {"stage": "IXSCAN"})
+            return {"queryPlanner": {"winningPlan": plan}}
+
+    class Collection:
+        def __init__(self, name):
+            self.name = name
+
+        def find(self, query):
+            return Cursor(self.name)
+
+    class Database:
+        def __getitem__(self, name):
+            return Collection(name)
+
+    monkeypatch.setattr(indexes.mongo_db, "db", Database())
+    warnings = await indexes.audit_queries()
+    assert len(warnings) == 2
+    assert warnings[0].startswith("login by email: COLLSCAN")
+    assert warnings[1].startswith("list sessions: in-memory SORT")
@@ -0,0 +1,156 @@
+import hashlib
+import io
+import os
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException, UploadFile
+
+from app.api.endpoints import ingestion
+from app.services import ingestion_service
+from app.services.job_queue import job_queue
+
+pytestmark = pytest.mark.anyio
+
+USER = SimpleNamespace(id="u1")
+
+
+def upload(filename, data=None):
+    data = filename.encode() if data is None else data
+    return UploadFile(file=io.BytesIO(data), filename=filename)
+
+
+def zip_of(**members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def spooled():
+    """Files currently in UPLOAD_DIR."""
+    before = set(os.listdir(ingestion_service.UPLOAD_DIR))
+    return lambda: set(os.listdir(ingestion_service.UPLOAD_DIR)) - before
+
+
+async def test_batch_is_spooled_recorded_and_queued(db, spooled):
+    files = [upload("a.txt"), upload("docs.zip", zip_of(**{"b.txt": "b", "c.md": "c"}))]
+    response = await ingestion.upload_batch(files, False, USER, db)
+    assert [d["filename"] for d in response["documents"]] == ["a.txt", "b.txt", "c.md"]
+    assert len(spooled()) == 3
+    assert await db.ingestion_jobs.count_documents({}) == 1
+
+
+async def test_rejected_batch_removes_every_spooled_file(db, spooled):
+    files = [upload("a.txt"), upload("b.txt"), upload("broken.zip", b"not a zip")]
+    with pytest.raises(HTTPException) as info:
+        await ingestion.upload_batch(files, False, USER, db)
+    assert info.value.status_code == 400
+    assert spooled() == set()
+
+
+async def test_failure_after_spooling_removes_files_and_records(
+    db, spooled, monkeypatch
+):
+    async def enqueue(*args):
+        raise RuntimeError("mongo down")
+
+    monkeypatch.setattr(job_queue, "enqueue", enqueue)
+    with pytest.raises(RuntimeError):
+        files = [upload("a.txt"), upload("b.txt")]
+        await ingestion.upload_batch(files, False, USER, db)
+    assert spooled() == set()
+    assert await db.ingestion_batches.count_documents({}) == 0
+    assert await db.documents.count_documents({}) == 0
+
+
+async def test_partial_copy_is_removed(db, spooled, monkeypatch):
+    class Disconnects(io.BytesIO):
+        def read(self, *args):
+            raise OSError("client went away")
+
+    files = [upload("a.txt"), UploadFile(file=Disconnects(), filename="b.txt")]
+    with pytest.raises(OSError):
+        await ingestion.upload_batch(files, False, USER, db)
+    assert spooled() == set()
+
+
+async def jobs(db):
+    return [(j["kind"], j["doc_id"]) async for j in db.ingestion_jobs.find()]
+
+
+async def test_same_content_under_another_name_is_not_ingested(db, spooled):
+    first = await ingestion.upload_document(upload("a.pdf", b"x"), False, USER, db)
+    again = await ingestion.upload_document(upload("b.pdf", b"x"), False, USER, db)
+    assert again == {"id": first["id"], "filename": "a.pdf", "status": "unchanged"}
+    assert len(spooled()) == 1 and len(await jobs(db)) == 1
+
+
+async def test_same_name_is_a_new_document_unless_replacing(db):
+    first = await ingestion.upload_document(upload("a.pdf", b"v1"), False, USER, db)
+    await db.documents.update_many({}, {"$set": {"status": "completed"}})
+
+    second = await ingestion.upload_document(upload("a.pdf", b"v2"), False, USER, db)
+    assert second["id"] != first["id"]
+    await db.documents.update_many({}, {"$set": {"status": "completed"}})
+
+    third = await ingestion.upload_document(upload("a.pdf", b"v3"), True, USER, db)
+    assert third["id"] == second["id"]  # The latest one with that name
+    doc = await db.documents.find_one({"_id": ObjectId(third["id"])})
+    assert doc["status"] == "pending" and doc["content_hash"] == sha256(b"v3")
+
+
+async def test_replacing_a_document_in_progress_conflicts(db, spooled):
+    await ingestion.upload_document(upload("a.pdf", b"v1"), False, USER, db)
+    with pytest.raises(HTTPException) as info:
+        await ingestion.upload_document(upload("a.pdf", b"v2"), True, USER, db)
+    assert info.value.status_code == 409
+    assert len(spooled()) == 1
+
+
+async def test_batch_skips_known_and_repeated_content(db, spooled):
+    known = await ingestion.upload_document(upload("old.pdf", b"x"), False, USER, db)
+    files = [upload("a.txt", b"x"), upload("b.txt", b"y"), upload("c.txt", b"y")]
+    response = await ingestion.upload_batch(files, False, USER, db)
+
+    a, b, c = response["documents"]
+    assert a == {"id": known["id"], "filename": "old.pdf", "status": "unchanged"}
+    assert b["status"] == "pending" and c == b
+    batch = await db.ingestion_batches.find_one()
+    assert batch["documents"] == 1
+    assert len(spooled()) == 2  # old.pdf and b.txt
+
+
+async def test_batch_of_known_content_only_is_complete(db):
+    await ingestion.upload_document(upload("old.pdf", b"x"), False, USER, db)
+    response = await ingestion.upload_batch([upload("a.txt", b"x")], False, USER, db)
+    assert response["status"] == "completed"
+    assert [kind for kind, _ in await jobs(db)] == ["document"]
+
+
+async def test_batch_replace_updates_documents_with_their_own_jobs(db):
+    old = await ingestion.upload_document(upload("a.txt", b"v1"), False, USER, db)
+    busy = await ingestion.upload_document(upload("b.txt", b"v1b"), False, USER, db)
+    await db.documents.update_one(
+        {"_id": ObjectId(old["id"])}, {"$set": {"status": "completed"}}
+    )
+    files = [upload("a.txt", b"v2"), upload("b.txt", b"v2b"), upload("c.txt")]
+    response = await ingestion.upload_batch(files, True, USER, db)
+
+    a, b, c = response["documents"]
+    assert a == {"id": old["id"], "filename": "a.txt", "status": "pending"}
+    assert b["status"] == "rejected" and b["id"] is None
+    assert c["status"] == "pending"
+    assert (await db.ingestion_batches.find_one())["documents"] == 1
+    assert ("document", old["id"]) in await jobs(db)
+    assert (await db.documents.find_one({"_id": ObjectId(busy["id"])}))[
+        "content_hash"
+    ] == sha256(b"v1b")
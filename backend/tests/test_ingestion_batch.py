@@ -0,0 +1,152 @@
+import httpx
+import pytest
+from bson import ObjectId
+
+from app.services import ingestion_pipeline, ingestion_service
+from app.services.ingestion_pipeline import DocumentError
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def batch(db, qdrant, encoder, broadcasts, tmp_path):
+    """A batch of three pending documents: good.pdf, bad.pdf and flaky.pdf."""
+
+    async def make():
+        batch_id = ObjectId()
+        await db.ingestion_batches.insert_one(
+            {
+                "_id": batch_id,
+                "user_id": "u1",
+                "status": "pending",
+                "documents": 3,
+                "completed": 0,
+                "failed": 0,
+                "chunks": 0,
+            }
+        )
+        documents = []
+        for name in ("good.pdf", "bad.pdf", "flaky.pdf"):
+            path = tmp_path / name
+            path.write_text(name)
+            result = await db.documents.insert_one(
+                {"user_id": "u1", "filename": name, "status": "pending"}
+            )
+            doc_id = str(result.inserted_id)
+            documents.append({"doc_id": doc_id, "file_path": str(path)})
+        return str(batch_id), documents
+
+    return make
+
+
+def use_parser(monkeypatch, errors):
+    """Fake Unstructured stream; raises errors[filename] after one element."""
+
+    async def stream(file_path):
+        yield {"text": f"Some text from {file_path}"}
+        name = file_path.rsplit("/", 1)[-1]
+        if name in errors:
+            raise errors[name]
+
+    monkeypatch.setattr(ingestion_service, "stream_unstructured_elements", stream)
+
+
+async def statuses(db):
+    return {d["filename"]: d["status"] async for d in db.documents.find()}
+
+
+async def test_rejected_document_fails_alone(db, batch, monkeypatch):
+    errors = {"bad.pdf": DocumentError("Unstructured API failed (422)")}
+    use_parser(monkeypatch, errors)
+    batch_id, documents = await batch()
+
+    await ingestion_service.process_batch(batch_id, documents, "u1")
+
+    assert await statuses(db) == {
+        "good.pdf": "completed",
+        "bad.pdf": "failed",
+        "flaky.pdf": "completed",
+    }
+    record = await db.ingestion_batches.find_one()
+    assert (record["completed"], record["failed"]) == (2, 1)
+    assert record["status"] == "completed"
+
+
+async def test_transient_parser_error_retries_the_job(db, batch, monkeypatch):
+    errors = {"flaky.pdf": httpx.ConnectError("connection refused")}
+    use_parser(monkeypatch, errors)
+    batch_id, documents = await batch()
+
+    with pytest.raises(httpx.ConnectError):
+        await ingestion_service.process_batch(
+            batch_id, documents, "u1", final_attempt=False
+        )
+    assert (await statuses(db))["flaky.pdf"] == "retrying"
+    assert (await db.ingestion_batches.find_one())["failed"] == 0
+
+    # The retry redoes only what did not finish
+    use_parser(monkeypatch, {})
+    await ingestion_service.process_batch(batch_id, documents, "u1", retry=True)
+    assert set((await statuses(db)).values()) == {"completed"}
+
+
+async def test_rejected_single_document_fails_without_a_retry(
+    db, qdrant, encoder, broadcasts, monkeypatch, tmp_path
+):
+    use_parser(monkeypatch, {"bad.pdf": DocumentError("Unstructured API failed")})
+    path = tmp_path / "bad.pdf"
+    path.write_text("bad")
+    result = await db.documents.insert_one({"user_id": "u1", "filename": "bad.pdf"})
+    doc_id = str(result.inserted_id)
+
+    await ingestion_service.process_document(doc_id, str(path), "u1", False)
+    assert await statuses(db) == {"bad.pdf": "failed"}
+    assert not path.exists()
+    records, _ = await qdrant.scroll_document_points(doc_id)
+    assert records == []
+
+
+@pytest.mark.parametrize("final_attempt", [False, True])
+async def test_upload_is_kept_until_the_last_attempt_fails(
+    db, qdrant, encoder, broadcasts, monkeypatch, tmp_path, final_attempt
+):
+    use_parser(monkeypatch, {"a.pdf": httpx.ConnectError("connection refused")})
+    path = tmp_path / "a.pdf"
+    path.write_text("a")
+    result = await db.documents.insert_one({"user_id": "u1", "filename": "a.pdf"})
+
+    with pytest.raises(httpx.ConnectError):
+        await ingestion_service.process_document(
+            str(result.inserted_id), str(path), "u1", final_attempt
+        )
+    assert path.exists() != final_attempt
+
+
+@pytest.mark.parametrize(
+    "status, error",
+    [(400, DocumentError), (422, DocumentError), (429, Exception), (503, Exception)],
+)
+async def test_unstructured_status_classification(status, error, monkeypatch, tmp_path):
+    transport = httpx.MockTransport(lambda request: httpx.Response(status, text="no"))
+    client = httpx.AsyncClient
+
+    monkeypatch.setattr(
+        ingestion_pipeline.httpx,
+        "AsyncClient",
+        lambda **kwargs: client(transport=transport, **kwargs),
+    )
+    path = tmp_path / "a.pdf"
+    path.write_bytes(b"%PDF")
+    with pytest.raises(error) as info:
+        async for _ in ingestion_pipeline.stream_unstructured_elements(str(path)):
+            pass
+    assert isinstance(info.value, DocumentError) == (error is DocumentError)
+
+
+async def test_malformed_parser_output_is_a_value_error():
+    async def pieces():
+        yield '{"text": "not an array"}'
+
+    with pytest.raises(ValueError):
+        async for _ in ingestion_pipeline.iter_json_array(pieces()):
+            pass
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.ingestion_pipeline import (
+    _prefetch,
+    chunk_elements,
+    embed_and_upsert,
+    iter_json_array,
+    sync_document,
+    to_chunks,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+async def aiter(items):
+    for item in items:
+        yield item
+
+
+async def collect(source):
+    return [item async for item in source]
+
+
+async def test_json_array_items_are_yielded_across_pieces():
+    pieces = ['[{"text": "a"', '}, {"te', 'xt": "b, ]"},', ' 3 ', "]"]
+    items = await collect(iter_json_array(aiter(pieces)))
+    assert items == [{"text": "a"}, {"text": "b, ]"}, 3]
+
+
+@pytest.mark.parametrize("pieces", [['{"text": "a"}'], ['[{"text": "a"}, {"te']])
+async def test_malformed_json_array_is_a_value_error(pieces):
+    with pytest.raises(ValueError):
+        await collect(iter_json_array(aiter(pieces)))
+
+
+async def test_elements_are_packed_into_chunks_up_to_the_size():
+    elements = [{"text": "a" * 4}, {"text": "b" * 4}, {"text": "c" * 8}, {}]
+    chunks = await collect(chunk_elements(aiter(elements), chunk_size=10))
+    assert chunks == ["\naaaa\nbbbb", "cccccccc\n"]
+
+
+async def test_prefetch_buffers_a_bounded_number_of_items():
+    produced = []
+
+    async def source():
+        for i in range(10):
+            produced.append(i)
+            yield i
+
+    buffered = _prefetch(source(), maxsize=2)
+    assert await buffered.__anext__() == 0
+    await asyncio.sleep(0.01)
+    assert len(produced) <= 4
+    assert await collect(buffered) == list(range(1, 10))
+
+
+async def test_prefetch_reraises_source_errors():
+    async def source():
+        yield 1
+        raise RuntimeError("parser died")
+
+    with pytest.raises(RuntimeError):
+        await collect(_prefetch(source(), maxsize=2))
+
+
+async def test_chunks_are_embedded_and_upserted_in_batches(
+    db, qdrant, encoder, monkeypatch
+):
+    monkeypatch.setattr(settings, "INGESTION_BATCH_SIZE", 2)
+    stored = []
+
+    async def on_batch(batch):
+        stored.append([chunk.payload["chunk_index"] for chunk in batch])
+
+    payload = {"doc_id": "d1", "user_id": "u1"}
+    chunks = to_chunks(aiter(["one", "two", "three"]), payload)
+    assert await embed_and_upsert(chunks, on_batch=on_batch) == 3
+    assert encoder == [["one", "two"], ["three"]]
+    assert sorted(stored) == [[0, 1], [2]]
+    records, _ = await qdrant.scroll_document_points("d1", with_payload=True)
+    assert sorted(record.payload["text"] for record in records) == [
+        "one",
+        "three",
+        "two",
+    ]
+
+
+async def test_upserts_in_flight_have_unwound_when_a_batch_fails(
+    db, qdrant, encoder, monkeypatch
+):
+    monkeypatch.setattr(settings, "INGESTION_BATCH_SIZE", 1)
+    monkeypatch.setattr(settings, "INGESTION_MAX_UPSERTS_IN_FLIGHT", 2)
+    unwound = []
+
+    async def upsert(points):
+        if points[0].payload["text"] == "one":
+            await asyncio.sleep(0.01)
+            raise RuntimeError("qdrant down")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            unwound.append(points[0].payload["text"])
+            raise
+
+    monkeypatch.setattr(qdrant, "upsert", upsert)
+    payload = {"doc_id": "d1", "user_id": "u1"}
+    with pytest.raises(RuntimeError):
+        await embed_and_upsert(to_chunks(aiter(["one", "two"]), payload))
+    assert unwound == ["two"]
+
+
+async def test_repeated_chunks_get_distinct_stable_ids():
+    payload = {"doc_id": "d1", "user_id": "u1"}
+    first = await collect(to_chunks(["same", "same", "other"], payload))
+    second = await collect(to_chunks(["same", "same", "other"], payload))
+    assert len({chunk.id for chunk in first}) == 3
+    assert [chunk.id for chunk in first] == [chunk.id for chunk in second]
+
+
+async def test_reingestion_embeds_only_new_chunks(db, qdrant, encoder):
+    payload = {"doc_id": "d1", "user_id": "u1"}
+    texts = ["alpha", "beta", "gamma"]
+    assert await sync_document("d1", "u1", to_chunks(texts, payload)) == (3, 3)
+    encoder.clear()
+
+    edited = ["beta", "alpha", "delta"]
+    assert await sync_document("d1", "u1", to_chunks(edited, payload)) == (3, 1)
+    assert encoder == [["delta"]]
+    records, _ = await qdrant.scroll_document_points(
+        "d1", with_payload=["text", "chunk_index"]
+    )
+    stored = {r.payload["text"]: r.payload["chunk_index"] for r in records}
+    assert stored == {"beta": 0, "alpha": 1, "delta": 2}
@@ -0,0 +1,158 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.core.config import settings
+from app.services.job_queue import COMPLETED, FAILED, QUEUED, RUNNING, job_queue
+from app.worker import IngestionWorker
+
+pytestmark = pytest.mark.anyio
+
+
+async def expire_leases(db):
+    await db.ingestion_jobs.update_many(
+        {"status": RUNNING},
+        {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}},
+    )
+
+
+async def new_document(db, user_id="u1", **fields):
+    result = await db.documents.insert_one(
+        {"user_id": user_id, "filename": "a.pdf", "status": "pending", **fields}
+    )
+    return str(result.inserted_id)
+
+
+async def test_claims_round_robin_across_users(db):
+    for user_id, doc_id in [("u1", "a"), ("u1", "b"), ("u1", "c"), ("u2", "d")]:
+        await job_queue.enqueue("document", user_id, doc_id, {})
+    claimed = [(await job_queue.claim("w"))["doc_id"] for _ in range(2)]
+    assert claimed == ["a", "d"]
+
+
+async def test_per_user_running_limit(db, monkeypatch):
+    monkeypatch.setattr(settings, "INGESTION_MAX_JOBS_PER_USER", 1)
+    await job_queue.enqueue("document", "u1", "a", {})
+    await job_queue.enqueue("document", "u1", "b", {})
+    assert (await job_queue.claim("w"))["doc_id"] == "a"
+    assert await job_queue.claim("w") is None
+
+
+async def test_failed_attempts_retry_with_backoff_then_fail(db, monkeypatch):
+    monkeypatch.setattr(settings, "INGESTION_MAX_ATTEMPTS", 2)
+    await job_queue.enqueue("document", "u1", "a", {})
+    job = await job_queue.claim("w")
+    assert await job_queue.fail(job, "boom")
+    stored = await db.ingestion_jobs.find_one({"_id": job["_id"]})
+    assert stored["status"] == QUEUED and stored["available_at"] > datetime.utcnow()
+
+    await db.ingestion_jobs.update_one(
+        {"_id": job["_id"]}, {"$set": {"available_at": datetime.utcnow()}}
+    )
+    job = await job_queue.claim("w")
+    assert not await job_queue.fail(job, "boom")
+    assert (await db.ingestion_jobs.find_one({"_id": job["_id"]}))["status"] == FAILED
+
+
+async def test_expired_lease_is_reclaimed_by_another_worker(db):
+    await job_queue.enqueue("document", "u1", "a", {})
+    job = await job_queue.claim("w1")
+    await expire_leases(db)
+    reclaimed = await job_queue.claim("w2")
+    assert reclaimed["_id"] == job["_id"] and reclaimed["attempts"] == 2
+    assert not await job_queue.heartbeat(job["_id"], "w1")
+    assert await job_queue.heartbeat(job["_id"], "w2")
+    await job_queue.complete(reclaimed)
+    assert (await db.ingestion_jobs.find_one())["status"] == COMPLETED
+
+
+async def test_lease_expired_on_last_attempt_fails_the_document(
+    db, broadcasts, monkeypatch
+):
+    monkeypatch.setattr(settings, "INGESTION_MAX_ATTEMPTS", 1)
+    doc_id = await new_document(db, status="processing")
+    await job_queue.enqueue("document", "u1", doc_id, {"file_path": "x"})
+    await job_queue.claim("w1")
+    await expire_leases(db)
+
+    assert await job_queue.claim("w2") is None  # Not retried past max_attempts
+    await IngestionWorker(1)._give_up_expired()
+
+    job = await db.ingestion_jobs.find_one()
+    doc = await db.documents.find_one({"_id": ObjectId(doc_id)})
+    assert job["status"] == FAILED and job["last_error"] == "Lease expired"
+    assert doc["status"] == "failed" and doc["error"] == "Lease expired"
+    assert broadcasts[-1][1]["status"] == "failed"
+
+
+async def test_lease_expired_batch_job_settles_the_batch(db, broadcasts, monkeypatch):
+    monkeypatch.setattr(settings, "INGESTION_MAX_ATTEMPTS", 1)
+    batch_id = ObjectId()
+    await db.ingestion_batches.insert_one(
+        {
+            "_id": batch_id,
+            "user_id": "u1",
+            "status": "processing",
+            "documents": 2,
+            "completed": 1,
+            "failed": 0,
+            "chunks": 3,
+        }
+    )
+    done = await new_document(db, status="completed")
+    stuck = await new_document(db, status="processing")
+    documents = [{"doc_id": d, "file_path": "x"} for d in (done, stuck)]
+    args = {"batch_id": str(batch_id), "documents": documents}
+    await job_queue.enqueue("batch", "u1", str(batch_id), args)
+    await job_queue.claim("w1")
+    await expire_leases(db)
+
+    await IngestionWorker(1)._give_up_expired()
+
+    batch = await db.ingestion_batches.find_one({"_id": batch_id})
+    assert (batch["completed"], batch["failed"]) == (1, 1)
+    assert batch["status"] == "completed"
+    statuses = {str(d["_id"]): d["status"] async for d in db.documents.find()}
+    assert statuses == {done: "completed", stuck: "failed"}
+
+
+async def test_heartbeat_survives_transient_errors(db, monkeypatch):
+    monkeypatch.setattr(settings, "INGESTION_HEARTBEAT_SECONDS", 0.01)
+    results = iter([RuntimeError("mongo blip"), True, False])
+    calls = []
+
+    async def heartbeat(job_id, worker_id):
+        calls.append(job_id)
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(job_queue, "heartbeat", heartbeat)
+    runner = asyncio.create_task(asyncio.sleep(10))
+    await asyncio.wait_for(IngestionWorker(1)._heartbeat({"_id": "j"}, runner), 1)
+    assert len(calls) == 3  # Kept going after the error, stopped on lost lease
+    await asyncio.sleep(0)
+    assert runner.cancelled()
+
+
+async def test_stop_cancels_jobs_that_outlast_the_timeout(db, monkeypatch):
+    monkeypatch.setattr(settings, "INGESTION_STOP_TIMEOUT_SECONDS", 0.05)
+    started = asyncio.Event()
+
+    async def execute(self, job):
+        started.set()
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(IngestionWorker, "_execute", execute)
+    job_id = await job_queue.enqueue("document", "u1", "a", {})
+    worker = IngestionWorker(1)
+    worker.start()
+    await asyncio.wait_for(started.wait(), 1)
+    await asyncio.wait_for(worker.stop(), 1)
+    # Left running: the lease expires and another worker retries it
+    job = await db.ingestion_jobs.find_one({"_id": ObjectId(job_id)})
+    assert job["status"] == RUNNING
+
@@ -0,0 +1,80 @@
+import pytest
+from qdrant_client.http import models
+
+from app.core.config import settings
+from app.services import chat_service, lexical_index
+from app.services.ingestion_pipeline import embed_and_upsert, to_chunks
+from app.services.lexical_index import (
+    chunk_sparse_vector,
+    reciprocal_rank_fusion,
+    term_id,
+    tokenize,
+)
+
+pytestmark = pytest.mark.anyio
+
+TEXTS = [
+    "The deploy failed with ERR-404 after upgrading to v1.2.3",
+    "The deploy succeeded on the second attempt",
+    "The deploy was rolled back by the on-call engineer",
+]
+
+
+async def aiter(items):
+    for item in items:
+        yield item
+
+
+@pytest.fixture
+async def indexed(db, qdrant, encoder):
+    payload = {"doc_id": "d1", "user_id": "u1"}
+    await embed_and_upsert(to_chunks(aiter(TEXTS), payload))
+    assert qdrant.sparse_enabled
+
+
+def test_identifiers_stay_whole_and_stopwords_are_dropped():
+    assert tokenize("What is ERR-404 in v1.2.3 of a_b?") == ["err-404", "v1.2.3", "a_b"]
+
+
+def test_term_frequency_saturates():
+    once = chunk_sparse_vector("error")
+    many = chunk_sparse_vector(" ".join(["error"] * 100))
+    assert once.indices == many.indices == [term_id("error")]
+    assert once.values[0] < many.values[0] < settings.BM25_K1 + 1
+
+
+async def test_rare_terms_weigh_more_than_common_ones(indexed):
+    vector = await lexical_index.query_sparse_vector("deploy err-404", "u1")
+    weights = dict(zip(vector.indices, vector.values))
+    assert weights[term_id("err-404")] > weights[term_id("deploy")]
+    assert await lexical_index.query_sparse_vector("deploy", "someone else") is None
+    assert await lexical_index.query_sparse_vector("unknown words", "u1") is None
+
+
+async def test_keyword_query_finds_the_exact_chunk(indexed):
+    user_filter = models.Filter(
+        must=[
+            models.FieldCondition(key="user_id", match=models.MatchValue(value="u1"))
+        ]
+    )
+    hits = await chat_service._lexical_search(
+        "what is ERR-404?", "u1", user_filter, limit=3, with_vectors=False
+    )
+    assert [hit.payload["text"] for hit in hits] == [TEXTS[0]]
+
+
+async def test_forgetting_a_document_removes_its_term_counts(db, indexed):
+    await lexical_index.forget_document("u1", "d1")
+    stats = await db.lexical_stats.find_one({"user_id": "u1"})
+    assert stats["chunks"] == 0
+    assert await db.lexical_terms.count_documents({"df": {"$ne": 0}}) == 0
+
+
+def test_fusion_favours_hits_found_by_both_searches():
+    def hits(*ids):
+        return [models.ScoredPoint(id=i, version=0, score=1.0) for i in ids]
+
+    fused = reciprocal_rank_fusion([(hits(1, 2, 3), 1.0), (hits(3, 4), 1.0)], k=60)
+    assert [point.id for point, _ in fused][:2] == [3, 1]
+    weighted = reciprocal_rank_fusion([(hits(1), 1.0), (hits(2), 2.0)], k=60)
+    assert [point.id for point, _ in weighted] == [2, 1]
@@ -0,0 +1,242 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services import llm_client
+from app.services.llm_client import CircuitBreaker, LLMError, LLMGateway, LLMProvider
+
+pytestmark = pytest.mark.anyio
+
+HANG = object()
+
+
+class FakeProvider(LLMProvider):
+    """Each call plays the next script: tokens, exceptions to raise, or HANG."""
+
+    def __init__(self, name, *scripts):
+        self.name = name
+        self.scripts = list(scripts)
+        self.calls = 0
+
+    async def stream(self, model, messages, max_tokens, temperature):
+        self.calls += 1
+        script = self.scripts.pop(0) if self.scripts else ["ok"]
+        for step in script:
+            if isinstance(step, BaseException):
+                raise step
+            if step is HANG:
+                await asyncio.Event().wait()
+            yield step
+
+
+def unavailable():
+    return LLMError("503", retryable=True, status=503)
+
+
+@pytest.fixture
+def make_gateway(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "LLM_COALESCE_ENABLED", False)
+    monkeypatch.setattr(settings, "LLM_BREAKER_FAILURES", 1)
+    monkeypatch.setattr(settings, "LLM_BREAKER_COOLDOWN_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+
+    def make(primary, fallback=None):
+        providers = {p.name: p for p in (primary, fallback) if p}
+        monkeypatch.setattr(llm_client, "create_provider", providers.__getitem__)
+        monkeypatch.setattr(settings, "LLM_PROVIDER", primary.name)
+        monkeypatch.setattr(
+            settings, "LLM_FALLBACK_PROVIDER", fallback.name if fallback else ""
+        )
+        return LLMGateway()
+
+    return make
+
+
+async def collect(stream):
+    return [token async for token in stream]
+
+
+async def open_circuit(gateway):
+    with pytest.raises(LLMError):
+        await collect(gateway.generate_stream("m", "p"))
+    assert gateway._breakers["primary"].state == "open"
+    await asyncio.sleep(0.06)
+    assert gateway._breakers["primary"].state == "half_open"
+
+
+async def test_cancelled_probe_does_not_disable_the_provider(make_gateway):
+    primary = FakeProvider("primary", [unavailable()], ["a", HANG], ["b"])
+    gateway = make_gateway(primary)
+    await open_circuit(gateway)
+
+    probe = asyncio.create_task(collect(gateway.generate_stream("m", "p")))
+    await asyncio.sleep(0.01)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    breaker = gateway._breakers["primary"]
+    assert not breaker._probing
+    assert await collect(gateway.generate_stream("m", "p")) == ["b"]
+    assert breaker.state == "closed"
+
+
+async def test_probe_closed_by_its_consumer_releases_the_slot(make_gateway):
+    primary = FakeProvider("primary", [unavailable()], ["a", "b"], ["c"])
+    gateway = make_gateway(primary)
+    await open_circuit(gateway)
+
+    stream = gateway.generate_stream("m", "p")
+    assert await stream.__anext__() == "a"
+    await stream.aclose()
+
+    assert await collect(gateway.generate_stream("m", "p")) == ["c"]
+
+
+async def test_unexpected_probe_error_reopens_the_circuit(make_gateway):
+    primary = FakeProvider("primary", [unavailable()], [RuntimeError("bug")])
+    gateway = make_gateway(primary)
+    await open_circuit(gateway)
+
+    with pytest.raises(RuntimeError):
+        await collect(gateway.generate_stream("m", "p"))
+    breaker = gateway._breakers["primary"]
+    assert breaker.state == "open" and not breaker._probing
+
+
+async def test_retries_before_the_first_token_only(make_gateway, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "LLM_BREAKER_FAILURES", 5)
+    primary = FakeProvider("primary", [unavailable()], ["a", "b"])
+    gateway = make_gateway(primary)
+    assert await collect(gateway.generate_stream("m", "p")) == ["a", "b"]
+    assert gateway.retries == 1
+
+    primary.scripts = [["a", unavailable()]]
+    with pytest.raises(LLMError):
+        await collect(gateway.generate_stream("m", "p"))
+    assert primary.calls == 3  # Tokens were already sent: no retry
+
+
+async def test_client_errors_are_not_retried(make_gateway, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 2)
+    primary = FakeProvider("primary", [LLMError("400", status=400)])
+    gateway = make_gateway(primary)
+    with pytest.raises(LLMError):
+        await collect(gateway.generate_stream("m", "p"))
+    assert primary.calls == 1
+    assert gateway._breakers["primary"].state == "closed"
+
+
+async def test_fails_over_while_the_primary_circuit_is_open(make_gateway):
+    primary = FakeProvider("primary", [unavailable()])
+    fallback = FakeProvider("fallback", ["x"], ["y"])
+    gateway = make_gateway(primary, fallback)
+    assert await collect(gateway.generate_stream("m", "p")) == ["x"]
+    assert await collect(gateway.generate_stream("m", "p")) == ["y"]
+    assert primary.calls == 1 and gateway.failovers == 2
+
+
+def test_breaker_lets_one_probe_through_after_the_cooldown():
+    breaker = CircuitBreaker(failures=2, cooldown=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.allow()  # Cooldown of 0: half-open immediately
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+@pytest.mark.parametrize("status,retryable", [(409, False), (429, True), (503, True)])
+def test_only_transient_statuses_are_retryable(status, retryable):
+    error = llm_client._status_error("groq", status, {}, "detail")
+    assert error.retryable is retryable
+
+
+@pytest.fixture
+def coalescing(make_gateway, monkeypatch):
+    def make(primary):
+        gateway = make_gateway(primary)
+        monkeypatch.setattr(settings, "LLM_COALESCE_ENABLED", True)
+        return gateway
+
+    return make
+
+
+async def test_identical_concurrent_prompts_share_one_stream(coalescing):
+    provider = FakeProvider("primary", ["a", "b", "c"])
+    gateway = coalescing(provider)
+    first, second = await asyncio.gather(
+        collect(gateway.generate_stream("m", "p")),
+        collect(gateway.generate_stream("m", "p")),
+    )
+    assert first == second == ["a", "b", "c"]
+    assert provider.calls == 1 and gateway.coalesced == 1
+    assert gateway._flights == {}
+    await collect(gateway.generate_stream("m", "p"))
+    assert provider.calls == 2  # Finished flights are not replayed
+
+
+async def test_late_subscriber_gets_the_tokens_already_produced(coalescing):
+    gateway = coalescing(FakeProvider("primary", ["a", "b", HANG]))
+    first = gateway.generate_stream("m", "p")
+    assert await first.__anext__() == "a"
+    assert await first.__anext__() == "b"
+    second = gateway.generate_stream("m", "p")
+    assert [await second.__anext__(), await second.__anext__()] == ["a", "b"]
+    await first.aclose()
+    await second.aclose()
+
+
+async def test_different_parameters_are_not_coalesced(coalescing):
+    provider = FakeProvider("primary")
+    gateway = coalescing(provider)
+    await asyncio.gather(
+        collect(gateway.generate_stream("m", "p")),
+        collect(gateway.generate_stream("m", "p", temperature=0.1)),
+        collect(gateway.generate_stream("m", "other")),
+    )
+    assert provider.calls == 3 and gateway.coalesced == 0
+
+
+async def test_upstream_error_reaches_every_subscriber(coalescing):
+    gateway = coalescing(FakeProvider("primary", ["a", LLMError("bad request")]))
+    results = await asyncio.gather(
+        collect(gateway.generate_stream("m", "p")),
+        collect(gateway.generate_stream("m", "p")),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, LLMError) for result in results)
+
+
+async def test_upstream_is_cancelled_when_the_last_subscriber_leaves(coalescing):
+    gateway = coalescing(FakeProvider("primary", ["a", HANG]))
+    first = gateway.generate_stream("m", "p")
+    second = gateway.generate_stream("m", "p")
+    await first.__anext__()
+    await second.__anext__()
+    flight = next(iter(gateway._flights.values()))
+    await first.aclose()
+    assert not flight.task.done()
+    await second.aclose()
+    with pytest.raises(asyncio.CancelledError):
+        await flight.task
+    assert gateway._flights == {}
+
+
+async def test_prompt_requested_again_right_after_the_last_subscriber_left(
+    coalescing,
+):
+    provider = FakeProvider("primary", ["a", HANG], ["b"])
+    gateway = coalescing(provider)
+    first = gateway.generate_stream("m", "p")
+    assert await first.__anext__() == "a"
+    await first.aclose()
+    # The cancellation has not landed yet; the new request must not join it
+    assert await collect(gateway.generate_stream("m", "p")) == ["b"]
+    assert provider.calls == 2 and gateway.coalesced == 0
+    await asyncio.sleep(0)
+    assert gateway._flights == {}
@@ -0,0 +1,122 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException, Response
+
+from app.api.endpoints import chats
+from app.api.pagination import (
+    NEXT_CURSOR_HEADER,
+    after,
+    decode_cursor,
+    encode_cursor,
+    export_ndjson,
+    paginate,
+)
+from app.models.user import UserResponse
+
+pytestmark = pytest.mark.anyio
+
+NEWEST_FIRST = [("updated_at", -1), ("_id", -1)]
+OLDEST_FIRST = [("updated_at", 1), ("_id", 1)]
+
+
+async def read_all(collection, sort, limit):
+    pages, cursor = [], None
+    while True:
+        response = Response()
+        query = {"user_id": "u1"}
+        page = await paginate(
+            response, collection, query, {"updated_at": 1}, sort, limit, cursor
+        )
+        pages.append([doc["id"] for doc in page])
+        cursor = response.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return pages
+
+
+@pytest.fixture
+async def sessions(db):
+    """Seven sessions; two share a timestamp and two have none."""
+    start = datetime(2026, 1, 1)
+    stamps = [start, start + timedelta(1), start + timedelta(1), None, start, None]
+    stamps.append(start + timedelta(2))
+    for i, stamp in enumerate(stamps):
+        doc = {"_id": f"s{i}", "user_id": "u1"}
+        if stamp is not None:
+            doc["updated_at"] = stamp
+        await db.chat_sessions.insert_one(doc)
+    await db.chat_sessions.insert_one({"_id": "other", "user_id": "u2"})
+    return db.chat_sessions
+
+
+@pytest.mark.parametrize("sort", [NEWEST_FIRST, OLDEST_FIRST])
+@pytest.mark.parametrize("limit", [1, 2, 3, 7])
+async def test_pages_cover_every_document_once_in_order(sessions, sort, limit):
+    expected = [doc["_id"] async for doc in sessions.find({"user_id": "u1"}).sort(sort)]
+    pages = await read_all(sessions, sort, limit)
+    assert [i for page in pages for i in page] == expected
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+async def test_missing_values_sort_before_all_others(sessions):
+    pages = await read_all(sessions, OLDEST_FIRST, 2)
+    assert pages[0] == ["s3", "s5"]
+
+
+def test_cursor_round_trip_keeps_types():
+    doc = {"updated_at": datetime(2026, 1, 1), "_id": "s1"}
+    cursor = encode_cursor(doc, NEWEST_FIRST)
+    assert decode_cursor(cursor, NEWEST_FIRST) == [datetime(2026, 1, 1), "s1"]
+    missing = encode_cursor({"_id": "s1"}, NEWEST_FIRST)
+    assert decode_cursor(missing, NEWEST_FIRST) == [None, "s1"]
+
+
+@pytest.mark.parametrize("cursor", ["garbage", encode_cursor({"_id": 1}, [("_id", 1)])])
+def test_invalid_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as info:
+        decode_cursor(cursor, NEWEST_FIRST)
+    assert info.value.status_code == 400
+
+
+def test_nothing_comes_after_null_in_a_single_descending_key():
+    assert after([("updated_at", -1)], [None]) == {"_id": {"$in": []}}
+
+
+async def test_export_streams_every_document_projected(sessions):
+    response = export_ndjson(
+        sessions, {"user_id": "u1"}, {"updated_at": 1}, OLDEST_FIRST, "s.ndjson"
+    )
+    assert response.media_type == "application/x-ndjson"
+    body = b"".join([line async for line in response.body_iterator])
+    rows = [json.loads(line) for line in body.decode().splitlines()]
+    ordered = sessions.find({"user_id": "u1"}).sort(OLDEST_FIRST)
+    assert [row["id"] for row in rows] == [doc["_id"] async for doc in ordered]
+    assert all(set(row) <= {"id", "updated_at"} for row in rows)
+
+
+async def test_history_pages_back_from_the_newest_message(db):
+    user = UserResponse(_id="u1", email="a@example.com")
+    session = await db.chat_sessions.insert_one({"user_id": "u1"})
+    session_id = str(session.inserted_id)
+    start = datetime(2026, 1, 1)
+    for i in range(3):
+        await db.chat_messages.insert_one(
+            {
+                "session_id": session_id,
+                "role": "user",
+                "content": f"m{i}",
+                "timestamp": start + timedelta(minutes=i),
+            }
+        )
+
+    async def history(cursor=None):
+        response = Response()
+        page = await chats.get_session_history(
+            session_id, response, 2, cursor, "desc", "json", user, db
+        )
+        return [m["content"] for m in page], response.headers.get(NEXT_CURSOR_HEADER)
+
+    page, cursor = await history()
+    assert page == ["m2", "m1"]
+    assert await history(cursor) == (["m0"], None)
@@ -0,0 +1,81 @@
+import pytest
+
+from app.core.config import settings
+from app.services import prompt_builder
+from app.services.prompt_builder import (
+    PERSONA_NO_CONTEXT,
+    PERSONA_RAG,
+    assemble_prompt,
+    count_tokens,
+)
+
+
+def chunk(name, size):
+    return {"text": name * size, "metadata": {"filename": f"{name}.pdf"}}
+
+
+def turns(n, size=40):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"t{i} " * size}
+        for i in range(n)
+    ]
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    """Character-based estimates, so the tests do not download a tokenizer."""
+    monkeypatch.setattr(prompt_builder, "_tokenizer", None)
+    monkeypatch.setattr(settings, "PROMPT_MIN_CHUNK_TOKENS", 20)
+
+
+def test_everything_fits_a_large_budget():
+    chunks = [chunk("a", 100), chunk("b", 100)]
+    prompt, usage = assemble_prompt("q?", chunks, turns(4), budget=10000)
+    assert prompt.startswith(PERSONA_RAG) and prompt.endswith("q?\nInfinity:")
+    assert usage.chunks_used == 2 and usage.turns_used == 4
+    assert not usage.truncated
+
+
+@pytest.mark.parametrize("budget", [300, 600, 1000, 2000])
+def test_prompt_stays_within_the_budget(budget):
+    chunks = [chunk(name, 800) for name in "abcd"]
+    prompt, usage = assemble_prompt("q?", chunks, turns(20), budget=budget)
+    assert usage.total <= budget
+    assert count_tokens(prompt) <= budget + 5  # Counted per part, not joined
+
+
+def test_lower_ranked_chunks_go_first_and_the_last_kept_is_truncated():
+    chunks = [chunk("a", 400), chunk("b", 400), chunk("c", 400)]
+    _, base = assemble_prompt("q?", chunks[:1], budget=10000)
+    # Room for the first chunk (~105 tokens) and about half of the second
+    context = 160 / (1 - settings.PROMPT_HISTORY_SHARE)
+    budget = base.system + base.query + int(context)
+    prompt, usage = assemble_prompt("q?", chunks, budget=budget)
+    assert "a.pdf" in prompt and "b.pdf" in prompt and "c.pdf" not in prompt
+    assert usage.chunks_used == 2 and usage.chunks_dropped == 1
+    assert usage.truncated
+
+
+def test_older_turns_are_dropped_first():
+    history = turns(10)
+    prompt, usage = assemble_prompt("q?", [], history, budget=400)
+    assert 0 < usage.turns_used < 10
+    assert usage.turns_dropped == 10 - usage.turns_used
+    assert history[-1]["content"] in prompt
+    assert history[0]["content"] not in prompt
+
+
+def test_summary_precedes_the_recent_turns():
+    prompt, usage = assemble_prompt(
+        "q?", [], turns(2, size=2), summary="They asked about invoices."
+    )
+    assert prompt.startswith(PERSONA_NO_CONTEXT)
+    assert usage.summary > 0
+    assert prompt.index("They asked about invoices.") < prompt.index("User: t0")
+
+
+def test_token_counts_are_cached():
+    count_tokens.cache_clear()
+    count_tokens("some repeated text")
+    count_tokens("some repeated text")
+    assert count_tokens.cache_info().hits == 1
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from qdrant_client.http import models
+
+from app.db.qdrant import SPARSE_VECTOR_NAME
+
+pytestmark = pytest.mark.anyio
+
+
+def point(i, doc_id="d1"):
+    return models.PointStruct(
+        id=i, vector=[1.0, float(i), 0.5, 0.0], payload={"doc_id": doc_id, "n": i}
+    )
+
+
+async def test_ensure_collection_enables_sparse_vectors(qdrant):
+    await qdrant.ensure_collection(vector_size=4)
+    assert qdrant.sparse_enabled
+    info = await qdrant.client.get_collection("documents")
+    assert SPARSE_VECTOR_NAME in info.config.params.sparse_vectors
+
+
+async def test_existing_collection_without_sparse_vector_disables_lexical(qdrant):
+    await qdrant.client.create_collection(
+        "documents",
+        vectors_config=models.VectorParams(size=4, distance=models.Distance.COSINE),
+    )
+    await qdrant.ensure_collection(vector_size=4)
+    assert not qdrant.sparse_enabled
+
+
+async def test_upsert_search_scroll_and_delete_by_document(qdrant):
+    await qdrant.ensure_collection(vector_size=4)
+    await qdrant.upsert([point(1), point(2), point(3, doc_id="d2")])
+
+    hits = await qdrant.search([1.0, 2.0, 0.5, 0.0], limit=2)
+    assert [h.id for h in hits][0] == 2
+
+    records, offset = await qdrant.scroll_document_points("d1")
+    assert sorted(r.id for r in records) == [1, 2] and offset is None
+
+    await qdrant.delete_document_points("d1")
+    records, _ = await qdrant.scroll_document_points("d1")
+    assert records == []
+    assert (await qdrant.client.count("documents")).count == 1
+
+
+async def test_calls_time_out(qdrant):
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await qdrant._call(slow(), 0.01)
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import reranker as reranker_module
+from app.services.reranker import Reranker, drop_near_duplicates
+
+pytestmark = pytest.mark.anyio
+
+
+def candidates(*texts):
+    return [{"text": text, "metadata": {}} for text in texts]
+
+
+def score_by_length(query, texts):
+    return np.array([len(text) for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def reranker():
+    reranker = Reranker()
+    yield reranker
+    reranker._executor.shutdown(wait=False)
+
+
+async def test_candidates_are_reordered_by_cross_encoder_score(
+    reranker, monkeypatch
+):
+    monkeypatch.setattr(reranker_module, "_predict", score_by_length)
+    ranked = await reranker.rerank("q", candidates("bb", "a", "cccc"), top_n=2)
+    assert [c["text"] for c in ranked] == ["cccc", "bb"]
+    assert ranked[0]["metadata"]["rerank_score"] == 4.0
+    assert reranker.stats()["ms_per_pair"] is not None
+
+
+async def test_overrun_falls_back_to_first_stage_order(reranker, monkeypatch):
+    release = threading.Event()
+
+    def slow(query, texts):
+        release.wait(5)
+        return score_by_length(query, texts)
+
+    monkeypatch.setattr(reranker_module, "_predict", slow)
+    monkeypatch.setattr(settings, "RERANK_BUDGET_MS", 10)
+    monkeypatch.setattr(settings, "RERANK_MAX_PENDING", 1)
+    ranked = await reranker.rerank("q", candidates("bb", "a", "cccc"), top_n=2)
+    assert [c["text"] for c in ranked] == ["bb", "a"]
+    assert reranker.timeouts == 1
+    # The overrunning prediction still holds the thread: skip without queueing
+    await reranker.rerank("q", candidates("bb", "a"), top_n=2)
+    assert reranker.skipped == 1
+    release.set()
+
+
+async def test_candidates_over_the_budget_are_not_scored(reranker, monkeypatch):
+    monkeypatch.setattr(reranker_module, "_predict", score_by_length)
+    reranker._ms_per_pair = 100.0
+    monkeypatch.setattr(settings, "RERANK_BUDGET_MS", 150)
+    ranked = await reranker.rerank("q", candidates("a", "bb"), top_n=2)
+    assert [c["text"] for c in ranked] == ["a", "bb"]
+    assert reranker.skipped == 1 and reranker.reranked == 0
+
+
+async def test_overrunning_predictions_update_the_estimate(reranker, monkeypatch):
+    release = threading.Event()
+
+    def slow(query, texts):
+        release.wait(5)
+        return score_by_length(query, texts)
+
+    monkeypatch.setattr(reranker_module, "_predict", slow)
+    monkeypatch.setattr(settings, "RERANK_BUDGET_MS", 10)
+    reranker._ms_per_pair = 1.0
+    await reranker.rerank("q", candidates("a", "bb"), top_n=2)
+    assert reranker.timeouts == 1 and reranker._ms_per_pair == 1.0
+    release.set()
+    while reranker._pending:
+        await asyncio.sleep(0.005)
+    assert reranker._ms_per_pair > 1.0
+
+
+async def test_a_probe_goes_through_after_skipping_for_a_while(
+    reranker, monkeypatch
+):
+    monkeypatch.setattr(reranker_module, "_predict", score_by_length)
+    monkeypatch.setattr(settings, "RERANK_BUDGET_MS", 150)
+    monkeypatch.setattr(settings, "RERANK_PROBE_SECONDS", 60)
+    reranker._ms_per_pair = 100.0
+    await reranker.rerank("q", candidates("a", "bb"), top_n=2)
+    assert reranker.skipped == 1
+
+    reranker._last_started -= 60
+    ranked = await reranker.rerank("q", candidates("a", "bb"), top_n=2)
+    assert [c["text"] for c in ranked] == ["bb", "a"]
+    assert reranker.reranked == 1 and reranker._ms_per_pair < 100.0
+
+
+async def test_model_errors_fall_back_to_first_stage_order(reranker, monkeypatch):
+    def broken(query, texts):
+        raise RuntimeError("model missing")
+
+    monkeypatch.setattr(reranker_module, "_predict", broken)
+    ranked = await reranker.rerank("q", candidates("a", "bb", "c"), top_n=2)
+    assert [c["text"] for c in ranked] == ["a", "bb"]
+
+
+def test_near_duplicates_are_dropped_keeping_the_first():
+    kept = drop_near_duplicates(
+        candidates("a", "a again", "b", "no vector"),
+        [[1.0, 0.0], [2.0, 0.01], [0.0, 1.0], None],
+        threshold=0.95,
+    )
+    assert [c["text"] for c in kept] == ["a", "b", "no vector"]
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.response_cache import (
+    SemanticResponseCache,
+    fingerprint_chunks,
+    fingerprint_conversation,
+)
+
+QUERY = np.array([1.0, 0.0, 0.0])
+SIMILAR = np.array([0.99, 0.05, 0.0])
+DIFFERENT = np.array([0.0, 1.0, 0.0])
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_SIMILARITY", 0.95)
+    return SemanticResponseCache()
+
+
+def test_fingerprint_ignores_chunk_order():
+    assert fingerprint_chunks(["a", "b"]) == fingerprint_chunks(["b", "a"])
+    assert fingerprint_chunks(["a"]) != fingerprint_chunks(["a", "b"])
+
+
+def test_fingerprint_covers_the_conversation_state():
+    turns = [
+        {"role": "user", "content": "compare the two plans"},
+        {"role": "assistant", "content": "..."},
+    ]
+    assert fingerprint_conversation("", []) == fingerprint_conversation(None, [])
+    assert fingerprint_conversation("", turns) == fingerprint_conversation("", turns)
+    assert fingerprint_conversation("", turns) != fingerprint_conversation("", [])
+    assert fingerprint_conversation("s", turns) != fingerprint_conversation("", turns)
+    assert fingerprint_conversation("", turns[:1]) != fingerprint_conversation(
+        "", [{"role": "assistant", "content": "compare the two plans"}]
+    )
+
+
+def test_similar_query_over_the_same_chunks_hits(cache):
+    cache.store("u1", QUERY * 3, "fp", "answer")
+    assert cache.lookup("u1", SIMILAR, "fp") == "answer"
+    assert cache.lookup("u1", DIFFERENT, "fp") is None
+    assert cache.lookup("u1", SIMILAR, "other chunks") is None
+    assert cache.lookup("u2", QUERY, "fp") is None
+
+
+def test_invalidation_drops_only_that_user(cache):
+    cache.store("u1", QUERY, "fp", "one")
+    cache.store("u2", QUERY, "fp", "two")
+    cache.invalidate_user("u1")
+    assert cache.lookup("u1", QUERY, "fp") is None
+    assert cache.lookup("u2", QUERY, "fp") == "two"
+
+
+def test_entries_expire(cache, monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_TTL_SECONDS", -1)
+    cache.store("u1", QUERY, "fp", "answer")
+    assert cache.lookup("u1", QUERY, "fp") is None
+
+
+def test_bounded_per_user_and_in_users(cache, monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_MAX_PER_USER", 2)
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_MAX_USERS", 2)
+    for fp in ("a", "b", "c"):
+        cache.store("u1", QUERY, fp, fp)
+    assert cache.lookup("u1", QUERY, "a") is None
+    assert cache.lookup("u1", QUERY, "c") == "c"
+    cache.store("u2", QUERY, "fp", "two")
+    cache.lookup("u1", QUERY, "c")
+    cache.store("u3", QUERY, "fp", "three")
+    assert cache.lookup("u2", QUERY, "fp") is None
+    assert cache.stats()["users"] == 2
+
+
+def test_disabled_cache_neither_stores_nor_hits(cache, monkeypatch):
+    cache.store("u1", QUERY, "fp", "answer")
+    monkeypatch.setattr(settings, "RESPONSE_CACHE_ENABLED", False)
+    assert cache.lookup("u1", QUERY, "fp") is None
+    cache.store("u2", QUERY, "fp", "answer")
+    assert cache.stats()["users"] == 1
+
+
+@pytest.mark.anyio
+async def test_replay_reassembles_the_answer():
+    answer = "Line one.\n\n  Two  words"
+    tokens = [token async for token in SemanticResponseCache.replay(answer)]
+    assert len(tokens) > 1
+    assert "".join(tokens) == answer
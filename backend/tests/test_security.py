@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app.api.endpoints import auth
+from app.core import security
+from app.core.config import settings
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def hasher(monkeypatch):
+    """A low cost factor, so the tests do not spend seconds in bcrypt."""
+    monkeypatch.setattr(
+        security,
+        "pwd_context",
+        CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=5),
+    )
+    monkeypatch.setattr(settings, "PASSWORD_HASH_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "PASSWORD_HASH_QUEUE_TIMEOUT", 0.05)
+    hasher = security.PasswordHasher()
+    monkeypatch.setattr(security, "password_hasher", hasher)
+    return hasher
+
+
+def login_form(password):
+    return SimpleNamespace(username="a@example.com", password=password)
+
+
+async def test_bcrypt_runs_on_its_own_threads(hasher):
+    name = await hasher._run(lambda: threading.current_thread().name)
+    assert name.startswith("bcrypt")
+    hashed = await hasher.hash("secret")
+    assert await hasher.verify_and_update("secret", hashed) == (True, None)
+    assert (await hasher.verify_and_update("wrong", hashed))[0] is False
+
+
+async def test_callers_beyond_the_queue_timeout_are_rejected(hasher):
+    release = threading.Event()
+    running = asyncio.ensure_future(hasher._run(release.wait, 5))
+    await asyncio.sleep(0.01)
+    with pytest.raises(security.PasswordHasherBusy):
+        await hasher.hash("secret")
+    assert hasher.rejected == 1
+    release.set()
+    await running
+    assert await hasher.hash("secret")
+
+
+async def test_busy_login_answers_503(db, hasher):
+    release = threading.Event()
+    running = asyncio.ensure_future(hasher._run(release.wait, 5))
+    hashed = security.pwd_context.hash("secret")
+    await db.users.insert_one({"email": "a@example.com", "hashed_password": hashed})
+    await asyncio.sleep(0.01)
+    with pytest.raises(HTTPException) as error:
+        await auth.login_access_token(db, login_form("secret"))
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "1"
+    release.set()
+    await running
+
+
+async def test_login_upgrades_hashes_with_an_outdated_cost(db, hasher):
+    old = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash("secret")
+    result = await db.users.insert_one(
+        {"email": "a@example.com", "full_name": "Ann", "hashed_password": old}
+    )
+    token = await auth.login_access_token(db, login_form("secret"))
+    assert token["token_type"] == "bearer"
+    user = await db.users.find_one({"_id": result.inserted_id})
+    assert user["hashed_password"] != old
+    assert user["hashed_password"].startswith("$2b$05$")
+
+    with pytest.raises(HTTPException) as error:
+        await auth.login_access_token(db, login_form("wrong"))
+    assert error.value.status_code == 400
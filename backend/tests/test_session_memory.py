@@ -0,0 +1,130 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.core.config import settings
+from app.services import session_memory
+from app.services.history_store import HistoryStore
+
+pytestmark = pytest.mark.anyio
+
+
+def timestamp(i):
+    return datetime(2026, 1, 1) + timedelta(seconds=i)
+
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    """Fake LLM; returns the prompts it was asked to summarize."""
+    prompts = []
+
+    async def generate_completion(model, prompt, max_tokens=None):
+        prompts.append(prompt)
+        return f" summary {len(prompts)} "
+
+    monkeypatch.setattr(settings, "SESSION_SUMMARY_TRIGGER_MESSAGES", 4)
+    monkeypatch.setattr(settings, "SESSION_RECENT_MESSAGES", 2)
+    monkeypatch.setattr(
+        session_memory.llm_gateway, "generate_completion", generate_completion
+    )
+    monkeypatch.setattr(session_memory, "history_store", HistoryStore())
+    return prompts
+
+
+async def make_session(db, messages):
+    session_id = ObjectId()
+    await db.chat_sessions.insert_one({"_id": session_id})
+    await db.chat_messages.insert_many(
+        [
+            {
+                "session_id": str(session_id),
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": f"m{i}",
+                "timestamp": timestamp(i),
+            }
+            for i in range(messages)
+        ]
+    )
+    return str(session_id)
+
+
+async def test_short_sessions_are_not_summarized(db, summarizer):
+    session_id = await make_session(db, 4)
+    await session_memory.maybe_summarize(session_id)
+    assert summarizer == []
+
+
+async def test_all_but_the_recent_messages_are_folded(db, summarizer):
+    session_id = await make_session(db, 7)
+    await session_memory.maybe_summarize(session_id)
+    assert len(summarizer) == 1
+    assert "m4" in summarizer[0] and "m5" not in summarizer[0]
+    session = await db.chat_sessions.find_one({"_id": ObjectId(session_id)})
+    assert session["summary"] == "summary 1"
+    assert session["summary_until"] == timestamp(4)
+
+    summary, recent = await session_memory.load_history(session_id)
+    assert summary == "summary 1"
+    assert [m["content"] for m in recent] == ["m5", "m6"]
+
+
+async def test_next_fold_extends_the_previous_summary(db, summarizer):
+    session_id = await make_session(db, 7)
+    await session_memory.maybe_summarize(session_id)
+    await db.chat_messages.insert_many(
+        [
+            {
+                "session_id": session_id,
+                "role": "user",
+                "content": f"m{i}",
+                "timestamp": timestamp(i),
+            }
+            for i in range(7, 10)
+        ]
+    )
+    await session_memory.maybe_summarize(session_id)
+    assert "summary 1" in summarizer[1]
+    assert "m4" not in summarizer[1] and "m7" in summarizer[1]
+
+
+async def test_concurrent_updates_of_one_session_run_once(db, summarizer):
+    session_id = await make_session(db, 7)
+    await asyncio.gather(
+        session_memory.maybe_summarize(session_id),
+        session_memory.maybe_summarize(session_id),
+    )
+    assert len(summarizer) == 1
+
+
+async def test_summary_moved_on_elsewhere_is_not_overwritten(
+    db, summarizer, monkeypatch
+):
+    session_id = await make_session(db, 7)
+    generate = session_memory.llm_gateway.generate_completion
+
+    async def slow_generate(*args, **kwargs):
+        # Another worker folds the session while this one waits on the LLM
+        await db.chat_sessions.update_one(
+            {"_id": ObjectId(session_id)},
+            {"$set": {"summary": "theirs", "summary_until": timestamp(4)}},
+        )
+        return await generate(*args, **kwargs)
+
+    monkeypatch.setattr(
+        session_memory.llm_gateway, "generate_completion", slow_generate
+    )
+    await session_memory.maybe_summarize(session_id)
+    session = await db.chat_sessions.find_one({"_id": ObjectId(session_id)})
+    assert session["summary"] == "theirs"
+
+
+async def test_summary_failures_are_contained(db, summarizer, monkeypatch):
+    async def broken(*args, **kwargs):
+        raise RuntimeError("LLM unavailable")
+
+    session_id = await make_session(db, 7)
+    monkeypatch.setattr(session_memory.llm_gateway, "generate_completion", broken)
+    await session_memory.maybe_summarize(session_id)
+    assert session_id not in session_memory._running
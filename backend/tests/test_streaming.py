@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.websockets.streaming import SlowConsumerError, TokenBatcher, WebSocketSender
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+        self.reading = asyncio.Event()
+        self.reading.set()
+        self.error = None
+
+    async def send_text(self, text):
+        await self.reading.wait()
+        if self.error is not None:
+            raise self.error
+        self.frames.append(json.loads(text))
+
+
+@pytest.fixture
+def websocket():
+    return FakeWebSocket()
+
+
+@pytest.fixture
+async def sender(websocket):
+    sender = WebSocketSender(websocket)
+    yield sender
+    sender.close()
+
+
+async def drained(sender):
+    while not sender.queue.empty():
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+
+
+async def test_tokens_within_the_window_share_one_frame(sender, monkeypatch):
+    monkeypatch.setattr(settings, "WS_TOKEN_FLUSH_MS", 20)
+    monkeypatch.setattr(settings, "WS_TOKEN_FLUSH_BYTES", 1000)
+    batcher = TokenBatcher(sender, {"turn_id": "t1"})
+    for token in ("Hel", "lo", " world"):
+        await batcher.add(token)
+    await asyncio.sleep(0.05)
+    await batcher.add("!")
+    await batcher.flush()
+    await drained(sender)
+    assert sender.websocket.frames == [
+        {"type": "chat_token", "token": "Hello world", "turn_id": "t1"},
+        {"type": "chat_token", "token": "!", "turn_id": "t1"},
+    ]
+
+
+async def test_byte_budget_flushes_immediately(sender, monkeypatch):
+    monkeypatch.setattr(settings, "WS_TOKEN_FLUSH_MS", 10000)
+    monkeypatch.setattr(settings, "WS_TOKEN_FLUSH_BYTES", 4)
+    batcher = TokenBatcher(sender)
+    for token in ("ab", "cd", "e"):
+        await batcher.add(token)
+    await drained(sender)
+    assert [frame["token"] for frame in sender.websocket.frames] == ["abcd"]
+    batcher.discard()
+    await batcher.flush()
+    await drained(sender)
+    assert len(sender.websocket.frames) == 1
+
+
+async def test_slow_consumer_is_given_up_on(websocket, monkeypatch):
+    monkeypatch.setattr(settings, "WS_SEND_QUEUE_SIZE", 1)
+    monkeypatch.setattr(settings, "WS_SLOW_CONSUMER_SECONDS", 0.02)
+    websocket.reading.clear()
+    sender = WebSocketSender(websocket)
+    await sender.send({"n": 1})  # Taken by the writer, which is now blocked
+    await asyncio.sleep(0)
+    await sender.send({"n": 2})  # Fills the queue
+    assert not sender.try_send({"n": 3})
+    with pytest.raises(SlowConsumerError):
+        await sender.send({"n": 3})
+    websocket.reading.set()
+    await drained(sender)
+    assert [frame["n"] for frame in websocket.frames] == [1, 2]
+    sender.close()
+
+
+async def test_failed_socket_closes_the_sender(sender):
+    sender.websocket.error = RuntimeError("disconnected")
+    await sender.send({"n": 1})
+    await drained(sender)
+    assert sender.closed
+    assert not sender.try_send({"n": 2})
+    with pytest.raises(ConnectionError):
+        await sender.send({"n": 2})
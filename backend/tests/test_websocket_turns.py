@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.api.endpoints import websockets
+from app.core.config import settings
+from app.core.security import create_access_token
+from app.websockets.connection_manager import manager
+
+
+async def fake_chat_stream(query, user_id, session_id):
+    if query == "slow":
+        while True:
+            yield "."
+            await asyncio.sleep(0.005)
+    yield f"answer to {query}"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "WS_TOKEN_FLUSH_MS", 0)
+    monkeypatch.setattr(websockets.chat_service, "chat_stream", fake_chat_stream)
+    app = FastAPI()
+    app.include_router(websockets.router)
+    with TestClient(app) as client:
+        yield client
+    assert manager.active_turns == {}
+
+
+def connect(client, user_id="u1"):
+    return client.websocket_connect(f"/ws?token={create_access_token(user_id)}")
+
+
+def chat(ws, request_id, text):
+    ws.send_json({"type": "chat_message", "request_id": request_id, "text": text})
+
+
+def receive_until(ws, frame_type, request_id):
+    """Frames received up to and including the first matching one."""
+    frames = []
+    while True:
+        frames.append(ws.receive_json())
+        if frames[-1]["type"] == frame_type:
+            if frames[-1].get("request_id") == request_id:
+                return frames
+
+
+def test_turns_stream_concurrently_and_cancel_alone(client):
+    with connect(client) as ws:
+        chat(ws, "r1", "slow")
+        receive_until(ws, "chat_token", "r1")
+        chat(ws, "r2", "fast")
+        frames = receive_until(ws, "chat_end", "r2")
+        r2 = [f for f in frames if f.get("request_id") == "r2"]
+        assert [f["type"] for f in r2] == ["chat_start", "chat_token", "chat_end"]
+        assert r2[1]["token"] == "answer to fast"
+        assert frames[-1]["cancelled"] is False
+
+        ws.send_json({"type": "cancel", "request_id": "r1"})
+        end = receive_until(ws, "chat_end", "r1")[-1]
+        assert end["cancelled"] is True
+        ws.send_json({"type": "ping"})
+        assert receive_until(ws, "pong", None)[-1] == {"type": "pong"}
+
+
+def test_turns_beyond_the_limit_are_refused(client, monkeypatch):
+    monkeypatch.setattr(settings, "WS_MAX_TURNS_PER_USER", 1)
+    with connect(client) as ws:
+        chat(ws, "r1", "slow")
+        receive_until(ws, "chat_start", "r1")
+        chat(ws, "r2", "fast")
+        error = receive_until(ws, "chat_error", "r2")[-1]
+        assert error["error"] == "Too many concurrent requests"
+    # Disconnecting cancelled the running turn and released its slot
+
+
+def test_invalid_token_is_rejected(client):
+    with pytest.raises(WebSocketDisconnect) as disconnect:
+        with client.websocket_connect("/ws?token=invalid") as ws:
+            ws.receive_json()
+    assert disconnect.value.code == 1008
@@ -32,7 +32,7 @@ import { Input } from 'antd';
 import type { UploadProps } from 'antd';
 import { useAuth } from '../../context/AuthContext';
 import { useWebSocket } from '../../context/WebSocketContext';
-import { apiFetch } from '../../lib/api';
+import { apiFetch, apiFetchPage, appendPage } from '../../lib/api';
 import ChatInterface from '../../components/dashboard/ChatInterface';
 import SettingsModal from '../../components/dashboard/SettingsModal';
 
@@ -45,6 +45,14 @@ interface Document {
     status: string;
 }
 
+// Normalize sessions (id vs _id) and filter out ghosts
+const normalizeSessions = (raw: any[]) => raw
+    .filter(s => (s.id || s._id) && (s.id !== 'undefined' && s._id !== 'undefined'))
+    .map(s => ({
+        ...s,
+        id: String(s.id || s._id) // Force to string
+    }));
+
 export default function Dashboard() {
     const { user, logout, isLoading, token } = useAuth();
     const router = useRouter();
@@ -52,7 +60,9 @@ export default function Dashboard() {
     const screens = useBreakpoint();
 
     const [documents, setDocuments] = useState<Document[]>([]);
+    const [documentsCursor, setDocumentsCursor] = useState<string | null>(null);
     const [sessions, setSessions] = useState<any[]>([]);
+    const [sessionsCursor, setSessionsCursor] = useState<string | null>(null);
     const [activeSessionId, setActiveSessionId] = useState<string | null>(() => {
         if (typeof window !== 'undefined') {
             return localStorage.getItem('last_active_session');
@@ -93,26 +103,22 @@ export default function Dashboard() {
     const fetchData = async () => {
         try {
             if (!token) return;
-            const [docs, chatSessionsRaw] = await Promise.all([
-                apiFetch<Document[]>('/ingestion/documents', { token }),
-                apiFetch<any[]>('/chats', { token })
+            // First pages only; the lists load more on demand
+            const [docsPage, sessionsPage] = await Promise.all([
+                apiFetchPage<Document>('/ingestion/documents', null, { token }),
+                apiFetchPage<any>('/chats', null, { token })
             ]);
-
-            // Normalize sessions (id vs _id) and filter out ghosts
-            const chatSessions = chatSessionsRaw
-                .filter(s => (s.id || s._id) && (s.id !== 'undefined' && s._id !== 'undefined'))
-                .map(s => ({
-                    ...s,
-                    id: String(s.id || s._id) // Force to string
-                }));
+            const chatSessions = normalizeSessions(sessionsPage.items);
 
             console.log('[Dashboard] Valid sessions found:', chatSessions.length);
             if (chatSessions.length > 0) {
                 console.log('[Dashboard] Top session ID:', chatSessions[0].id);
             }
 
-            setDocuments(docs);
+            setDocuments(docsPage.items);
+            setDocumentsCursor(docsPage.nextCursor);
             setSessions(chatSessions);
+            setSessionsCursor(sessionsPage.nextCursor);
 
             // Auto-create if zero sessions found
             if (chatSessions.length === 0 && !initializationStarted.current) {
@@ -141,6 +147,28 @@ export default function Dashboard() {
         if (token) fetchData();
     }, [token]);
 
+    const loadMoreSessions = async () => {
+        if (!token || !sessionsCursor) return;
+        try {
+            const page = await apiFetchPage<any>('/chats', sessionsCursor, { token });
+            setSessions(prev => appendPage(prev, normalizeSessions(page.items)));
+            setSessionsCursor(page.nextCursor);
+        } catch (e) {
+            console.error('Failed to load more sessions', e);
+        }
+    };
+
+    const loadMoreDocuments = async () => {
+        if (!token || !documentsCursor) return;
+        try {
+            const page = await apiFetchPage<Document>('/ingestion/documents', documentsCursor, { token });
+            setDocuments(prev => appendPage(prev, page.items));
+            setDocumentsCursor(page.nextCursor);
+        } catch (e) {
+            console.error('Failed to load more documents', e);
+        }
+    };
+
     const handleNewChat = async () => {
         try {
             console.log('[Dashboard] Creating new chat session...');
@@ -279,6 +307,11 @@ export default function Dashboard() {
                             </Popconfirm>
                         </div>
                     ))}
+                    {sessionsCursor && (
+                        <Button type="text" size="small" onClick={loadMoreSessions} style={{ color: 'rgba(255,255,255,0.5)' }}>
+                            Load more
+                        </Button>
+                    )}
                 </div>
             </div>
 
@@ -340,6 +373,11 @@ export default function Dashboard() {
                             </Popconfirm>
                         </div>
                     ))}
+                    {documentsCursor && (
+                        <Button type="text" size="small" onClick={loadMoreDocuments} style={{ color: 'rgba(255,255,255,0.5)' }}>
+                            Load more
+                        </Button>
+                    )}
                 </div>
             </div>
         </div>
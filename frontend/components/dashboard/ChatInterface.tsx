@@ -5,7 +5,7 @@ import { Input, Button, List, Typography, Grid, theme, Avatar, Space, Badge, Too
 import { SendOutlined, AudioOutlined, UserOutlined, RobotOutlined, StopOutlined, SoundOutlined, LoadingOutlined, HistoryOutlined, PlusOutlined, CopyOutlined, LikeOutlined, DislikeOutlined, DownloadOutlined, CheckOutlined } from '@ant-design/icons';
 import { useSettings } from '../../context/SettingsContext';
 import { useWebSocket } from '../../context/WebSocketContext';
-import { apiFetch } from '../../lib/api';
+import { apiFetchPage } from '../../lib/api';
 import { useAuth } from '../../context/AuthContext';
 
 const { TextArea } = Input;
@@ -18,6 +18,12 @@ interface Message {
     content: string;
 }
 
+// History pages come newest first (order=desc); the view shows them oldest first
+const toMessages = (history: any[]): Message[] => [...history].reverse().map(m => ({
+    role: m.role,
+    content: m.content
+}));
+
 export interface ChatInterfaceProps {
     sessionId: string | null;
     onShowHistory?: () => void;
@@ -27,6 +33,7 @@ export interface ChatInterfaceProps {
 
 export default function ChatInterface({ sessionId, onShowHistory, onCreateNew, onChatComplete }: ChatInterfaceProps) {
     const [messages, setMessages] = useState<Message[]>([]);
+    const [earlierCursor, setEarlierCursor] = useState<string | null>(null);
     const [input, setInput] = useState('');
     const [isLoading, setIsLoading] = useState(false);
     const [isSpeaking, setIsSpeaking] = useState(false);
@@ -45,6 +52,8 @@ export default function ChatInterface({ sessionId, onShowHistory, onCreateNew, o
     const recognitionRef = useRef<any>(null);
     const accumulatedResponse = useRef('');
     const scrollAnchorRef = useRef<HTMLDivElement>(null);
+    const messageAreaRef = useRef<HTMLDivElement>(null);
+    const heightBeforePrepend = useRef<number | null>(null);
 
     // Auto-scroll to bottom
     const scrollToBottom = () => {
@@ -52,6 +61,13 @@ export default function ChatInterface({ sessionId, onShowHistory, onCreateNew, o
     };
 
     useEffect(() => {
+        const area = messageAreaRef.current;
+        if (area && heightBeforePrepend.current !== null) {
+            // Earlier messages were prepended: keep the visible ones in place
+            area.scrollTop += area.scrollHeight - heightBeforePrepend.current;
+            heightBeforePrepend.current = null;
+            return;
+        }
         scrollToBottom();
     }, [messages]);
 
@@ -62,17 +78,16 @@ export default function ChatInterface({ sessionId, onShowHistory, onCreateNew, o
     // Fetch history
     useEffect(() => {
         const fetchHistory = async () => {
+            setEarlierCursor(null);
             if (!sessionId || sessionId === 'undefined' || !token) {
                 setMessages([]);
                 return;
             }
             try {
                 setIsLoading(true);
-                const history = await apiFetch<any[]>(`/chats/${sessionId}/history`, { token });
-                setMessages(history.map(m => ({
-                    role: m.role,
-                    content: m.content
-                })));
+                const page = await apiFetchPage<any>(`/chats/${sessionId}/history?order=desc`, null, { token });
+                setMessages(toMessages(page.items));
+                setEarlierCursor(page.nextCursor);
             } catch (e) {
                 console.error('Failed to load history', e);
             } finally {
@@ -82,6 +97,23 @@ export default function ChatInterface({ sessionId, onShowHistory, onCreateNew, o
         fetchHistory();
     }, [sessionId, token]);
 
+    const loadEarlierMessages = async () => {
+        if (!sessionId || !token || !earlierCursor) return;
+        try {
+            const page = await apiFetchPage<any>(`/chats/${sessionId}/history?order=desc`, earlierCursor, { token });
+            const earlier = toMessages(page.items);
+            heightBeforePrepend.current = messageAreaRef.current?.scrollHeight ?? null;
+            // Reactions are kept by message index
+            setReactions(prev => Object.fromEntries(
+                Object.entries(prev).map(([idx, reaction]) => [Number(idx) + earlier.length, reaction])
+            ));
+            setMessages(prev => [...earlier, ...prev]);
+            setEarlierCursor(page.nextCursor);
+        } catch (e) {
+            console.error('Failed to load earlier messages', e);
+        }
+    };
+
     useEffect(() => {
         if (typeof window !== 'undefined' && window.speechSynthesis) {
             synthesisRef.current = window.speechSynthesis;
@@ -245,7 +277,7 @@ export default function ChatInterface({ sessionId, onShowHistory, onCreateNew, o
     return (
         <div style={{ display: 'flex', flexDirection: 'column', height: '100%', position: 'relative' }}>
             {/* Message Area */}
-            <div style={{
+            <div ref={messageAreaRef} style={{
                 flex: 1,
                 overflowY: 'auto',
                 paddingBottom: isMobile ? 120 : 100,
@@ -281,6 +313,13 @@ export default function ChatInterface({ sessionId, onShowHistory, onCreateNew, o
                     </div>
                 ) : (
                     <div style={{ padding: '0 24px' }}>
+                        {earlierCursor && (
+                            <div style={{ textAlign: 'center', marginBottom: 24 }}>
+                                <Button type="text" size="small" onClick={loadEarlierMessages} style={{ color: 'rgba(255,255,255,0.5)' }}>
+                                    Load earlier messages
+                                </Button>
+                            </div>
+                        )}
                         {messages.map((msg, idx) => (
                             <div
                                 key={idx}
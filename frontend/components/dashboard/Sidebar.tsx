@@ -1,7 +1,7 @@
 'use client';
 
-import React, { useEffect, useState } from 'react';
-import { apiFetch } from '../../lib/api';
+import React, { useEffect, useRef, useState } from 'react';
+import { apiFetchPage, appendPage } from '../../lib/api';
 import { useAuth } from '../../context/AuthContext';
 import { useWebSocket } from '../../context/WebSocketContext';
 import { Button } from 'antd'; // Using AntD Button now since we switched
@@ -18,7 +18,9 @@ export const Sidebar = () => {
     const { token, logout } = useAuth();
     const { lastMessage, isConnected } = useWebSocket();
     const [documents, setDocuments] = useState<Document[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [isUploading, setIsUploading] = useState(false);
+    const loadingMore = useRef(false);
 
     useEffect(() => {
         if (token) {
@@ -44,13 +46,36 @@ export const Sidebar = () => {
     const fetchDocuments = async () => {
         try {
             if (!token) return;
-            const docs = await apiFetch<Document[]>('/ingestion/documents', { token });
-            setDocuments(docs);
+            const page = await apiFetchPage<Document>('/ingestion/documents', null, { token });
+            setDocuments(page.items);
+            setNextCursor(page.nextCursor);
         } catch (error) {
             console.error('Failed to fetch docs', error);
         }
     };
 
+    // Further pages are loaded as the list is scrolled to its end
+    const fetchMoreDocuments = async () => {
+        if (!token || !nextCursor || loadingMore.current) return;
+        loadingMore.current = true;
+        try {
+            const page = await apiFetchPage<Document>('/ingestion/documents', nextCursor, { token });
+            setDocuments(prev => appendPage(prev, page.items));
+            setNextCursor(page.nextCursor);
+        } catch (error) {
+            console.error('Failed to fetch more docs', error);
+        } finally {
+            loadingMore.current = false;
+        }
+    };
+
+    const handleListScroll = (e: React.UIEvent<HTMLDivElement>) => {
+        const list = e.currentTarget;
+        if (list.scrollHeight - list.scrollTop - list.clientHeight < 100) {
+            fetchMoreDocuments();
+        }
+    };
+
     const handleFileUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
         if (!e.target.files?.length || !token) return;
 
@@ -107,7 +132,7 @@ export const Sidebar = () => {
                 </label>
             </div>
 
-            <div className="flex-1 overflow-y-auto px-2 space-y-1">
+            <div className="flex-1 overflow-y-auto px-2 space-y-1" onScroll={handleListScroll}>
                 {documents.map((doc) => (
                     <div key={doc.id} className="flex items-center p-2 rounded hover:bg-gray-800 text-sm group">
                         <FileTextOutlined className="mr-2 text-gray-400" />
@@ -122,6 +147,14 @@ export const Sidebar = () => {
                         </div>
                     </div>
                 ))}
+                {nextCursor && (
+                    <button
+                        className="w-full p-2 text-xs text-gray-400 hover:text-gray-200"
+                        onClick={fetchMoreDocuments}
+                    >
+                        Load more
+                    </button>
+                )}
             </div>
 
             <div className="p-4 border-t border-gray-800">
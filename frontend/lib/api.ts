@@ -4,7 +4,7 @@ interface FetchOptions extends RequestInit {
     token?: string;
 }
 
-export async function apiFetch<T>(endpoint: string, options: FetchOptions = {}): Promise<T> {
+async function apiRequest(endpoint: string, options: FetchOptions = {}): Promise<Response> {
     const { token, ...fetchOptions } = options;
     const headers: HeadersInit = {
         'Content-Type': 'application/json',
@@ -55,5 +55,29 @@ export async function apiFetch<T>(endpoint: string, options: FetchOptions = {}):
         throw new Error(errorData.detail || 'API request failed');
     }
 
+    return res;
+}
+
+export async function apiFetch<T>(endpoint: string, options: FetchOptions = {}): Promise<T> {
+    const res = await apiRequest(endpoint, options);
     return res.json();
 }
+
+export interface Page<T> {
+    items: T[];
+    nextCursor: string | null;
+}
+
+// List endpoints are paginated: pass a page's nextCursor to get the one after it
+export async function apiFetchPage<T>(endpoint: string, cursor: string | null = null, options: FetchOptions = {}): Promise<Page<T>> {
+    const separator = endpoint.includes('?') ? '&' : '?';
+    const page = cursor ? `${endpoint}${separator}cursor=${encodeURIComponent(cursor)}` : endpoint;
+    const res = await apiRequest(page, options);
+    return { items: await res.json(), nextCursor: res.headers.get('X-Next-Cursor') };
+}
+
+// Items of a further page that are not already listed (entries can move between pages)
+export function appendPage<T extends { id: string }>(items: T[], more: T[]): T[] {
+    const seen = new Set(items.map(item => item.id));
+    return [...items, ...more.filter(item => !seen.has(item.id))];
+}